@@ -1,7 +1,7 @@
 # menu/admin.py
 
 from django.contrib import admin
-from .models import Category, MenuItem, MenuItemVariant, Bill, OrderItem, FoodType, Cuisine
+from .models import Category, MenuItem, MenuItemVariant, Bill, OrderItem, FoodType, Cuisine, OutboxEvent
 
 @admin.register(FoodType)
 class FoodTypeAdmin(admin.ModelAdmin):
@@ -46,7 +46,7 @@ class CategoryAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ('variant', 'quantity', 'status')
+    readonly_fields = ('variant', 'item_name', 'variant_name', 'unit_price', 'quantity', 'status')
     def has_delete_permission(self, request, obj=None):
         return False
 
@@ -61,3 +61,8 @@ class BillAdmin(admin.ModelAdmin):
             return qs
         return qs.filter(restaurant=request.user.restaurant)
 
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'message_type', 'group', 'attempts', 'created_at', 'dispatched_at')
+    list_filter = ('message_type', 'dispatched_at')
+    readonly_fields = ('group', 'message_type', 'data', 'attempts', 'last_error', 'available_at', 'dispatched_at', 'created_at')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MenuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'menu'
+
+    def ready(self):
+        # Connect the signal handlers: public menu cache, bill totals and the shards' copies
+        from . import signals  # noqa: F401
@@ -0,0 +1,402 @@
+# menu/archive.py
+"""
+Columnar archive of paid bills.
+
+Paid bills never change again, so once they are older than the retention
+window `archive_paid_bills` moves them out of the live tables into one
+directory per restaurant and month of business days:
+
+    ORDER_ARCHIVE_DIR/<restaurant id>/<YYYY-MM>/bills.<column>.npy
+                                               /items.<column>.npy
+
+Each column is a plain NumPy array, read back memory-mapped. Money is
+stored in paise, times in microseconds since the epoch, choices as small
+integer codes. Item and variant names are dictionary-encoded: a codes
+column plus a `.values` array of the distinct names.
+
+Readers get archived bills back as unsaved Bill instances with their items
+prefetched, so serializers and exports treat them like live rows.
+"""
+
+import heapq
+import os
+import shutil
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Prefetch
+
+from . import sharding
+from .models import Bill, OrderItem
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Stored as their index in these lists
+PAYMENT_METHODS = [None] + list(Bill.PaymentMethod.values)
+ITEM_STATUSES = list(OrderItem.OrderStatus.values)
+
+# Columns that are stored as codes into a table of distinct values
+DICTIONARY_COLUMNS = {'item_name', 'variant_name'}
+
+# Bills deleted from the live tables per query once archived
+DELETE_BATCH_SIZE = 500
+
+
+def restaurant_dir(restaurant_id):
+    return Path(settings.ORDER_ARCHIVE_DIR) / str(restaurant_id)
+
+
+def _micros(moment):
+    return (moment - EPOCH) // ONE_MICROSECOND
+
+
+def _moment(micros):
+    return EPOCH + timedelta(microseconds=int(micros))
+
+
+def _paise(amount):
+    return int(amount * 100)
+
+
+def _rupees(paise):
+    return Decimal(int(paise)).scaleb(-2)
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+# Writing
+
+def archive_paid_bills(restaurant, before):
+    """
+    Moves the restaurant's paid bills with a business day before `before`
+    (a date) into the archive and deletes them, with their items, from the
+    live tables. Returns the number of bills archived.
+    """
+    _recover(restaurant.id)
+    with sharding.for_restaurant(restaurant):
+        paid = Bill.objects.filter(
+            restaurant=restaurant, payment_status=Bill.PaymentStatus.PAID, business_date__lt=before
+        )
+        archived = 0
+        for month in paid.dates('business_date', 'month'):
+            bills = list(
+                paid.filter(business_date__gte=month, business_date__lt=_next_month(month))
+                .order_by('id')
+                .prefetch_related(Prefetch('order_items', queryset=OrderItem.objects.select_related('variant')))
+            )
+            _write_month(restaurant.id, month, bills)
+            # The files are in place before the rows go. If the delete fails, the
+            # next run archives the same bills again and replaces their rows.
+            bill_ids = [bill.id for bill in bills]
+            with sharding.atomic():
+                for start in range(0, len(bill_ids), DELETE_BATCH_SIZE):
+                    Bill.objects.filter(pk__in=bill_ids[start:start + DELETE_BATCH_SIZE]).delete()
+            archived += len(bills)
+        return archived
+
+
+def _columns(bills):
+    bill_columns = {
+        'id': [], 'business_date': [], 'created_at': [], 'payment_method': [],
+        'subtotal': [], 'item_count': [], 'customer_name': [], 'table_number': [],
+    }
+    item_columns = {
+        'id': [], 'bill_id': [], 'variant_id': [], 'quantity': [], 'status': [], 'unit_price': [],
+        'business_date': [], 'created_at': [], 'item_name': [], 'variant_name': [],
+    }
+    for bill in bills:
+        bill_columns['id'].append(bill.id)
+        bill_columns['business_date'].append(bill.business_date)
+        bill_columns['created_at'].append(_micros(bill.created_at))
+        bill_columns['payment_method'].append(PAYMENT_METHODS.index(bill.payment_method))
+        bill_columns['subtotal'].append(_paise(bill.subtotal))
+        bill_columns['item_count'].append(bill.item_count)
+        bill_columns['customer_name'].append(bill.customer_name)
+        bill_columns['table_number'].append(bill.table_number)
+        for item in bill.order_items.all():
+            # Items from before the price snapshot may not have been backfilled
+            unit_price = item.unit_price if item.unit_price is not None else item.variant.price
+            item_columns['id'].append(item.id)
+            item_columns['bill_id'].append(item.bill_id)
+            item_columns['variant_id'].append(item.variant_id)
+            item_columns['quantity'].append(item.quantity)
+            item_columns['status'].append(ITEM_STATUSES.index(item.status))
+            item_columns['unit_price'].append(_paise(unit_price))
+            item_columns['business_date'].append(item.business_date)
+            item_columns['created_at'].append(_micros(item.created_at))
+            item_columns['item_name'].append(item.item_name or item.variant.menu_item.name)
+            item_columns['variant_name'].append(item.variant_name or item.variant.variant_name)
+    return bill_columns, item_columns
+
+
+def _as_arrays(columns):
+    import numpy as np
+
+    dtypes = {
+        'id': np.int64, 'bill_id': np.int64, 'variant_id': np.int64, 'created_at': np.int64,
+        'business_date': 'datetime64[D]', 'payment_method': np.int8, 'status': np.int8,
+        'subtotal': np.int64, 'unit_price': np.int64, 'item_count': np.int32, 'quantity': np.int32,
+    }
+    # Strings get a fixed-width unicode dtype, so no pickling is needed to load them
+    return {name: np.array(values, dtype=dtypes.get(name, str)) for name, values in columns.items()}
+
+
+def _write_month(restaurant_id, month, bills):
+    import numpy as np
+
+    bill_columns, item_columns = (_as_arrays(columns) for columns in _columns(bills))
+    month_dir = restaurant_dir(restaurant_id) / month.strftime('%Y-%m')
+
+    if month_dir.exists():
+        # Add to what is already archived for the month, replacing any bills
+        # archived before whose delete did not go through
+        old_bills, old_items = _read(month_dir, 'bills'), _read(month_dir, 'items')
+        keep = ~np.isin(old_bills['id'], bill_columns['id'])
+        keep_items = ~np.isin(old_items['bill_id'], bill_columns['id'])
+        bill_columns = {
+            name: np.concatenate([_decoded(old_bills, name)[keep], values]) for name, values in bill_columns.items()
+        }
+        item_columns = {
+            name: np.concatenate([_decoded(old_items, name)[keep_items], values]) for name, values in item_columns.items()
+        }
+
+    # Bills by (created_at, id), the order readers want; items grouped by bill
+    bill_order = np.lexsort((bill_columns['id'], bill_columns['created_at']))
+    item_order = np.lexsort((item_columns['id'], item_columns['bill_id']))
+
+    # Write a fresh copy next to the month and swap it in, so readers never see half a month
+    staging = month_dir.with_name(month_dir.name + '.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    for prefix, columns, order in (('bills', bill_columns, bill_order), ('items', item_columns, item_order)):
+        for name, values in columns.items():
+            values = values[order]
+            if name in DICTIONARY_COLUMNS:
+                distinct, codes = np.unique(values, return_inverse=True)
+                np.save(staging / f'{prefix}.{name}.values.npy', distinct)
+                values = codes.astype(np.int32)
+            np.save(staging / f'{prefix}.{name}.npy', values)
+
+    retired = month_dir.with_name(month_dir.name + '.old')
+    if month_dir.exists():
+        os.replace(month_dir, retired)
+    os.replace(staging, month_dir)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def _recover(restaurant_id):
+    """
+    Cleans up after a _write_month that was cut short. A month left only as
+    <month>.old (stopped between the two renames) is put back; the bills it
+    was adding are still in the live tables and get archived again. Other
+    leftover .old and .tmp copies are removed.
+    """
+    directory = restaurant_dir(restaurant_id)
+    if not directory.is_dir():
+        return
+    for path in sorted(directory.iterdir()):
+        month, _, suffix = path.name.partition('.')
+        if suffix == 'old' and not (directory / month).exists():
+            os.replace(path, directory / month)
+        elif suffix in ('old', 'tmp'):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Reading
+
+def _read(month_dir, prefix):
+    import numpy as np
+
+    columns = {}
+    for path in month_dir.glob(f'{prefix}.*.npy'):
+        name = path.name[len(prefix) + 1:-len('.npy')]
+        if not name.endswith('.values'):
+            columns[name] = np.load(path, mmap_mode='r')
+    for name in DICTIONARY_COLUMNS & columns.keys():
+        columns[name + '.values'] = np.load(month_dir / f'{prefix}.{name}.values.npy')
+    return columns
+
+
+def _decoded(columns, name):
+    if name in DICTIONARY_COLUMNS:
+        return columns[name + '.values'][columns[name]]
+    return columns[name]
+
+
+def _months(restaurant_id, since=None, descending=True):
+    directory = restaurant_dir(restaurant_id)
+    if not directory.is_dir():
+        return []
+    months = {}
+    for path in directory.iterdir():
+        month, _, suffix = path.name.partition('.')
+        # A month whose swap was cut short is read from <month>.old until _recover puts it back
+        if path.is_dir() and (suffix == '' or (suffix == 'old' and month not in months)):
+            months[month] = path
+    if since is not None:
+        months = {month: path for month, path in months.items() if month >= since.strftime('%Y-%m')}
+    return [months[month] for month in sorted(months, reverse=descending)]
+
+
+def bills(restaurant_id, since=None, after=None, descending=True):
+    """
+    Yields the restaurant's archived bills as unsaved Bill instances with
+    their order items prefetched, ordered by (created_at, id), newest first
+    unless `descending` is False. `since` keeps bills from that business day
+    on; `after` is a (created_at, id) keyset position to continue from.
+    """
+    for month_dir in _months(restaurant_id, since, descending):
+        yield from _month_bills(restaurant_id, month_dir, since, after, descending)
+
+
+def _month_bills(restaurant_id, month_dir, since, after, descending):
+    import numpy as np
+
+    columns = _read(month_dir, 'bills')
+    created_at, ids = columns['created_at'], columns['id']
+    wanted = np.ones(len(ids), dtype=bool)
+    if since is not None:
+        wanted &= columns['business_date'] >= np.datetime64(since, 'D')
+    if after is not None:
+        position, pk = _micros(after[0]), after[1]
+        if descending:
+            wanted &= (created_at < position) | ((created_at == position) & (ids < pk))
+        else:
+            wanted &= (created_at > position) | ((created_at == position) & (ids > pk))
+    rows = np.flatnonzero(wanted)  # already in (created_at, id) order
+    if descending:
+        rows = rows[::-1]
+    if not len(rows):
+        return
+
+    items = _read(month_dir, 'items')
+    item_bill_ids = items['bill_id']
+    item_names, variant_names = _decoded(items, 'item_name'), _decoded(items, 'variant_name')
+    for row in rows:
+        bill = Bill(
+            id=int(ids[row]),
+            restaurant_id=restaurant_id,
+            customer_name=str(columns['customer_name'][row]),
+            table_number=str(columns['table_number'][row]),
+            payment_status=Bill.PaymentStatus.PAID,
+            payment_method=PAYMENT_METHODS[columns['payment_method'][row]],
+            subtotal=_rupees(columns['subtotal'][row]),
+            item_count=int(columns['item_count'][row]),
+            open_item_count=0,
+            business_date=columns['business_date'][row].item(),
+            created_at=_moment(created_at[row]),
+            updated_at=_moment(created_at[row]),
+        )
+        first, last = np.searchsorted(item_bill_ids, [bill.id, bill.id + 1])
+        order_items = [
+            OrderItem(
+                id=int(items['id'][index]),
+                bill=bill,
+                variant_id=int(items['variant_id'][index]),
+                quantity=int(items['quantity'][index]),
+                status=ITEM_STATUSES[items['status'][index]],
+                unit_price=_rupees(items['unit_price'][index]),
+                item_name=str(item_names[index]),
+                variant_name=str(variant_names[index]),
+                business_date=items['business_date'][index].item(),
+                created_at=_moment(items['created_at'][index]),
+                updated_at=_moment(items['created_at'][index]),
+            )
+            for index in range(first, last)
+        ]
+        # What prefetch_related would have left behind
+        prefetched = OrderItem.objects.none()
+        prefetched._result_cache = order_items
+        prefetched._prefetch_done = True
+        bill._prefetched_objects_cache = {'order_items': prefetched}
+        yield bill
+
+
+def merge(sources, descending=True):
+    """
+    Merges iterables of bills that are each ordered by (created_at, id),
+    e.g. a live queryset and bills() over the same period.
+    """
+    return heapq.merge(*sources, key=lambda bill: (bill.created_at, bill.pk), reverse=descending)
+
+
+def paid_item_totals(restaurant_id, since=None):
+    """
+    The archive's side of sales._paid_item_totals() for one restaurant:
+    quantity and revenue of the non-declined items per (business day,
+    variant), with the names of the most recent item. Aggregated with NumPy
+    one month at a time.
+    """
+    import numpy as np
+
+    declined = ITEM_STATUSES.index(OrderItem.OrderStatus.DECLINED)
+    totals = {}
+    # Months are by the bill's business day; a reorder can fall on a later day,
+    # so the month before `since` may still hold items from `since` on
+    first_month = _month_start(since) - timedelta(days=1) if since is not None else None
+    for month_dir in _months(restaurant_id, first_month):
+        items = _read(month_dir, 'items')
+        wanted = items['status'] != declined
+        if since is not None:
+            wanted &= items['business_date'] >= np.datetime64(since, 'D')
+        rows = np.flatnonzero(wanted)
+        if not len(rows):
+            continue
+
+        days = items['business_date'][rows].astype(np.int64)
+        variants = items['variant_id'][rows]
+        keys, group = np.unique(np.stack([days, variants], axis=1), axis=0, return_inverse=True)
+        group = group.reshape(-1)
+        quantity = items['quantity'][rows].astype(np.int64)
+        quantities = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(quantities, group, quantity)
+        revenues = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(revenues, group, quantity * items['unit_price'][rows])
+        item_ids = items['id'][rows]
+        latest_ids = np.full(len(keys), -1, dtype=np.int64)
+        np.maximum.at(latest_ids, group, item_ids)
+        # The row holding each group's most recent item, for its names
+        is_latest = item_ids == latest_ids[group]
+        latest_rows, latest_groups = rows[is_latest], group[is_latest]
+
+        item_names, variant_names = items['item_name.values'], items['variant_name.values']
+        for key_index, row in zip(latest_groups, latest_rows):
+            day, variant_id = keys[key_index]
+            key = (date(1970, 1, 1) + timedelta(days=int(day)), int(variant_id))
+            latest_id = int(latest_ids[key_index])
+            current = totals.get(key)
+            entry = {
+                'bill__restaurant_id': restaurant_id,
+                'business_date': key[0],
+                'variant_id': key[1],
+                'total_quantity': int(quantities[key_index]),
+                'total_revenue': _rupees(revenues[key_index]),
+                'latest_item_id': latest_id,
+                'item_name': str(item_names[items['item_name'][row]]),
+                'variant_name': str(variant_names[items['variant_name'][row]]),
+            }
+            if current is not None:
+                # A business day can straddle two month files only through reorders
+                entry['total_quantity'] += current['total_quantity']
+                entry['total_revenue'] += current['total_revenue']
+                if current['latest_item_id'] > latest_id:
+                    for name in ('latest_item_id', 'item_name', 'variant_name'):
+                        entry[name] = current[name]
+            totals[key] = entry
+    return list(totals.values())
+
+
+def restaurant_ids():
+    directory = Path(settings.ORDER_ARCHIVE_DIR)
+    if not directory.is_dir():
+        return []
+    return sorted(int(path.name) for path in directory.iterdir() if path.is_dir() and path.name.isdigit())
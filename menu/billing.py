@@ -0,0 +1,140 @@
+# menu/billing.py
+
+from decimal import Decimal
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Bill, OrderItem
+
+# Items the kitchen still has to deal with
+OPEN_STATUSES = (OrderItem.OrderStatus.PENDING, OrderItem.OrderStatus.ACCEPTED)
+
+
+def counts_towards_total(status):
+    # Declined items are not charged
+    return status != OrderItem.OrderStatus.DECLINED
+
+
+def is_open(status):
+    return status in OPEN_STATUSES
+
+
+def unit_price(order_item):
+    # Rows created before the price snapshot existed may not be backfilled yet
+    return order_item.unit_price if order_item.unit_price is not None else order_item.variant.price
+
+
+def line_total(order_item):
+    return unit_price(order_item) * order_item.quantity
+
+
+def _adjust(bill_id, amount=0, quantity=0, open_items=0):
+    changes = {}
+    if amount or quantity:
+        changes['subtotal'] = F('subtotal') + amount
+        changes['item_count'] = F('item_count') + quantity
+    if open_items:
+        changes['open_item_count'] = F('open_item_count') + open_items
+    if changes:
+        # A restaurant move copies the bills changed since its last pass
+        Bill.objects.filter(pk=bill_id).update(**changes, updated_at=timezone.now())
+
+
+def items_added(bill, order_items):
+    """
+    Adds newly created order items (built with OrderItem.from_variant)
+    to their bill's running totals.
+    """
+    amount = Decimal('0')
+    quantity = 0
+    open_items = 0
+    for order_item in order_items:
+        if counts_towards_total(order_item.status):
+            amount += line_total(order_item)
+            quantity += order_item.quantity
+        if is_open(order_item.status):
+            open_items += 1
+    _adjust(bill.pk, amount, quantity, open_items)
+
+
+def statuses_changed(changes):
+    """
+    Updates the bill counters after a set of order items changed status.
+    `changes` is a list of (order_item, old_status) pairs; the items already
+    carry their new status. Each affected bill is updated with one query.
+
+    Returns the ids of the bills whose last open item was just closed, i.e.
+    the bills that have become ready for payment. The counters are changed
+    in the database, so of two concurrent updates only the one that reaches
+    zero reports the bill.
+    """
+    deltas = {}
+    for order_item, old_status in changes:
+        amount, quantity, open_items = deltas.get(order_item.bill_id, (0, 0, 0))
+        was_counted = counts_towards_total(old_status)
+        is_counted = counts_towards_total(order_item.status)
+        if was_counted != is_counted:
+            sign = 1 if is_counted else -1
+            amount += sign * line_total(order_item)
+            quantity += sign * order_item.quantity
+        open_items += int(is_open(order_item.status)) - int(is_open(old_status))
+        deltas[order_item.bill_id] = (amount, quantity, open_items)
+
+    for bill_id, (amount, quantity, open_items) in deltas.items():
+        _adjust(bill_id, amount, quantity, open_items)
+
+    closed = [bill_id for bill_id, (_, _, open_items) in deltas.items() if open_items < 0]
+    if not closed:
+        return set()
+    # A bill where everything was declined has nothing to pay for
+    return set(Bill.objects.filter(
+        pk__in=closed, open_item_count=0, item_count__gt=0
+    ).values_list('pk', flat=True))
+
+
+def status_changed(order_item, old_status):
+    """
+    Single-item version of statuses_changed(). Returns True if the item's
+    bill has just become ready for payment.
+    """
+    return order_item.bill_id in statuses_changed([(order_item, old_status)])
+
+
+def item_removed(order_item):
+    """
+    Takes a deleted order item back out of its bill's counters.
+    """
+    # Declined items are neither charged nor open
+    if counts_towards_total(order_item.status):
+        _adjust(order_item.bill_id, -line_total(order_item), -order_item.quantity, -int(is_open(order_item.status)))
+
+
+def cashier_messages(bill_ids):
+    """
+    Builds the 'order ready for payment' messages for the given bills with a
+    single query. Returns a list of (restaurant_slug, message) pairs.
+    """
+    order_items = (
+        OrderItem.objects.filter(bill_id__in=bill_ids)
+        .exclude(status=OrderItem.OrderStatus.DECLINED)
+        .select_related('bill__restaurant', 'variant__menu_item')
+        .order_by('bill_id', 'id')
+    )
+    messages = {}
+    for item in order_items:
+        bill = item.bill
+        if bill.id not in messages:
+            messages[bill.id] = (bill.restaurant.slug, {
+                'id': bill.id,
+                'table_number': bill.table_number,
+                'totalAmount': float(bill.subtotal),
+                'items': []
+            })
+        messages[bill.id][1]['items'].append({
+            'name': item.item_name or item.variant.menu_item.name,
+            'variant_name': item.variant_name or item.variant.variant_name,
+            'quantity': item.quantity,
+            'price': float(unit_price(item))
+        })
+    return list(messages.values())
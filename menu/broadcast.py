@@ -0,0 +1,144 @@
+# menu/broadcast.py
+
+import asyncio
+import json
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+
+def encode_message(message_type, data):
+    """
+    Builds a channel-layer message whose payload is already JSON text, so
+    that consumers can forward it to every socket without encoding it again:
+
+        {'type': <message_type>, 'text': '<data as JSON>'}
+
+    A kitchen sequence number in the data is copied alongside, so consumers
+    can check it without decoding the text.
+    """
+    message = {'type': message_type, 'text': json.dumps(data)}
+    if isinstance(data, dict) and 'seq' in data:
+        message['seq'] = data['seq']
+    return message
+
+
+class BroadcastStats:
+    """
+    Counters describing how well messages are being coalesced.
+    """
+    # Upper bounds of the batch size histogram buckets
+    BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.events = 0
+        self.max_batch_size = 0
+        self.histogram = {bucket: 0 for bucket in self.BUCKETS}
+        self.overflow = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, batch_size, latencies):
+        self.frames += 1
+        self.events += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        for bucket in self.BUCKETS:
+            if batch_size <= bucket:
+                self.histogram[bucket] += 1
+                break
+        else:
+            self.overflow += 1
+        self.total_latency += sum(latencies)
+        self.max_latency = max([self.max_latency, *latencies])
+
+    def snapshot(self):
+        histogram = {f"<={bucket}": count for bucket, count in self.histogram.items()}
+        histogram[f">{self.BUCKETS[-1]}"] = self.overflow
+        return {
+            'frames': self.frames,
+            'events': self.events,
+            'mean_batch_size': round(self.events / self.frames, 2) if self.frames else 0,
+            'max_batch_size': self.max_batch_size,
+            'batch_size_histogram': histogram,
+            'mean_added_latency_ms': round(self.total_latency / self.events * 1000, 2) if self.events else 0,
+            'max_added_latency_ms': round(self.max_latency * 1000, 2),
+        }
+
+
+class CoalescingBroadcaster:
+    """
+    Collects channel-layer group messages for up to `window` seconds and
+    sends everything queued for one group as a single message:
+
+        {'type': 'batch', 'messages': [<message>, <message>, ...]}
+
+    A group with only one queued message gets it unchanged. Consumers
+    handle 'batch' messages with BatchedFramesMixin (menu/consumers.py).
+
+    publish() returns a future that resolves once the message has been
+    handed to the channel layer (or fails with the channel layer's error).
+    """
+
+    def __init__(self, channel_layer=None, window=None, max_batch=None):
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.window = settings.BROADCAST_COALESCE_WINDOW if window is None else window
+        self.max_batch = max_batch or settings.BROADCAST_MAX_BATCH
+        self.stats = BroadcastStats()
+        self._pending = {}
+        self._flush_handle = None
+
+    def publish(self, group, message, queued_at=None):
+        """
+        Queues a message for a group. `queued_at` (a time.time() timestamp)
+        is when the event really happened, for the latency metrics; it
+        defaults to now. Must be called from a running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._pending.setdefault(group, [])
+        queue.append((message, future, time.time() if queued_at is None else queued_at))
+
+        if len(queue) >= self.max_batch:
+            # A full frame doesn't need to wait for the rest of the window
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush_handle = loop.call_soon(lambda: loop.create_task(self.flush()))
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, lambda: loop.create_task(self.flush()))
+        return future
+
+    async def flush(self):
+        """
+        Sends everything that is queued right now.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        await asyncio.gather(*(self._send_group(group, queue) for group, queue in pending.items()))
+
+    async def _send_group(self, group, queue):
+        # Frames for one group go out one after another, to keep their order.
+        # If one fails, the rest of the group's messages fail with it.
+        for start in range(0, len(queue), self.max_batch):
+            chunk = queue[start:start + self.max_batch]
+            messages = [message for message, _, _ in chunk]
+            frame = messages[0] if len(messages) == 1 else {'type': 'batch', 'messages': messages}
+            try:
+                await self.channel_layer.group_send(group, frame)
+            except Exception as e:
+                for _, future, _ in queue[start:]:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            now = time.time()
+            self.stats.record(len(messages), [max(0.0, now - queued_at) for _, _, queued_at in chunk])
+            for _, future, _ in chunk:
+                if not future.done():
+                    future.set_result(None)
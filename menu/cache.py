@@ -0,0 +1,67 @@
+# menu/cache.py
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Every restaurant has its own menu version stamp. FoodType and Cuisine are
+# shared by all restaurants, so they get one global "taxonomy" stamp instead.
+MENU_VERSION_KEY = 'menu:version:{restaurant_id}'
+TAXONOMY_VERSION_KEY = 'menu:taxonomy-version'
+MENU_PAYLOAD_KEY = 'menu:payload:{restaurant_id}:{version}'
+
+
+def _timeout():
+    return getattr(settings, 'PUBLIC_MENU_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _fresh_stamp():
+    # Start from the clock (in ms) instead of 1, so a version key that was
+    # evicted from the cache can never come back with a number a phone
+    # already holds an ETag for.
+    return int(time.time() * 1000)
+
+
+def _get_or_init(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_stamp(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The key is missing (never set, or evicted)
+        cache.set(key, _fresh_stamp(), None)
+
+
+def get_menu_version(restaurant_id):
+    """
+    Returns the current version stamp for a restaurant's public menu.
+    """
+    return f"{_get_or_init(MENU_VERSION_KEY.format(restaurant_id=restaurant_id))}.{_get_or_init(TAXONOMY_VERSION_KEY)}"
+
+
+def bump_menu_version(restaurant_id):
+    _bump(MENU_VERSION_KEY.format(restaurant_id=restaurant_id))
+
+
+def bump_taxonomy_version():
+    _bump(TAXONOMY_VERSION_KEY)
+
+
+def get_cached_menu(restaurant_id, version):
+    return cache.get(MENU_PAYLOAD_KEY.format(restaurant_id=restaurant_id, version=version))
+
+
+def set_cached_menu(restaurant_id, version, payload):
+    cache.set(MENU_PAYLOAD_KEY.format(restaurant_id=restaurant_id, version=version), payload, _timeout())
+
+
+def menu_etag(restaurant_id, version):
+    # Strong ETag: the payload for a given version is always byte-identical
+    return f'"menu-{restaurant_id}-{version}"'
@@ -1,29 +1,168 @@
 # menu/consumers.py
 
 import json
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from restaurants.context import get_restaurant
+from restaurants.models import Restaurant
+from users.authentication import RoleCredentialJWTAuthentication
+from . import kitchen_events
 
-class ChefConsumer(AsyncWebsocketConsumer):
+# Close code for a socket that asked for something it may not see
+FORBIDDEN_CLOSE_CODE = 4403
+
+
+class BatchedFramesMixin:
+    """
+    Handles the 'batch' messages sent by CoalescingBroadcaster (menu/broadcast.py).
+    Every message in the batch that this consumer has a handler for is
+    forwarded to the browser in a single frame:
+
+        {"batch": [<message data>, <message data>, ...]}
+
+    where each entry is exactly what would have been sent on its own.
+
+    Messages from the outbox carry their data already encoded as JSON
+    ('text', see broadcast.encode_message), which is forwarded as is;
+    only messages with a plain 'data' dict are encoded here.
+    """
+    async def batch(self, event):
+        texts = [
+            self.frame_text(message) for message in event['messages']
+            if self.handles_message_type(message['type'])
+        ]
+        texts = [text for text in texts if text is not None]
+        if texts:
+            await self.send(text_data='{"batch": [' + ', '.join(texts) + ']}')
+
+    async def forward(self, event):
+        text = self.frame_text(event)
+        if text is not None:
+            await self.send(text_data=text)
+
+    def frame_text(self, message):
+        # What to send the browser for one message; None drops it
+        if 'text' in message:
+            return message['text']
+        return json.dumps(message['data'])
+
+    def handles_message_type(self, message_type):
+        # Same name mapping channels uses to dispatch messages to handlers
+        handler_name = message_type.replace('.', '_')
+        return handler_name != 'batch' and not handler_name.startswith('_') and callable(getattr(self, handler_name, None))
+
+
+class ChefConsumer(BatchedFramesMixin, AsyncWebsocketConsumer):
+    """
+    Kitchen notifications carry a per-restaurant sequence number, 'seq'.
+    A panel that reconnects passes the last one it saw, either in the URL
+    (ws/chef/<slug>/?last_seq=41) or as a message:
+
+        {"action": "resume", "last_seq": 41}
+
+    and gets back what it missed:
+
+        {"type": "resume", "seq": 45, "events": [<event>, ...]}
+
+    or, when those events are no longer kept, the current active orders:
+
+        {"type": "snapshot", "seq": 45, "orders": [<kitchen order>, ...]}
+
+    Catching up sends whole orders, so it needs the access token of a chef
+    or admin of this restaurant in the URL (?token=<access token>, browsers
+    can't set headers on a WebSocket). A socket that asks without one is
+    closed.
+    """
     async def connect(self):
         # For a multi-tenant app, the frontend would provide the restaurant slug
         # For now, we assume a Super Chef view or need a way to pass this.
         # Let's create a dynamic group name. The frontend will need to connect to ws/chef/restaurant-slug/
         self.restaurant_slug = self.scope['url_route']['kwargs']['restaurant_slug']
-        self.group_name = f'chef_notifications_{self.restaurant_slug}'
+        self.group_name = kitchen_events.group_name(self.restaurant_slug)
+        # Highest sequence number this socket has been sent
+        self.last_seq = None
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        token = query.get('token')
+        self.can_catch_up = bool(token) and await self.is_kitchen_staff(token[0])
+
+        last_seq = query.get('last_seq')
+        if last_seq and not self.can_catch_up:
+            await self.close(code=FORBIDDEN_CLOSE_CODE)
+            return
 
+        # Join the group before catching up, so nothing falls in between
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
 
+        if last_seq:
+            await self.resume(last_seq[0])
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '')
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get('action') == 'resume':
+            await self.resume(message.get('last_seq'))
+
+    async def resume(self, last_seq):
+        if not self.can_catch_up:
+            await self.close(code=FORBIDDEN_CLOSE_CODE)
+            return
+        try:
+            last_seq = int(last_seq)
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({'error': 'last_seq must be an integer'}))
+            return
+        message = await self.catch_up(max(last_seq, 0))
+        if message is None:
+            await self.send(text_data=json.dumps({'error': 'Restaurant not found'}))
+            return
+        self.last_seq = message['seq']
+        await self.send(text_data=json.dumps(message, default=str))
+
+    @database_sync_to_async
+    def is_kitchen_staff(self, raw_token):
+        # Same checks as the kitchen REST views: a valid token (shared login
+        # or StaffUser), the CHEF or ADMIN role, and this restaurant
+        authentication = RoleCredentialJWTAuthentication()
+        try:
+            user = authentication.get_user(authentication.get_validated_token(raw_token))
+        except AuthenticationFailed:
+            return False
+        restaurant = get_restaurant(slug=self.restaurant_slug)
+        return (
+            getattr(user, 'role', None) in ('ADMIN', 'CHEF')
+            and restaurant is not None and user.restaurant_id == restaurant.id
+        )
+
+    @database_sync_to_async
+    def catch_up(self, last_seq):
+        restaurant = Restaurant.objects.filter(slug=self.restaurant_slug).first()
+        if restaurant is None:
+            return None
+        return kitchen_events.catch_up(restaurant, last_seq)
+
+    def frame_text(self, message):
+        seq = message['seq'] if 'seq' in message else message.get('data', {}).get('seq')
+        if seq is not None and self.last_seq is not None:
+            if seq <= self.last_seq:
+                # Already sent while catching up
+                return None
+            self.last_seq = seq
+        return super().frame_text(message)
+
     # This method is called when a message is sent to the group
     async def send_new_order(self, event):
-        order_data = event['data']
         # Send the order data to the connected client (the chef's browser)
-        await self.send(text_data=json.dumps(order_data))
+        await self.forward(event)
         
-class CashierConsumer(AsyncWebsocketConsumer):
+class CashierConsumer(BatchedFramesMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.restaurant_slug = self.scope['url_route']['kwargs']['restaurant_slug']
         self.group_name = f'cashier_notifications_{self.restaurant_slug}'
@@ -36,12 +175,11 @@ class CashierConsumer(AsyncWebsocketConsumer):
 
     # This method is called when an order is ready for payment
     async def order_ready_for_payment(self, event):
-        order_data = event['data']
         # Send the order data to the connected client (the cashier's browser)
-        await self.send(text_data=json.dumps(order_data))
+        await self.forward(event)
 
 
-class CustomerConsumer(AsyncWebsocketConsumer):
+class CustomerConsumer(BatchedFramesMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.bill_id = self.scope['url_route']['kwargs']['bill_id']
         self.bill_group_name = f'customer_{self.bill_id}'
@@ -61,6 +199,5 @@ class CustomerConsumer(AsyncWebsocketConsumer):
 
     # Receive message from room group
     async def send_status_update(self, event):
-        data = event['data']
         # Send message to WebSocket
-        await self.send(text_data=json.dumps(data))
\ No newline at end of file
+        await self.forward(event)
\ No newline at end of file
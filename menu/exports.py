@@ -0,0 +1,101 @@
+# menu/exports.py
+
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import RestaurantOrderListSerializer
+
+# Bills fetched (and their items prefetched) per database round trip
+CHUNK_SIZE = 500
+
+# Lines produced per trip to the sync thread when streaming through ASGI
+ASYNC_BATCH_SIZE = 100
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+CSV_COLUMNS = [
+    'bill_id', 'created_at', 'customer_name', 'table_number', 'payment_status', 'payment_method',
+    'bill_total', 'item_name', 'variant_name', 'item_status', 'quantity', 'unit_price', 'line_total',
+]
+
+
+class _Echo:
+    # csv.writer only needs something with write(); hand each line straight back
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    # Customers type their own names and tables; keep them plain text in Excel
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iterate(queryset):
+    """
+    Reads a queryset of bills chunk by chunk, with each chunk's items
+    prefetched, so only one chunk is in memory at a time.
+    """
+    return queryset.prefetch_related('order_items').iterator(chunk_size=CHUNK_SIZE)
+
+
+def csv_rows(bills):
+    """
+    Yields the report as CSV lines, one line per order item. A bill without
+    items gets one line with the item columns left empty.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for bill in bills:
+        bill_columns = [
+            bill.id, bill.created_at.isoformat(), _cell(bill.customer_name), _cell(bill.table_number),
+            bill.payment_status, bill.payment_method or '', bill.subtotal,
+        ]
+        items = list(bill.order_items.all())
+        if not items:
+            yield writer.writerow(bill_columns + [''] * (len(CSV_COLUMNS) - len(bill_columns)))
+        for item in items:
+            line_total = item.unit_price * item.quantity if item.unit_price is not None else ''
+            yield writer.writerow(bill_columns + [
+                _cell(item.item_name), _cell(item.variant_name), item.status, item.quantity,
+                '' if item.unit_price is None else item.unit_price, line_total,
+            ])
+
+
+def ndjson_lines(bills):
+    """
+    Yields the report as newline-delimited JSON, one bill per line, in the
+    same shape as the JSON report.
+    """
+    encoder = JSONEncoder()
+    for bill in bills:
+        yield encoder.encode(RestaurantOrderListSerializer(bill).data) + '\n'
+
+
+async def aiterate(lines):
+    """
+    Streams a line generator from an async server. Given a plain iterator,
+    Django under ASGI would read it to the end before sending anything;
+    this reads it a batch at a time, on the thread the database
+    connection belongs to.
+    """
+    lines = iter(lines)
+    next_batch = sync_to_async(lambda: list(islice(lines, ASYNC_BATCH_SIZE)))
+    while True:
+        batch = await next_batch()
+        if not batch:
+            return
+        for line in batch:
+            yield line
+
+
+# ?export= value on the order report -> (line generator, content type)
+FORMATS = {
+    'csv': (csv_rows, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
@@ -0,0 +1,110 @@
+# menu/kitchen_events.py
+
+from django.conf import settings
+
+from . import outbox, sharding
+from .models import Bill, KitchenEvent, KitchenStream, OrderItem
+from .serializers import KitchenOrderSerializer
+
+# Old events are deleted once every this many new ones, so the log holds
+# between KITCHEN_EVENT_LOG_SIZE and KITCHEN_EVENT_LOG_SIZE + TRIM_EVERY events
+TRIM_EVERY = 50
+
+
+def group_name(restaurant_slug):
+    return f'chef_notifications_{restaurant_slug}'
+
+
+def publish(restaurant, message_type, data):
+    """
+    Queues a notification for the restaurant's chef panels, numbered with
+    the restaurant's next kitchen sequence number. The number is added to
+    the message as 'seq'. Must be called inside the transaction that makes
+    the change the message is about.
+    """
+    with sharding.for_restaurant(restaurant), sharding.atomic():
+        # The lock keeps the numbers in commit order per restaurant
+        stream, _ = KitchenStream.objects.select_for_update().get_or_create(restaurant=restaurant)
+        stream.last_sequence += 1
+        stream.save(update_fields=['last_sequence'])
+        sequence = stream.last_sequence
+
+        KitchenEvent.objects.create(restaurant=restaurant, sequence=sequence, message_type=message_type, data=data)
+        if sequence % TRIM_EVERY == 0:
+            KitchenEvent.objects.filter(
+                restaurant=restaurant, sequence__lte=sequence - settings.KITCHEN_EVENT_LOG_SIZE
+            ).delete()
+
+        outbox.enqueue(group_name(restaurant.slug), message_type, {**data, 'seq': sequence})
+    return sequence
+
+
+def new_order_message(bill, order_items):
+    """
+    The chef panel message for items added to a bill (a new order or a
+    reorder). `order_items` are the newly created OrderItem rows.
+    """
+    return {
+        'bill_id': bill.id, 'customer_name': bill.customer_name,
+        'table_number': bill.table_number,
+        'items': [{
+            'order_item_id': item.id, 'name': item.item_name,
+            'variant': item.variant_name, 'quantity': item.quantity
+        } for item in order_items]
+    }
+
+
+def current_sequence(restaurant_id):
+    return KitchenStream.objects.filter(restaurant_id=restaurant_id).values_list(
+        'last_sequence', flat=True
+    ).first() or 0
+
+
+def events_since(restaurant_id, last_seq):
+    """
+    Returns the messages published after `last_seq`, oldest first, or None
+    when some of them are no longer in the log (or `last_seq` is unknown).
+    """
+    current = current_sequence(restaurant_id)
+    if last_seq > current:
+        return None
+    events = list(
+        KitchenEvent.objects.filter(restaurant_id=restaurant_id, sequence__gt=last_seq)
+        .order_by('sequence').values('sequence', 'data')
+    )
+    if len(events) != current - last_seq:
+        # The log has rolled over past last_seq
+        return None
+    return [{**event['data'], 'seq': event['sequence']} for event in events]
+
+
+def active_orders(restaurant_id):
+    """
+    Unpaid bills that still have something for the kitchen to do.
+    """
+    return Bill.objects.filter(
+        restaurant_id=restaurant_id,
+        payment_status=Bill.PaymentStatus.PENDING,
+        order_items__status__in=[
+            OrderItem.OrderStatus.PENDING,
+            OrderItem.OrderStatus.ACCEPTED
+        ]
+    ).distinct().order_by('created_at').prefetch_related('order_items')
+
+
+def catch_up(restaurant, last_seq):
+    """
+    Builds the message that brings a chef panel that last saw `last_seq`
+    up to date: either the events it missed, or, when they are no longer
+    all available, a full snapshot of the active orders.
+    """
+    with sharding.for_restaurant(restaurant):
+        missed = events_since(restaurant.id, last_seq)
+        if missed is not None:
+            return {'type': 'resume', 'seq': last_seq + len(missed), 'events': missed}
+
+        # Read the sequence first: an order placed in between then shows up in
+        # the snapshot and again as a live event, rather than not at all
+        sequence = current_sequence(restaurant.id)
+        orders = KitchenOrderSerializer(active_orders(restaurant.id), many=True).data
+        return {'type': 'snapshot', 'seq': sequence, 'orders': orders}
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from menu import archive
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = ('Moves paid bills older than the retention window out of the live tables into the '
+            'columnar archive (ORDER_ARCHIVE_DIR). Reports and the sales rollup keep reading them from there.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', help='Slug of the restaurant to archive (default: all)')
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_RETENTION_DAYS,
+                            help='Keep paid bills from this many recent business days in the live tables')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise CommandError('The order archive needs NumPy')
+
+        restaurants = Restaurant.objects.all()
+        if options['restaurant']:
+            restaurants = restaurants.filter(slug=options['restaurant'])
+            if not restaurants.exists():
+                raise CommandError(f"No restaurant with slug '{options['restaurant']}'")
+
+        total = 0
+        for restaurant in restaurants:
+            before = restaurant.business_date() - timedelta(days=options['days'])
+            count = archive.archive_paid_bills(restaurant, before)
+            if count:
+                self.stdout.write(f"{restaurant.slug}: archived {count} bills from before {before}")
+            total += count
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} bills archived."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from menu import sharding
+from menu.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Fills in the price and name snapshot of order items created before it existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        # Every shard has order items (see menu/sharding.py)
+        for alias in sharding.databases():
+            last_id = 0
+            while True:
+                # Walk the table by primary key so each batch is a cheap range scan
+                batch = list(
+                    OrderItem.objects.using(alias).filter(id__gt=last_id, unit_price__isnull=True)
+                    .select_related('variant__menu_item')
+                    .order_by('id')[:batch_size]
+                )
+                if not batch:
+                    break
+
+                for order_item in batch:
+                    order_item.take_snapshot()
+                with transaction.atomic(using=alias):
+                    OrderItem.objects.using(alias).bulk_update(batch, ['unit_price', 'item_name', 'variant_name'])
+
+                total += len(batch)
+                last_id = batch[-1].id
+                self.stdout.write(f"Backfilled {total} order items...")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {total} order items backfilled."))
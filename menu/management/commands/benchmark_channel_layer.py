@@ -0,0 +1,84 @@
+import asyncio
+import json
+import statistics
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from restromanager.channel_layers import LocalChannelLayer
+
+
+class Command(BaseCommand):
+    help = ('Measures group_send throughput and delivery latency of the in-process channel layer, '
+            "channels' InMemoryChannelLayer and, if a Redis server is reachable, the Redis layer")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=100, help='Channels in the group')
+        parser.add_argument('--messages', type=int, default=200, help='Messages sent to the group')
+        parser.add_argument('--redis-host', default='127.0.0.1')
+        parser.add_argument('--redis-port', type=int, default=6380)
+
+    def handle(self, *args, **options):
+        members, messages = options['members'], options['messages']
+        # Room for every message, so that no layer drops any
+        capacity = messages + 1
+        layers = [
+            ('LocalChannelLayer', lambda: LocalChannelLayer(capacity=capacity)),
+            ('InMemoryChannelLayer', lambda: InMemoryChannelLayer(capacity=capacity)),
+        ]
+        try:
+            from channels_redis.core import RedisChannelLayer
+        except ImportError:
+            self.stdout.write(self.style.WARNING('channels_redis is not installed, skipping Redis'))
+        else:
+            hosts = [(options['redis_host'], options['redis_port'])]
+            layers.append(('RedisChannelLayer', lambda: RedisChannelLayer(hosts=hosts, capacity=capacity)))
+
+        self.stdout.write(f"{messages} group messages to {members} members each\n")
+        self.stdout.write(f"{'layer':<22} {'group_send/s':>13} {'deliveries/s':>13} {'p50 ms':>8} {'p99 ms':>8}")
+        for label, make_layer in layers:
+            try:
+                result = asyncio.run(asyncio.wait_for(self.run(make_layer(), members, messages), 120))
+            except Exception as e:
+                # Typically no Redis server listening
+                self.stdout.write(self.style.WARNING(f"{label:<22} skipped: {e or type(e).__name__}"))
+                continue
+            self.stdout.write(
+                f"{label:<22} {result['sends_per_second']:>13,.0f} {result['deliveries_per_second']:>13,.0f} "
+                f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+            )
+
+    @staticmethod
+    async def run(layer, members, messages):
+        group = 'benchmark'
+        channels = [await layer.new_channel() for _ in range(members)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+        latencies = []
+        # A typical pre-encoded kitchen message
+        text = json.dumps({'bill_id': 1, 'table_number': '4', 'items': [{'name': 'Dosa', 'quantity': 2}] * 4})
+
+        async def listen(channel):
+            for _ in range(messages):
+                message = await layer.receive(channel)
+                latencies.append(time.perf_counter() - message['sent_at'])
+
+        try:
+            listeners = [asyncio.create_task(listen(channel)) for channel in channels]
+            start = time.perf_counter()
+            for _ in range(messages):
+                await layer.group_send(group, {'type': 'send.new.order', 'text': text, 'sent_at': time.perf_counter()})
+            send_time = time.perf_counter() - start
+            await asyncio.gather(*listeners)
+            total_time = time.perf_counter() - start
+        finally:
+            await layer.flush()
+
+        latencies.sort()
+        return {
+            'sends_per_second': messages / send_time,
+            'deliveries_per_second': members * messages / total_time,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        }
@@ -0,0 +1,80 @@
+import json
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from menu.broadcast import encode_message
+from menu.consumers import ChefConsumer
+
+
+class Command(BaseCommand):
+    help = ('Measures the per-socket CPU cost of delivering one chef panel message to every '
+            'socket in a group, with the data encoded per socket versus once at publish time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=500, help='Sockets in the group')
+        parser.add_argument('--items', type=int, default=8, help='Order items in each message')
+        parser.add_argument('--rounds', type=int, default=50, help='Messages delivered to the group')
+
+    def handle(self, *args, **options):
+        sockets, rounds = options['sockets'], options['rounds']
+        data = {
+            'bill_id': 1024, 'customer_name': 'Benchmark Customer', 'table_number': '12', 'seq': 1,
+            'items': [{
+                'order_item_id': 5000 + index, 'name': f'Dish number {index}',
+                'variant': 'Full', 'quantity': 2
+            } for index in range(options['items'])]
+        }
+
+        sent = []
+        consumers = []
+        for _ in range(sockets):
+            consumer = ChefConsumer()
+            consumer.last_seq = None
+            consumer.base_send = self.collector(sent)
+            consumers.append(consumer)
+
+        self.stdout.write(f"{sockets} sockets, {rounds} messages of {len(json.dumps(data))} bytes\n")
+
+        # Before: every consumer encodes the dict it was handed
+        per_socket = async_to_sync(self.deliver)(
+            consumers, rounds, lambda: {'type': 'send.new.order', 'data': data}
+        )
+        self.report('encoded per socket', per_socket, sockets * rounds)
+        first_frames = list(sent[:sockets])
+        sent.clear()
+
+        # After: the message is encoded once and the text forwarded as is
+        once = async_to_sync(self.deliver)(
+            consumers, rounds, lambda: encode_message('send.new.order', data)
+        )
+        self.report('encoded once', once, sockets * rounds, per_socket)
+
+        if first_frames != sent[:sockets]:
+            self.stdout.write(self.style.ERROR('The frames sent differ'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Both ways send identical frames'))
+
+    @staticmethod
+    def collector(sent):
+        async def base_send(message):
+            sent.append(message['text'])
+        return base_send
+
+    @staticmethod
+    async def deliver(consumers, rounds, build_message):
+        # CPU time of building each message and handing it to every consumer;
+        # the channel layer's own transport cost is the same either way
+        start = time.process_time()
+        for _ in range(rounds):
+            message = build_message()
+            for consumer in consumers:
+                await consumer.send_new_order(message)
+        return time.process_time() - start
+
+    def report(self, label, seconds, deliveries, baseline=None):
+        line = f"{label:<20} {seconds * 1000:10.1f} ms CPU  {seconds / deliveries * 1e6:8.2f} us/socket"
+        if baseline:
+            line += f"  ({baseline / seconds:5.1f}x less)"
+        self.stdout.write(line)
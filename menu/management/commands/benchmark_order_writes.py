@@ -0,0 +1,142 @@
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from menu.models import Category, MenuItem, MenuItemVariant
+from restaurants.models import Restaurant
+
+LOCAL_CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'restromanager.channel_layers.LocalChannelLayer', 'CONFIG': {'capacity': 1000}},
+}
+
+MODES = {
+    'default': ('django.db.backends.sqlite3', {}),
+    'production': ('restromanager.serialized_sqlite', settings.SQLITE_PRODUCTION_OPTIONS),
+}
+
+
+class Command(BaseCommand):
+    help = ('Places orders through the public order endpoint from many threads at once, first with '
+            "SQLite's default settings and then in SQLITE_MODE = 'production', and reports throughput, "
+            'latency and failed orders for each. Runs on throwaway database files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent order submitters')
+        parser.add_argument('--orders', type=int, default=50, help='Orders placed by each thread')
+        parser.add_argument('--items', type=int, default=3, help='Items per order')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('This benchmark compares SQLite settings; the default database is not SQLite')
+
+        setup_test_environment()
+        workdir = tempfile.mkdtemp()
+        original = connections.settings['default']
+        old_name = original['NAME']
+        original.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'base.sqlite3')
+        connections['default'].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CHANNEL_LAYERS=LOCAL_CHANNEL_LAYERS, CHANNEL_LAYER_BACKEND='local'):
+                slug, variants = self.set_up()
+                connections['default'].close()
+                reports = {}
+                for mode, (engine, mode_options) in MODES.items():
+                    name = os.path.join(workdir, f'{mode}.sqlite3')
+                    shutil.copyfile(original['NAME'], name)
+                    self.use_database({**original, 'ENGINE': engine, 'OPTIONS': mode_options, 'NAME': name})
+                    reports[mode] = self.run(slug, variants, options)
+        finally:
+            self.use_database(original)
+            connections['default'].creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        for mode, report in reports.items():
+            self.print_report(mode, report)
+
+    def use_database(self, settings_dict):
+        # Threads started afterwards connect with these settings
+        connections['default'].close()
+        del connections['default']
+        connections.settings['default'] = settings_dict
+
+    def set_up(self):
+        restaurant = Restaurant.objects.create(
+            name='Write Benchmark Diner', slug='write-benchmark-diner', latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=restaurant, name='Mains')
+        variants = []
+        for index in range(10):
+            menu_item = MenuItem.objects.create(restaurant=restaurant, category=category, name=f'Dish {index}')
+            variants.append(MenuItemVariant.objects.create(menu_item=menu_item, variant_name='Full', price=120))
+        return restaurant.slug, [(variant.menu_item_id, variant.variant_name) for variant in variants]
+
+    def run(self, slug, variants, options):
+        url = reverse('frontend-order-create', kwargs={'restaurant_slug': slug})
+        latencies = []
+        failures = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'] + 1)
+
+        def submit(thread_index):
+            client = APIClient()
+            start.wait()
+            try:
+                for n in range(options['orders']):
+                    index = thread_index * options['orders'] + n
+                    payload = {
+                        'customer_name': f'Guest {index}', 'table_number': str(index % 40 + 1),
+                        'items': [
+                            {'menu_item_id': menu_item_id, 'variant_name': variant_name, 'quantity': 1}
+                            for menu_item_id, variant_name in
+                            (variants[(index + k) % len(variants)] for k in range(options['items']))
+                        ],
+                    }
+                    began = time.perf_counter()
+                    try:
+                        response = client.post(url, payload, format='json')
+                        error = None if response.status_code == 201 else f'HTTP {response.status_code}'
+                    except Exception as exc:
+                        error = f'{type(exc).__name__}: {exc}'
+                    with lock:
+                        if error is None:
+                            latencies.append(time.perf_counter() - began)
+                        else:
+                            failures[error] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=submit, args=(index,)) for index in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        began = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        return {'latencies': sorted(latencies), 'failures': failures, 'elapsed': elapsed}
+
+    def print_report(self, mode, report):
+        latencies = report['latencies']
+        placed = len(latencies)
+        failed = sum(report['failures'].values())
+        self.stdout.write('')
+        self.stdout.write(f"SQLite mode '{mode}': {placed} orders placed, {failed} failed "
+                          f"in {report['elapsed']:.2f}s ({placed / report['elapsed']:.0f} orders/s)")
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(f"  latency p50 {statistics.median(latencies) * 1000:.0f} ms, "
+                              f"p95 {p95 * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+        for error, count in report['failures'].most_common(5):
+            self.stdout.write(f"  {count} x {error}")
@@ -0,0 +1,56 @@
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from menu.broadcast import CoalescingBroadcaster
+from menu.outbox import dispatch_pending, purge_dispatched, run_dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Pushes queued WebSocket notifications from the outbox table to the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=settings.BROADCAST_COALESCE_WINDOW,
+                            help='Seconds to wait between polls when the outbox is empty. '
+                                 'Events queued within one interval are coalesced per group.')
+        parser.add_argument('--keep-hours', type=float, default=24,
+                            help='Delete delivered events older than this many hours')
+        parser.add_argument('--stats-every', type=float, default=60,
+                            help='Print broadcast metrics every this many seconds (0 to disable)')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        keep = timedelta(hours=options['keep_hours'])
+        broadcaster = CoalescingBroadcaster()
+
+        if options['once']:
+            total = 0
+            while True:
+                sent = dispatch_pending(batch_size, broadcaster=broadcaster)
+                total += sent
+                if sent < batch_size:
+                    break
+            purge_dispatched(keep)
+            self.stdout.write(self.style.SUCCESS(f"Dispatched {total} events"))
+            self.print_stats(broadcaster)
+            return
+
+        self.stdout.write('Outbox dispatcher started')
+        last_stats = time.monotonic()
+
+        def on_tick(broadcaster):
+            nonlocal last_stats
+            if options['stats_every'] and time.monotonic() - last_stats > options['stats_every']:
+                self.print_stats(broadcaster)
+                broadcaster.stats.reset()
+                last_stats = time.monotonic()
+
+        run_dispatcher(broadcaster, batch_size, options['interval'], keep, on_tick=on_tick)
+
+    def print_stats(self, broadcaster):
+        self.stdout.write(f"Broadcast stats: {json.dumps(broadcaster.stats.snapshot())}")
@@ -0,0 +1,272 @@
+import asyncio
+import importlib
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from menu.models import Category, MenuItem, MenuItemVariant, OrderItem
+from restaurants.models import Restaurant
+from users.models import StaffUser
+
+LOCAL_CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'restromanager.channel_layers.LocalChannelLayer', 'CONFIG': {'capacity': 1000}},
+}
+
+
+class Command(BaseCommand):
+    help = ('Opens many simulated chef, cashier and customer WebSocket connections against '
+            'restromanager.asgi.application, drives orders and kitchen status changes through the '
+            'REST views and reports delivery latency and memory per connection. Runs entirely in '
+            'this process, on a throwaway database and the in-process channel layer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000, help='Bills, each with its own customer socket')
+        parser.add_argument('--chefs', type=int, default=10, help='Chef panel sockets')
+        parser.add_argument('--cashiers', type=int, default=3, help='Cashier sockets')
+        parser.add_argument('--items', type=int, default=3, help='Order items per bill')
+        parser.add_argument('--tickets-per-call', type=int, default=5,
+                            help='Bills whose items the kitchen updates in one bulk status call')
+        parser.add_argument('--drain-timeout', type=float, default=30,
+                            help='Seconds to wait for outstanding messages at the end')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        # A file rather than an in-memory database, so the dispatcher thread sees the same data
+        test_db = os.path.join(tempfile.mkdtemp(), 'loadtest.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_db
+        if connection.vendor == 'sqlite':
+            # The dispatcher thread and the REST calls write at the same time. With
+            # SQLite's default deferred transactions, the dispatcher's read-then-write
+            # transaction fails with "database is locked" instead of waiting its turn.
+            connection.settings_dict.setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CHANNEL_LAYERS=LOCAL_CHANNEL_LAYERS, CHANNEL_LAYER_BACKEND='local'):
+                # Importing the ASGI module in 'local' mode starts its outbox dispatcher thread
+                asgi = sys.modules.get('restromanager.asgi') or importlib.import_module('restromanager.asgi')
+                if not hasattr(asgi, 'stop_outbox_dispatcher'):
+                    from menu.outbox import start_dispatcher_thread
+                    asgi.outbox_dispatcher, asgi.stop_outbox_dispatcher = start_dispatcher_thread()
+                try:
+                    report = async_to_sync(LoadTest(asgi.application, options, self.stdout).run)()
+                finally:
+                    asgi.stop_outbox_dispatcher.set()
+                    asgi.outbox_dispatcher.join(5)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.print_report(report)
+
+    def print_report(self, report):
+        self.stdout.write('')
+        self.stdout.write(f"Connections open: {report['connections']}")
+        self.stdout.write(
+            f"Memory per connection: {report['traced_bytes_per_connection'] / 1024:.1f} KiB traced Python objects, "
+            f"peak RSS {report['max_rss_mib']:.0f} MiB"
+        )
+        self.stdout.write('')
+        self.stdout.write(f"{'socket':<10} {'received':>9} {'expected':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for kind, row in report['latency'].items():
+            if row['received']:
+                self.stdout.write(
+                    f"{kind:<10} {row['received']:>9} {row['expected']:>9} {row['p50']:>8.1f} "
+                    f"{row['p90']:>8.1f} {row['p99']:>8.1f} {row['max']:>8.1f}"
+                )
+            else:
+                self.stdout.write(f"{kind:<10} {0:>9} {row['expected']:>9}")
+        missing = sum(row['expected'] - row['received'] for row in report['latency'].values())
+        if missing:
+            self.stdout.write(self.style.ERROR(f"{missing} messages were not delivered"))
+        else:
+            self.stdout.write(self.style.SUCCESS('Every expected message was delivered'))
+
+
+class LoadTest:
+    """
+    Latency is measured from the moment the REST call that caused a message
+    returns until the frame arrives at the socket, so it covers the outbox,
+    the dispatcher's polling and coalescing, the channel layer and the
+    consumer. REST calls and the dispatcher share this process with the
+    sockets, as they would on a single-node outlet.
+    """
+
+    def __init__(self, application, options, stdout):
+        self.application = application
+        self.options = options
+        self.stdout = stdout
+        # (kind, key) -> perf_counter() when the REST call returned
+        self.sent_at = {}
+        # kind -> list of latencies in seconds
+        self.latencies = {'chef': [], 'cashier': [], 'customer': []}
+        self.expected = {'chef': 0, 'cashier': 0, 'customer': 0}
+
+    async def run(self):
+        options = self.options
+        self.restaurant, self.variants, self.client = await sync_to_async(self.set_up)()
+        slug = self.restaurant.slug
+        listeners = []
+        sockets = []
+
+        async def open_socket(kind, path, key=None):
+            communicator = WebsocketCommunicator(self.application, path)
+            connected, _ = await communicator.connect(timeout=10)
+            if not connected:
+                raise RuntimeError(f"Could not connect to {path}")
+            sockets.append(communicator)
+            listeners.append(asyncio.create_task(self.listen(kind, key, communicator)))
+
+        self.stdout.write(f"Opening {options['chefs']} chef and {options['cashiers']} cashier sockets")
+        for _ in range(options['chefs']):
+            await open_socket('chef', f'/ws/chef/{slug}/')
+        for _ in range(options['cashiers']):
+            await open_socket('cashier', f'/ws/cashier/{slug}/')
+
+        self.stdout.write(f"Placing {options['customers']} orders")
+        bill_ids = []
+        for index in range(options['customers']):
+            bill_id = await sync_to_async(self.place_order)(index)
+            self.sent_at[('order', bill_id)] = time.perf_counter()
+            bill_ids.append(bill_id)
+        self.expected['chef'] = options['chefs'] * len(bill_ids)
+
+        self.stdout.write(f"Opening {len(bill_ids)} customer sockets")
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        for bill_id in bill_ids:
+            await open_socket('customer', f'/ws/customer/{bill_id}/', bill_id)
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        traced_per_connection = (after - before) / len(bill_ids) if bill_ids else 0
+
+        self.stdout.write('Driving kitchen status changes')
+        items_by_bill = await sync_to_async(self.items_by_bill)(bill_ids)
+        chunk = options['tickets_per_call']
+        for new_status in (OrderItem.OrderStatus.ACCEPTED, OrderItem.OrderStatus.COMPLETED):
+            for start in range(0, len(bill_ids), chunk):
+                tickets = bill_ids[start:start + chunk]
+                await sync_to_async(self.update_status)(
+                    [item_id for bill_id in tickets for item_id in items_by_bill[bill_id]], new_status
+                )
+                now = time.perf_counter()
+                for bill_id in tickets:
+                    self.sent_at[('status', bill_id, new_status.label)] = now
+                    if new_status == OrderItem.OrderStatus.COMPLETED:
+                        self.sent_at[('ready', bill_id)] = now
+        self.expected['customer'] = 2 * len(bill_ids)
+        self.expected['cashier'] = options['cashiers'] * len(bill_ids)
+
+        deadline = time.monotonic() + options['drain_timeout']
+        while time.monotonic() < deadline and any(
+            len(self.latencies[kind]) < self.expected[kind] for kind in self.expected
+        ):
+            await asyncio.sleep(0.1)
+
+        for task in listeners:
+            task.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        for communicator in sockets:
+            await communicator.disconnect()
+
+        return {
+            'connections': len(sockets),
+            'traced_bytes_per_connection': traced_per_connection,
+            # ru_maxrss is in KiB on Linux
+            'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'latency': {kind: self.summary(kind) for kind in self.latencies},
+        }
+
+    async def listen(self, kind, bill_id, communicator):
+        while True:
+            frame = json.loads(await communicator.receive_from(timeout=3600))
+            arrived = time.perf_counter()
+            for payload in frame['batch'] if 'batch' in frame else [frame]:
+                for key in self.keys(kind, bill_id, payload):
+                    sent = self.sent_at.get(key)
+                    if sent is not None:
+                        # The dispatcher can beat the REST response back to us
+                        self.latencies[kind].append(max(0.0, arrived - sent))
+
+    @staticmethod
+    def keys(kind, bill_id, payload):
+        if kind == 'chef':
+            return [('order', payload['bill_id'])]
+        if kind == 'cashier':
+            return [('ready', bill['id']) for bill in payload['bills']]
+        # One status message per customer bill and call, covering all its items
+        return [('status', bill_id, payload['updates'][0]['new_status'])]
+
+    def summary(self, kind):
+        values = sorted(self.latencies[kind])
+        row = {'received': len(values), 'expected': self.expected[kind]}
+        if values:
+            row.update({
+                'p50': statistics.median(values) * 1000,
+                'p90': values[int(len(values) * 0.9) - 1 if len(values) >= 10 else -1] * 1000,
+                'p99': values[int(len(values) * 0.99) - 1 if len(values) >= 100 else -1] * 1000,
+                'max': values[-1] * 1000,
+            })
+        return row
+
+    # Database side; these run in the synchronous worker thread
+
+    def set_up(self):
+        restaurant = Restaurant.objects.create(
+            name='Load Test Diner', slug='load-test-diner', latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=restaurant, name='Mains')
+        variants = []
+        for index in range(10):
+            menu_item = MenuItem.objects.create(restaurant=restaurant, category=category, name=f'Dish {index}')
+            variants.append(MenuItemVariant.objects.create(menu_item=menu_item, variant_name='Full', price=120))
+        chef = StaffUser.objects.create_user(
+            username='loadtest-owner', password='loadtest', role='ADMIN', restaurant=restaurant
+        )
+        client = APIClient()
+        client.force_authenticate(chef)
+        return restaurant, variants, client
+
+    def place_order(self, index):
+        variants = [self.variants[(index + n) % len(self.variants)] for n in range(self.options['items'])]
+        response = APIClient().post(
+            reverse('frontend-order-create', kwargs={'restaurant_slug': self.restaurant.slug}),
+            {
+                'customer_name': f'Guest {index}', 'table_number': str(index % 40 + 1),
+                'items': [
+                    {'menu_item_id': variant.menu_item_id, 'variant_name': variant.variant_name, 'quantity': 1}
+                    for variant in variants
+                ],
+            },
+            format='json'
+        )
+        if response.status_code != 201:
+            raise RuntimeError(f"Order failed: {response.status_code} {response.data}")
+        return response.data['order_id']
+
+    def items_by_bill(self, bill_ids):
+        items = {}
+        for item_id, bill_id in OrderItem.objects.filter(bill_id__in=bill_ids).values_list('id', 'bill_id'):
+            items.setdefault(bill_id, []).append(item_id)
+        return items
+
+    def update_status(self, item_ids, new_status):
+        response = self.client.post(
+            reverse('bulk-update-order-item-status'),
+            {'items': [{'id': item_id, 'status': new_status} for item_id in item_ids]},
+            format='json'
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Status update failed: {response.status_code} {response.data}")
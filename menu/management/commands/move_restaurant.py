@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from menu import sharding
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = ("Moves a restaurant's menu, orders, kitchen log and sales to another database of the shard map "
+            "('default' or one of ORDER_SHARDS) while it keeps taking orders. Its writes fail for the few "
+            "moments of the final switch.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurant', help='Slug of the restaurant to move')
+        parser.add_argument('--to', required=True, help='Database alias to move it to')
+        parser.add_argument('--wait', type=float, default=settings.RESTAURANT_CONTEXT_TTL,
+                            help='Seconds to wait after the switch before deleting the old rows, '
+                                 'so every process has looked the restaurant up again')
+
+    def handle(self, *args, **options):
+        restaurant = Restaurant.objects.filter(slug=options['restaurant']).first()
+        if restaurant is None:
+            raise CommandError(f"No restaurant with slug '{options['restaurant']}'")
+        target = options['to']
+        if target not in sharding.databases():
+            raise CommandError(f"Unknown shard '{target}'. Must be one of {sharding.databases()}.")
+        if target == restaurant.shard:
+            raise CommandError(f"'{restaurant.slug}' is already on '{target}'")
+
+        source = restaurant.shard
+        sharding.move_restaurant(restaurant, target, wait=options['wait'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Done. '{restaurant.slug}' moved from '{source}' to '{target}'."))
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from menu import sales
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollup used by the analytics views from the paid bills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', help='Slug of the restaurant to rebuild (default: all)')
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help='First business day to rebuild, as YYYY-MM-DD (default: all history)')
+
+    def handle(self, *args, **options):
+        restaurant = None
+        if options['restaurant']:
+            restaurant = Restaurant.objects.filter(slug=options['restaurant']).first()
+            if restaurant is None:
+                raise CommandError(f"No restaurant with slug '{options['restaurant']}'")
+
+        rows = sales.rebuild(restaurant=restaurant, since=options['since'])
+        self.stdout.write(self.style.SUCCESS(f"Done. {rows} daily sales rows written."))
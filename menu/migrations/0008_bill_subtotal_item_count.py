@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:30
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Bill = apps.get_model('menu', 'Bill')
+    OrderItem = apps.get_model('menu', 'OrderItem')
+    items = OrderItem.objects.filter(bill=OuterRef('pk')).exclude(status='DECLINED').values('bill')
+    Bill.objects.update(
+        subtotal=Coalesce(
+            Subquery(items.annotate(total=Sum(F('quantity') * F('variant__price'))).values('total')),
+            Value(0, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        ),
+        item_count=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0007_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, help_text='Total quantity of non-declined items'),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0008_bill_subtotal_item_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='item_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_open_item_count(apps, schema_editor):
+    Bill = apps.get_model('menu', 'Bill')
+    OrderItem = apps.get_model('menu', 'OrderItem')
+    open_items = OrderItem.objects.filter(
+        bill=OuterRef('pk'), status__in=['PENDING', 'ACCEPTED']
+    ).values('bill').annotate(total=Count('pk')).values('total')
+    Bill.objects.update(open_item_count=Coalesce(Subquery(open_items), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0009_orderitem_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='open_item_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of order items still pending or accepted'),
+        ),
+        migrations.RunPython(backfill_open_item_count, migrations.RunPython.noop),
+    ]
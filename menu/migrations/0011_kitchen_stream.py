@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0010_bill_open_item_count'),
+        ('restaurants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KitchenStream',
+            fields=[
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='kitchen_stream', serialize=False, to='restaurants.restaurant')),
+                ('last_sequence', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='KitchenEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveBigIntegerField()),
+                ('message_type', models.CharField(max_length=100)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kitchen_events', to='restaurants.restaurant')),
+            ],
+            options={
+                'ordering': ['restaurant', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'sequence'), name='unique_kitchen_event_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0011_kitchen_stream'),
+        ('restaurants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('business_date', models.DateField(help_text='Local day the items were ordered on')),
+                ('item_name', models.CharField(blank=True, max_length=100)),
+                ('variant_name', models.CharField(blank=True, max_length=100)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='restaurants.restaurant')),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='menu.menuitemvariant')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales',
+                'indexes': [models.Index(fields=['business_date'], name='daily_sales_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'business_date', 'variant'), name='unique_daily_sales')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0012_daily_sales'),
+        ('restaurants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['restaurant', 'created_at', 'id'], name='bill_restaurant_created_idx'),
+        ),
+    ]
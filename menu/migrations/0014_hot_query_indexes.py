@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0013_bill_keyset_index'),
+        ('restaurants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['restaurant', 'payment_status', 'created_at'], name='bill_rest_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(condition=models.Q(('payment_status', 'PENDING')), fields=['created_at', 'id'], name='bill_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['restaurant', 'is_available'], name='menuitem_rest_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['restaurant'], name='menuitem_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['bill', 'status'], name='orderitem_bill_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['created_at'], name='orderitem_created_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.db import migrations, models
+
+
+def backfill_business_dates(apps, schema_editor):
+    # Same rule as Restaurant.business_date(), which isn't available on historical models
+    Restaurant = apps.get_model('restaurants', 'Restaurant')
+    Bill = apps.get_model('menu', 'Bill')
+    OrderItem = apps.get_model('menu', 'OrderItem')
+    db = schema_editor.connection.alias
+
+    for restaurant in Restaurant.objects.using(db).all():
+        zone = ZoneInfo(restaurant.time_zone)
+        cutoff = timedelta(hours=restaurant.day_cutoff_hour)
+        for model, lookup in ((Bill, 'restaurant'), (OrderItem, 'bill__restaurant')):
+            rows = model.objects.using(db).filter(**{lookup: restaurant}).only('id', 'created_at')
+            batch = []
+            for row in rows.iterator(chunk_size=2000):
+                row.business_date = (row.created_at.astimezone(zone) - cutoff).date()
+                batch.append(row)
+                if len(batch) == 2000:
+                    model.objects.using(db).bulk_update(batch, ['business_date'])
+                    batch = []
+            model.objects.using(db).bulk_update(batch, ['business_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0014_hot_query_indexes'),
+        ('restaurants', '0002_business_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='business_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='business_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(backfill_business_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bill',
+            name='business_date',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='business_date',
+            field=models.DateField(),
+        ),
+        migrations.RemoveIndex(
+            model_name='orderitem',
+            name='orderitem_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['restaurant', 'business_date'], name='bill_rest_business_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['business_date'], name='orderitem_business_date_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0015_business_date'),
+        ('restaurants', '0003_restaurant_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantMove',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('moved_to', models.CharField(max_length=50)),
+                ('moved_at', models.DateTimeField(auto_now_add=True)),
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='restaurants.restaurant')),
+            ],
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from restaurants.models import Restaurant
 
 # --- NEW: Models for flexible categorization ---
@@ -45,6 +46,13 @@ class MenuItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['restaurant', 'is_available'], name='menuitem_rest_available_idx'),
+            # The public menu only ever reads available items
+            models.Index(fields=['restaurant'], condition=models.Q(is_available=True), name='menuitem_available_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -72,8 +80,35 @@ class Bill(models.Model):
     table_number = models.CharField(max_length=50)
     payment_status = models.CharField(max_length=20, choices=PaymentStatus.choices, default=PaymentStatus.PENDING)
     payment_method = models.CharField(max_length=20, choices=PaymentMethod.choices, null=True, blank=True)
+    # Running totals of the bill's non-declined items, kept up to date by menu/billing.py
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0, help_text="Total quantity of non-declined items")
+    open_item_count = models.PositiveIntegerField(default=0, help_text="Number of order items still pending or accepted")
+    # The restaurant's business day at creation (see Restaurant.business_date), so
+    # period filters are plain date comparisons instead of per-row timezone maths
+    business_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination of the order lists (menu/pagination.py)
+            models.Index(fields=['restaurant', 'created_at', 'id'], name='bill_restaurant_created_idx'),
+            # Period filters of the order report
+            models.Index(fields=['restaurant', 'business_date'], name='bill_rest_business_date_idx'),
+            # Kitchen and cashier lookups of a restaurant's bills by payment status
+            models.Index(fields=['restaurant', 'payment_status', 'created_at'], name='bill_rest_status_created_idx'),
+            # Unpaid bills are a small, hot slice of the table (the cashier's list)
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(payment_status='PENDING'), name='bill_pending_idx'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.business_date is None:
+            self.business_date = self.restaurant.business_date()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Bill for {self.customer_name} at Table {self.table_number}"
 
@@ -87,7 +122,147 @@ class OrderItem(models.Model):
     variant = models.ForeignKey(MenuItemVariant, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     status = models.CharField(max_length=20, choices=OrderStatus.choices, default=OrderStatus.PENDING)
+    # Snapshot of the variant at order time, so later menu edits don't rewrite history
+    # (and reads don't need to join through MenuItemVariant and MenuItem)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    item_name = models.CharField(max_length=100, blank=True)
+    variant_name = models.CharField(max_length=100, blank=True)
+    # Business day the item was ordered on; a reorder after the cutoff counts towards the next day
+    business_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def from_variant(cls, variant, **kwargs):
+        """
+        Builds an unsaved OrderItem with the variant's current name and price
+        captured. The variant's menu_item should already be loaded, and a
+        `bill` must be given.
+        """
+        order_item = cls(variant=variant, **kwargs)
+        order_item.take_snapshot()
+        order_item.business_date = order_item.bill.restaurant.business_date()
+        return order_item
+
+    def take_snapshot(self):
+        self.unit_price = self.variant.price
+        self.item_name = self.variant.menu_item.name
+        self.variant_name = self.variant.variant_name
+
+    def save(self, *args, **kwargs):
+        # Items created without from_variant() (e.g. in the admin) still get a snapshot
+        if self.unit_price is None:
+            self.take_snapshot()
+        if self.business_date is None:
+            self.business_date = self.bill.restaurant.business_date()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Items of a bill by status (kitchen list, bill totals, cashier messages)
+            models.Index(fields=['bill', 'status'], name='orderitem_bill_status_idx'),
+            # Date range scans of the sales rollup (menu/sales.py)
+            models.Index(fields=['business_date'], name='orderitem_business_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.item_name} ({self.variant_name})"
+
+class OutboxEvent(models.Model):
+    """
+    A WebSocket notification waiting to be pushed to the channel layer.
+    Rows are written in the same transaction as the Bill/OrderItem change
+    and drained by the dispatch_outbox worker (see menu/outbox.py).
+    """
+    group = models.CharField(max_length=200)
+    message_type = models.CharField(max_length=100)
+    data = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dispatched_at', 'available_at'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.message_type} -> {self.group}"
+
+
+class KitchenStream(models.Model):
+    """
+    The last sequence number handed out to a restaurant's kitchen events.
+    """
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, primary_key=True, related_name='kitchen_stream')
+    last_sequence = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.restaurant.name} @ {self.last_sequence}"
+
+
+class KitchenEvent(models.Model):
+    """
+    The most recent kitchen (chef panel) notifications of a restaurant, kept
+    so that a reconnecting chef panel can catch up on what it missed.
+    Old rows are trimmed by menu/kitchen_events.py.
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='kitchen_events')
+    sequence = models.PositiveBigIntegerField()
+    message_type = models.CharField(max_length=100)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['restaurant', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'sequence'], name='unique_kitchen_event_sequence'),
+        ]
+
+    def __str__(self):
+        return f"#{self.sequence} {self.message_type} ({self.restaurant.name})"
+
+
+class DailySales(models.Model):
+    """
+    Paid sales per restaurant, business day and dish variant. Rows are added
+    to when a bill is paid (see menu/sales.py), so the analytics views never
+    have to scan the order history.
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_sales')
+    business_date = models.DateField(help_text="Local day the items were ordered on")
+    # Kept when the variant is deleted, so past sales don't change
+    variant = models.ForeignKey(MenuItemVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    item_name = models.CharField(max_length=100, blank=True)
+    variant_name = models.CharField(max_length=100, blank=True)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = "Daily sales"
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'business_date', 'variant'], name='unique_daily_sales'),
+        ]
+        indexes = [
+            # The all-restaurant analytics filter on the day alone
+            models.Index(fields=['business_date'], name='daily_sales_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.business_date} {self.item_name} ({self.variant_name}): {self.quantity}"
+
+
+class RestaurantMove(models.Model):
+    """
+    Left on a shard a restaurant has moved away from (see menu/sharding.py).
+    Processes that still have the old shard cached get an error instead of
+    writing the restaurant's orders to it.
+    """
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, related_name='+')
+    moved_to = models.CharField(max_length=50)
+    moved_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        return f"{self.quantity}x {self.variant.menu_item.name} ({self.variant.variant_name})"
+        return f"{self.restaurant_id} -> {self.moved_to}"
@@ -0,0 +1,193 @@
+# menu/outbox.py
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from . import sharding
+from .broadcast import CoalescingBroadcaster, encode_message
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a failed event, doubling per attempt up to this cap
+MAX_RETRY_DELAY = 60
+
+# Seconds a dispatcher has to send the events it claimed before others may retry them
+CLAIM_SECONDS = 60
+
+
+def enqueue(group, message_type, data):
+    """
+    Queues a channel-layer group message. Call this inside the same
+    transaction as the database change the message is about, so the
+    notification is stored if and only if the change is committed.
+    """
+    return OutboxEvent.objects.create(group=group, message_type=message_type, data=data)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+async def _send_events(broadcaster, events):
+    """
+    Sends the events through the broadcaster, which coalesces the events of
+    each group into a single frame, and returns {event_id: error} for the
+    ones that failed. Each event is encoded to JSON here, once, however many
+    sockets it ends up on.
+    """
+    futures = [
+        (event, broadcaster.publish(
+            event.group,
+            encode_message(event.message_type, event.data),
+            queued_at=event.created_at.timestamp()
+        ))
+        for event in events
+    ]
+    await broadcaster.flush()
+    return {event.id: future.exception() for event, future in futures if future.exception()}
+
+
+def dispatch_pending(batch_size=100, channel_layer=None, broadcaster=None):
+    """
+    Sends one batch of pending outbox events from each database (events are
+    written on the shard of the change they are about) to the channel
+    layer. Returns the number of events that were delivered.
+    """
+    broadcaster = broadcaster or CoalescingBroadcaster(channel_layer or get_channel_layer())
+    sent = 0
+    for alias in sharding.databases():
+        with sharding.use_shard(alias):
+            sent += _dispatch_batch(alias, batch_size, broadcaster)
+    return sent
+
+
+def _dispatch_batch(alias, batch_size, broadcaster):
+    # Claim, send, record: no transaction is open while the broker is slow,
+    # so the dispatcher never holds the database's write lock during I/O
+    now = timezone.now()
+    events = _claim(alias, batch_size, now)
+    if not events:
+        return 0
+
+    errors = async_to_sync(_send_events)(broadcaster, events)
+
+    now = timezone.now()
+    sent, failed = [], []
+    for event in events:
+        if event.id in errors:
+            # All events of a group travel in one frame, so they fail and
+            # are retried together, in their original order
+            event.attempts += 1
+            event.last_error = str(errors[event.id])
+            event.available_at = now + retry_delay(event.attempts)
+            failed.append(event)
+        else:
+            event.dispatched_at = now
+            sent.append(event)
+
+    with transaction.atomic(using=alias):
+        if sent:
+            OutboxEvent.objects.bulk_update(sent, ['dispatched_at'])
+        if failed:
+            OutboxEvent.objects.bulk_update(failed, ['attempts', 'last_error', 'available_at'])
+    return len(sent)
+
+
+def _claim(alias, batch_size, now):
+    """
+    Picks the next batch and leases it for CLAIM_SECONDS by pushing its
+    available_at forward. Other dispatchers skip leased events (and the
+    rest of their groups); if this one dies, they are sent again once the
+    lease runs out.
+    """
+    lease_until = now + timedelta(seconds=CLAIM_SECONDS)
+    with transaction.atomic(using=alias):
+        waiting = OutboxEvent.objects.filter(dispatched_at__isnull=True)
+        queryset = waiting.filter(
+            available_at__lte=now
+        ).exclude(
+            # Groups with an older event waiting for a retry (or being sent) must stay in order
+            group__in=waiting.filter(available_at__gt=now).values('group')
+        ).order_by('id')
+        if connections[alias].features.has_select_for_update_skip_locked:
+            # Lets several dispatchers run side by side without sending twice
+            queryset = queryset.select_for_update(skip_locked=True)
+        events = list(queryset[:batch_size])
+        if not events:
+            return []
+        claimed = OutboxEvent.objects.filter(
+            pk__in=[event.id for event in events], dispatched_at__isnull=True, available_at__lte=now
+        ).update(available_at=lease_until)
+        if claimed != len(events):
+            # Another dispatcher got to some of them first; keep only ours
+            events = list(OutboxEvent.objects.filter(
+                pk__in=[event.id for event in events], available_at=lease_until
+            ).order_by('id'))
+    return events
+
+
+def purge_dispatched(older_than):
+    """
+    Deletes events that were delivered more than `older_than` (a timedelta) ago.
+    """
+    deleted = 0
+    for alias in sharding.databases():
+        with sharding.use_shard(alias):
+            count, _ = OutboxEvent.objects.filter(
+                dispatched_at__lt=timezone.now() - older_than
+            ).delete()
+        deleted += count
+    return deleted
+
+
+def run_dispatcher(broadcaster=None, batch_size=100, interval=None, keep=timedelta(hours=24),
+                   stop=None, on_tick=None):
+    """
+    Keeps draining the outbox until `stop` (a threading.Event) is set.
+    Sleeps `interval` seconds (default: the coalescing window) whenever the
+    outbox is empty. `on_tick(broadcaster)` is called after every poll.
+    """
+    broadcaster = broadcaster or CoalescingBroadcaster()
+    interval = settings.BROADCAST_COALESCE_WINDOW if interval is None else interval
+    stop = stop or threading.Event()
+    last_purge = time.monotonic()
+
+    while not stop.is_set():
+        try:
+            sent = dispatch_pending(batch_size, broadcaster=broadcaster)
+            if time.monotonic() - last_purge > 600:
+                purge_dispatched(keep)
+                last_purge = time.monotonic()
+        except Exception:
+            # e.g. the database is briefly unavailable; keep the worker alive
+            logger.exception("Outbox dispatch failed")
+            close_old_connections()
+            sent = 0
+
+        if on_tick:
+            on_tick(broadcaster)
+        if sent < batch_size:
+            stop.wait(interval)
+
+
+def start_dispatcher_thread(**kwargs):
+    """
+    Runs run_dispatcher() in a daemon thread of the current process. Used
+    with the in-process channel layer, where a separate dispatch_outbox
+    process could not reach the consumers.
+    """
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=run_dispatcher, kwargs={**kwargs, 'stop': stop}, name='outbox-dispatcher', daemon=True
+    )
+    thread.start()
+    return thread, stop
@@ -0,0 +1,111 @@
+# menu/pagination.py
+
+import base64
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import archive
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (created_at, id). The cursor holds the last row of
+    the previous page and the next page is read with a range condition from
+    there, so it costs the same however deep the client pages, and rows
+    added meanwhile don't shift the pages.
+
+    It is opt-in: requests without ?cursor= or ?page_size= get the plain
+    list, as before. Views that also read bills from the order archive
+    provide them through an `archived_bills(after, descending)` method. Paginated responses look like
+    {"next": <url or null>, "results": [...]}.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+    # Newest first; set to False to page from the oldest row
+    descending = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if self.descending:
+            queryset = queryset.order_by('-created_at', '-id')
+        else:
+            queryset = queryset.order_by('created_at', 'id')
+
+        encoded = params.get(self.cursor_query_param)
+        position = None
+        if encoded:
+            position = created_at, pk = self.decode_cursor(encoded)
+            if self.descending:
+                after = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            else:
+                after = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            queryset = queryset.filter(after)
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset[:self.page_size + 1])
+        archived = getattr(view, 'archived_bills', None)
+        if archived is not None:
+            # Merge in the page's share of the bills kept outside the database
+            rows = list(islice(
+                archive.merge([rows, archived(after=position, descending=self.descending)], self.descending),
+                self.page_size + 1
+            ))
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row):
+        raw = f'{row.created_at.isoformat()}|{row.pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, encoded):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OldestFirstKeysetPagination(KeysetPagination):
+    descending = False
@@ -0,0 +1,223 @@
+# menu/sales.py
+
+from contextlib import nullcontext
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import DecimalField, F, Max, Q, Sum
+from django.db.models.functions import Coalesce
+
+from restaurants.models import Restaurant
+
+from . import archive, sharding
+from .models import Bill, DailySales, MenuItemVariant, OrderItem
+
+
+def _paid_item_totals(order_items):
+    """
+    Groups order items by (restaurant, business day, variant) and sums what
+    was charged for them. Declined items are not charged (see billing.py).
+    """
+    return order_items.exclude(
+        status=OrderItem.OrderStatus.DECLINED
+    ).values(
+        'bill__restaurant_id', 'business_date', 'variant_id'
+    ).annotate(
+        total_quantity=Sum('quantity'),
+        # Rows created before the price snapshot existed may not be backfilled yet
+        total_revenue=Sum(
+            F('quantity') * Coalesce('unit_price', 'variant__price'),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
+        ),
+        latest_item_id=Max('id'),
+    ).order_by()
+
+
+def _with_names(totals):
+    # Each row is labelled with the snapshot names of its most recent order item
+    ids = [row['latest_item_id'] for row in totals]
+    names = {}
+    for start in range(0, len(ids), 500):
+        for pk, item_name, variant_name in OrderItem.objects.filter(
+            pk__in=ids[start:start + 500]
+        ).values_list('pk', 'item_name', 'variant_name'):
+            names[pk] = (item_name, variant_name)
+    for row in totals:
+        row['item_name'], row['variant_name'] = names[row['latest_item_id']]
+    return totals
+
+
+def record_paid_bill(bill):
+    """
+    Adds a bill that has just been paid to the daily sales rollup. Call it in
+    the same transaction that marks the bill paid, once per bill.
+    """
+    for row in _with_names(list(_paid_item_totals(OrderItem.objects.filter(bill=bill)))):
+        key = {
+            'restaurant_id': row['bill__restaurant_id'],
+            'business_date': row['business_date'],
+            'variant_id': row['variant_id'],
+        }
+        changes = {
+            'quantity': F('quantity') + row['total_quantity'],
+            'revenue': F('revenue') + row['total_revenue'],
+            'item_name': row['item_name'],
+            'variant_name': row['variant_name'],
+        }
+        if DailySales.objects.filter(**key).update(**changes):
+            continue
+        try:
+            with sharding.atomic():
+                DailySales.objects.create(
+                    **key, item_name=row['item_name'], variant_name=row['variant_name'],
+                    quantity=row['total_quantity'], revenue=row['total_revenue']
+                )
+        except IntegrityError:
+            # Another bill for the same day and dish created the row first
+            DailySales.objects.filter(**key).update(**changes)
+
+
+def _with_archived(totals, restaurant, since):
+    # Adds the archived bills' items (see archive.py) to the live totals
+    restaurant_ids = [restaurant.id] if restaurant is not None else archive.restaurant_ids()
+    archived = [row for restaurant_id in restaurant_ids for row in archive.paid_item_totals(restaurant_id, since)]
+    if not archived:
+        return totals
+
+    # Variants deleted since stay in the rollup, without the link
+    existing = set(MenuItemVariant.objects.filter(
+        pk__in={row['variant_id'] for row in archived}
+    ).values_list('pk', flat=True))
+    combined = {(row['bill__restaurant_id'], row['business_date'], row['variant_id']): row for row in totals}
+    for row in archived:
+        if row['variant_id'] not in existing:
+            row['variant_id'] = None
+        key = (row['bill__restaurant_id'], row['business_date'], row['variant_id'])
+        current = combined.setdefault(key, row)
+        if current is row:
+            continue
+        current['total_quantity'] += row['total_quantity']
+        current['total_revenue'] += row['total_revenue']
+        if row['latest_item_id'] > current['latest_item_id']:
+            for name in ('latest_item_id', 'item_name', 'variant_name'):
+                current[name] = row[name]
+    return list(combined.values())
+
+
+def rebuild(restaurant=None, since=None):
+    """
+    Recomputes the rollup from the paid bills, live and archived, for one
+    restaurant or all of them, and from the `since` business day on or for
+    all time. Returns the number of rows written.
+    """
+    if restaurant is None and settings.ORDER_SHARDS:
+        # Each restaurant's rows are on its own shard
+        return sum(rebuild(each, since) for each in Restaurant.objects.all())
+
+    with sharding.for_restaurant(restaurant) if restaurant is not None else nullcontext():
+        rollup = DailySales.objects.all()
+        order_items = OrderItem.objects.filter(bill__payment_status=Bill.PaymentStatus.PAID)
+        if restaurant is not None:
+            rollup = rollup.filter(restaurant=restaurant)
+            order_items = order_items.filter(bill__restaurant=restaurant)
+        totals = _paid_item_totals(order_items)
+        if since is not None:
+            rollup = rollup.filter(business_date__gte=since)
+            totals = totals.filter(business_date__gte=since)
+
+        with sharding.atomic():
+            rollup.delete()
+            totals = _with_archived(_with_names(list(totals)), restaurant, since)
+            DailySales.objects.bulk_create([
+                DailySales(
+                    restaurant_id=row['bill__restaurant_id'],
+                    business_date=row['business_date'],
+                    variant_id=row['variant_id'],
+                    item_name=row['item_name'],
+                    variant_name=row['variant_name'],
+                    quantity=row['total_quantity'],
+                    revenue=row['total_revenue'],
+                ) for row in totals
+            ], batch_size=500)
+        return len(totals)
+
+
+def _top_dish(dishes, key):
+    dishes = [dish for dish in dishes if dish[key]]
+    if not dishes:
+        return "N/A"
+    # max() keeps the first of equal dishes; sorting by name first keeps ties stable
+    dishes.sort(key=lambda dish: (dish['item_name'], dish['variant_name']))
+    top = max(dishes, key=lambda dish: dish[key])
+    return f"{top['item_name']} ({top['variant_name']})"
+
+
+def _windows(restaurant):
+    """
+    Conditions for this month's and today's rollup rows. Each restaurant's
+    "today" is its own current business day, so with several restaurants
+    they are grouped by that day.
+    """
+    restaurants = [restaurant] if restaurant is not None else Restaurant.objects.only('time_zone', 'day_cutoff_hour')
+    by_today = {}
+    for each in restaurants:
+        by_today.setdefault(each.business_date(), []).append(each.id)
+
+    this_month, is_today = Q(pk__in=[]), Q(pk__in=[])
+    for today, restaurant_ids in by_today.items():
+        this_month |= Q(restaurant_id__in=restaurant_ids, business_date__range=(today.replace(day=1), today))
+        is_today |= Q(restaurant_id__in=restaurant_ids, business_date=today)
+    return this_month, is_today
+
+
+def _dish_sales(this_month, is_today):
+    return list(DailySales.objects.filter(this_month).values('item_name', 'variant_name').annotate(
+        quantity_today=Sum('quantity', filter=is_today, default=0),
+        quantity_month=Sum('quantity'),
+        revenue_today=Sum('revenue', filter=is_today, default=Decimal('0')),
+        revenue_month=Sum('revenue'),
+    ).order_by())
+
+
+def _merged(results):
+    # Adds up the shards' figures of the same dish
+    if len(results) == 1:
+        return results[0]
+    dishes = {}
+    for dish in (dish for result in results for dish in result):
+        key = (dish['item_name'], dish['variant_name'])
+        if key not in dishes:
+            dishes[key] = dish
+            continue
+        for name in ('quantity_today', 'quantity_month', 'revenue_today', 'revenue_month'):
+            dishes[key][name] += dish[name]
+    return list(dishes.values())
+
+
+def dashboard(restaurant=None):
+    """
+    Today's and this month's sales and best-selling dishes, for one
+    restaurant or all of them.
+
+    The sales come from a single grouped scan of this month's rollup rows,
+    with conditional aggregates for the two windows, so the cost depends on
+    the size of the menu, not of the order history. Without a restaurant,
+    one more query reads every restaurant's business day, and the scan runs
+    on every shard at once.
+    """
+    this_month, is_today = _windows(restaurant)
+    if restaurant is not None:
+        with sharding.for_restaurant(restaurant):
+            dishes = _dish_sales(this_month, is_today)
+    else:
+        dishes = _merged(sharding.scatter_gather(lambda alias: _dish_sales(this_month, is_today)))
+
+    sales_today = sum((dish['revenue_today'] for dish in dishes), Decimal('0'))
+    sales_this_month = sum((dish['revenue_month'] for dish in dishes), Decimal('0'))
+    return {
+        'sales_today': f"{sales_today:.2f}",
+        'sales_this_month': f"{sales_this_month:.2f}",
+        'top_dish_today': _top_dish(dishes, 'quantity_today'),
+        'top_dish_this_month': _top_dish(dishes, 'quantity_month'),
+    }
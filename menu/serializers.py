@@ -2,6 +2,8 @@
 
 from rest_framework import serializers
 from .models import Category, MenuItem, MenuItemVariant, Bill, OrderItem , FoodType, Cuisine, Category
+from . import billing
+from . import sharding
 
 # --- Read-Only Serializers (for displaying the menu) ---
 
@@ -24,6 +26,21 @@ class CategorySerializer(serializers.ModelSerializer):
 
 # --- Write-Only Serializers (for creating orders) ---
 
+class OrderItemWriteListSerializer(serializers.ListSerializer):
+    """
+    Looks up the variants of all submitted items with a single query and
+    attaches them to the validated data as 'variant'.
+    """
+    def validate(self, attrs):
+        variant_ids = {item_data['variant_id'] for item_data in attrs}
+        variants = MenuItemVariant.objects.select_related('menu_item').in_bulk(variant_ids)
+        missing = variant_ids - variants.keys()
+        if missing:
+            raise serializers.ValidationError(f"Invalid variant_id(s): {sorted(missing)}")
+        for item_data in attrs:
+            item_data['variant'] = variants[item_data['variant_id']]
+        return attrs
+
 class OrderItemWriteSerializer(serializers.ModelSerializer):
     """
     This serializer is ONLY for validating the items in a NEW order.
@@ -32,6 +49,7 @@ class OrderItemWriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['variant_id', 'quantity']
+        list_serializer_class = OrderItemWriteListSerializer
 
 class BillSerializer(serializers.ModelSerializer):
     """
@@ -46,19 +64,19 @@ class BillSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         order_items_data = validated_data.pop('order_items')
-        bill = Bill.objects.create(**validated_data)
-        for item_data in order_items_data:
-            OrderItem.objects.create(
-                bill=bill,
-                variant_id=item_data['variant_id'],
-                quantity=item_data['quantity']
-            )
+        with sharding.atomic():
+            bill = Bill.objects.create(**validated_data)
+            order_items = OrderItem.objects.bulk_create([
+                OrderItem.from_variant(item_data['variant'], bill=bill, quantity=item_data['quantity'])
+                for item_data in order_items_data
+            ])
+            billing.items_added(bill, order_items)
         return bill
 
 class CashierOrderItemSerializer(serializers.ModelSerializer):
-    name = serializers.CharField(source='variant.menu_item.name', read_only=True)
-    variant_name = serializers.CharField(source='variant.variant_name', read_only=True)
-    price = serializers.DecimalField(source='variant.price', max_digits=10, decimal_places=2, read_only=True)
+    # Read from the order-time snapshot, not the current menu
+    name = serializers.CharField(source='item_name', read_only=True)
+    price = serializers.DecimalField(source='unit_price', max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = OrderItem
@@ -74,8 +92,8 @@ class CashierBillSerializer(serializers.ModelSerializer):
         fields = ['id', 'customer_name', 'table_number', 'payment_status', 'created_at', 'order_items', 'total_price']
 
     def get_total_price(self, bill):
-        # This method calculates the total price by summing up all items
-        return sum(item.variant.price * item.quantity for item in bill.order_items.all())
+        # The total is kept up to date on the bill itself (see menu/billing.py)
+        return bill.subtotal
 
 class MenuItemVariantWriteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -179,8 +197,8 @@ class RestaurantOrderListSerializer(serializers.ModelSerializer):
         ]
 
     def get_total_price(self, bill):
-        # Calculates the total price for the bill
-        return sum(item.variant.price * item.quantity for item in bill.order_items.all())
+        # Read the stored total instead of summing the items
+        return bill.subtotal
 
 class FrontendOrderItemSerializer(serializers.Serializer):
     """
@@ -199,8 +217,7 @@ class FrontendOrderSerializer(serializers.Serializer):
     items = FrontendOrderItemSerializer(many=True)
 
 class KitchenOrderItemSerializer(serializers.ModelSerializer):
-    name = serializers.CharField(source='variant.menu_item.name', read_only=True)
-    variant_name = serializers.CharField(source='variant.variant_name', read_only=True)
+    name = serializers.CharField(source='item_name', read_only=True)
 
     class Meta:
         model = OrderItem
@@ -213,3 +230,20 @@ class KitchenOrderSerializer(serializers.ModelSerializer):
         model = Bill
         fields = ['id', 'table_number', 'customer_name', 'created_at', 'order_items']
 
+
+class OrderItemStatusUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=OrderItem.OrderStatus.choices)
+
+class BulkOrderItemStatusSerializer(serializers.Serializer):
+    """
+    Validates a batch of status changes from the kitchen, e.g.
+    {"items": [{"id": 12, "status": "ACCEPTED"}, {"id": 13, "status": "COMPLETED"}]}
+    """
+    items = OrderItemStatusUpdateSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, value):
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each order item may only appear once.")
+        return value
@@ -0,0 +1,462 @@
+# menu/sharding.py
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, models, transaction
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from restaurants import context
+from restaurants.models import Restaurant
+
+from .models import (
+    Bill, Category, Cuisine, DailySales, FoodType, KitchenEvent, KitchenStream, MenuItem,
+    MenuItemVariant, OrderItem, RestaurantMove,
+)
+
+# Each restaurant's menu, orders, kitchen log and sales live on one database,
+# its shard: 'default' or one of settings.ORDER_SHARDS, as recorded in
+# Restaurant.shard (the shard map). ShardRouter (restromanager/routers.py)
+# sends the menu app's queries to the shard of the restaurant in scope: the
+# request's restaurant (ShardMiddleware) or the one given to for_restaurant().
+# Restaurants, users and the tables shared by all restaurants stay on
+# 'default'; every shard keeps a copy of the rows its tables refer to.
+
+# Shared by every restaurant: on 'default', copied to each shard
+REFERENCE_MODELS = (Restaurant, FoodType, Cuisine)
+
+# The rows that move with a restaurant, parents first, as (model, lookup of
+# the restaurant, field that changes whenever the row does or None)
+MOVING_ROWS = (
+    (Category, 'restaurant', 'updated_at'),
+    (MenuItem, 'restaurant', 'updated_at'),
+    (MenuItem.food_types.through, 'menuitem__restaurant', None),
+    (MenuItem.cuisines.through, 'menuitem__restaurant', None),
+    (MenuItemVariant, 'menu_item__restaurant', 'updated_at'),
+    (Bill, 'restaurant', 'updated_at'),
+    (OrderItem, 'bill__restaurant', 'updated_at'),
+    (KitchenStream, 'restaurant', None),
+    (KitchenEvent, 'restaurant', 'created_at'),
+    (DailySales, 'restaurant', None),
+)
+
+# A catch-up pass also copies rows changed this long before the previous
+# pass started, in case their transaction hadn't committed yet
+CATCH_UP_OVERLAP = timedelta(minutes=5)
+
+BATCH_SIZE = 500
+
+_scope = contextvars.ContextVar('shard_scope', default=None)
+_checked = contextvars.ContextVar('shard_checked', default=None)
+
+
+class RestaurantMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'This restaurant is moving to another database. Please try again in a minute.'
+    default_code = 'restaurant_moving'
+
+
+def databases():
+    return [DEFAULT_DB_ALIAS, *settings.ORDER_SHARDS]
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'menu' and model not in REFERENCE_MODELS
+
+
+# --- Scope ---
+
+@contextmanager
+def use_shard(alias, restaurant_id=None):
+    """
+    Sends the block's menu and order queries to `alias`, e.g. to visit
+    every shard in turn.
+    """
+    token = _scope.set(lambda: (alias, restaurant_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def for_restaurant(restaurant):
+    """
+    Sends the block's menu and order queries to the restaurant's shard.
+    Code that runs outside a request (commands, consumers) needs this.
+    """
+    return use_shard(restaurant.shard, restaurant.pk)
+
+
+def current():
+    """
+    The (database alias, restaurant id) queries go to at this point. The
+    restaurant id is None outside a restaurant's scope.
+    """
+    resolve = _scope.get()
+    return resolve() if resolve is not None else (DEFAULT_DB_ALIAS, None)
+
+
+def current_database():
+    return current()[0]
+
+
+def shard_of(restaurant_id):
+    restaurant = context.get_restaurant(pk=restaurant_id)
+    return restaurant.shard if restaurant is not None else None
+
+
+def database_of(instance):
+    """
+    The database that holds, or is to hold, a model instance: the one it
+    was loaded from, else its restaurant's shard, else that of a parent row
+    it has loaded (an order item's bill, say). None when it can't tell.
+    """
+    if isinstance(instance, Restaurant):
+        return instance.shard
+    if not is_sharded(type(instance)):
+        return None
+    if instance._state.db in databases():
+        return instance._state.db
+    restaurant_id = getattr(instance, 'restaurant_id', None)
+    if restaurant_id is not None:
+        return shard_of(restaurant_id)
+    for field in instance._meta.concrete_fields:
+        if field.is_relation and field.is_cached(instance):
+            parent = field.get_cached_value(instance)
+            alias = database_of(parent) if parent is not None else None
+            if alias is not None:
+                return alias
+    return None
+
+
+def _request_scope(request):
+    # request.restaurant (see restaurants/middleware.py) is resolved on first use
+    restaurant = getattr(request, 'restaurant', None)
+    if restaurant is None:
+        return DEFAULT_DB_ALIAS, None
+    try:
+        return restaurant.shard, restaurant.pk
+    except Http404:
+        return DEFAULT_DB_ALIAS, None
+
+
+class ShardMiddleware:
+    """
+    Sends the menu and order queries of a request to the shard of
+    request.restaurant, or to 'default' when the request has none.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _scope.set(lambda: _request_scope(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _scope.reset(token)
+
+
+# --- Transactions ---
+
+@contextmanager
+def atomic():
+    """
+    transaction.atomic() on the current shard. The first one of a block
+    also checks that the restaurant hasn't moved off this shard since this
+    process looked it up, and raises RestaurantMoving if it has, so the
+    write isn't left behind on the old shard.
+    """
+    alias, restaurant_id = current()
+    with transaction.atomic(using=alias):
+        token = None
+        if settings.ORDER_SHARDS and restaurant_id is not None and _checked.get() != (alias, restaurant_id):
+            if RestaurantMove.objects.using(alias).filter(restaurant_id=restaurant_id).exists():
+                context.forget(restaurant_id)
+                raise RestaurantMoving()
+            token = _checked.set((alias, restaurant_id))
+        try:
+            yield
+        finally:
+            if token is not None:
+                _checked.reset(token)
+
+
+class ShardAtomicMixin:
+    """
+    For viewsets that write menu rows without a transaction of their own:
+    runs their writes in atomic(), so they can't land on an old shard.
+    """
+
+    def create(self, request, *args, **kwargs):
+        with atomic():
+            return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        with atomic():
+            return super().update(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        with atomic():
+            return super().destroy(request, *args, **kwargs)
+
+
+# --- Queries across shards ---
+
+def scatter_gather(query, aliases=None):
+    """
+    Calls query(alias) for every database (default and each shard), in
+    parallel threads, and returns the results in the same order. Each call
+    runs in the database's scope, so plain querysets go to that database.
+    """
+    aliases = databases() if aliases is None else list(aliases)
+
+    def run(alias):
+        with use_shard(alias):
+            return query(alias)
+
+    def run_in_thread(alias):
+        try:
+            return run(alias)
+        finally:
+            # Connections are per thread; don't leave them to the garbage collector
+            connections.close_all()
+
+    # A database with a transaction open in this thread is read here, so the
+    # query sees it (and doesn't wait on its locks)
+    inline = [len(aliases) == 1 or connections[alias].in_atomic_block for alias in aliases]
+    if all(inline):
+        return [run(alias) for alias in aliases]
+    with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+        # Each thread gets a copy of the caller's context (e.g. replica_reads())
+        futures = [
+            None if here else executor.submit(contextvars.copy_context().run, run_in_thread, alias)
+            for alias, here in zip(aliases, inline)
+        ]
+        return [run(alias) if future is None else future.result() for alias, future in zip(aliases, futures)]
+
+
+# --- Copying rows between databases ---
+
+def _sharded_tables():
+    # The sharded tables with an id sequence, many-to-many tables included
+    return [
+        model._meta.db_table for model in apps.get_app_config('menu').get_models(include_auto_created=True)
+        if is_sharded(model) and isinstance(model._meta.pk, models.AutoField)
+    ]
+
+
+def _write(model, alias, rows):
+    """
+    Inserts or overwrites rows of `model` on `alias`. Rows are tuples of
+    the model's concrete field values, in field order. Plain SQL rather
+    than bulk_create, so auto_now timestamps are copied as they are and no
+    signals fire. Returns the number of rows written.
+    """
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    columns = [quote(field.column) for field in fields]
+    updates = ', '.join(f'{column} = excluded.{column}' for field, column in zip(fields, columns) if not field.primary_key)
+    sql = (
+        f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({quote(model._meta.pk.column)}) DO UPDATE SET {updates}"
+    )
+    written = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append([field.get_db_prep_save(value, connection) for field, value in zip(fields, row)])
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            written += len(batch)
+    return written
+
+
+def _copy(queryset, alias):
+    fields = queryset.model._meta.concrete_fields
+    rows = queryset.order_by().values_list(*[field.attname for field in fields]).iterator(chunk_size=BATCH_SIZE)
+    return _write(queryset.model, alias, rows)
+
+
+def _delete(model, alias, pks):
+    # Plain SQL as well: cascades and signals would touch rows that aren't moving
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), BATCH_SIZE):
+            batch = pks[start:start + BATCH_SIZE]
+            cursor.execute(
+                f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} "
+                f"IN ({', '.join(['%s'] * len(batch))})", batch
+            )
+
+
+def _sequences(alias):
+    # {table: last id handed out} of the SQLite database's AUTOINCREMENT tables
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT name, seq FROM sqlite_sequence')
+            return dict(cursor.fetchall())
+    except DatabaseError:
+        # Not migrated yet
+        return {}
+
+
+def reserve_id_range(alias, tables=None):
+    """
+    Moves the id sequences of the sharded tables (or just `tables`) on
+    `alias` to a fresh block of SHARD_ID_BLOCK ids, above every id any
+    database has handed out. A database only ever hands out ids from its
+    own block, so rows keep their ids when their restaurant moves.
+    SQLite only: it numbers new rows after the highest id in the table.
+    """
+    tables = _sharded_tables() if tables is None else tables
+    highest = {}
+    for each in databases():
+        for table, seq in _sequences(each).items():
+            highest[table] = max(highest.get(table, 0), seq)
+    block = settings.SHARD_ID_BLOCK
+    with connections[alias].cursor() as cursor:
+        for table in tables:
+            start = (highest.get(table, 0) // block + 1) * block
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
+            if not cursor.rowcount:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+
+
+def copy_reference_rows(alias):
+    # Restaurants and the shared tags, which the shard's tables refer to
+    for model in REFERENCE_MODELS:
+        _copy(model._base_manager.using(DEFAULT_DB_ALIAS).all(), alias)
+
+
+def prepare_shard(alias):
+    """
+    Readies a newly migrated shard: copies the reference rows and gives it
+    its own id block. Runs after `migrate --database <alias>`.
+    """
+    copy_reference_rows(alias)
+    sequences = _sequences(alias)
+    reserve_id_range(alias, [
+        table for table in _sharded_tables() if sequences.get(table, 0) < settings.SHARD_ID_BLOCK
+    ])
+
+
+def mirror(instance):
+    """
+    Copies a reference row saved on 'default' to every shard.
+    """
+    fields = type(instance)._meta.concrete_fields
+    row = tuple(getattr(instance, field.attname) for field in fields)
+    for alias in settings.ORDER_SHARDS:
+        _write(type(instance), alias, [row])
+
+
+def unmirror(model, pk):
+    # The shard's rows that refer to it go with it, as they did on 'default'
+    for alias in settings.ORDER_SHARDS:
+        with use_shard(alias):
+            model._base_manager.using(alias).filter(pk=pk).delete()
+
+
+# --- Moving a restaurant ---
+
+def _rows(model, lookup, restaurant, alias):
+    return model._base_manager.using(alias).filter(**{lookup: restaurant.pk})
+
+
+def _sync(restaurant, source, target, since=None):
+    """
+    Makes the target's copy of the restaurant's rows match the source:
+    deletes the rows the source no longer has and writes those changed
+    since `since` (all of them when None). Returns the number of rows written.
+    """
+    written = 0
+    with transaction.atomic(using=target):
+        before = _sequences(target)
+        for model, lookup, _ in reversed(MOVING_ROWS):
+            kept = set(_rows(model, lookup, restaurant, source).values_list('pk', flat=True))
+            _delete(model, target, [
+                pk for pk in _rows(model, lookup, restaurant, target).values_list('pk', flat=True) if pk not in kept
+            ])
+        for model, lookup, changed in MOVING_ROWS:
+            rows = _rows(model, lookup, restaurant, source)
+            if since is not None and changed is not None:
+                rows = rows.filter(**{f'{changed}__gte': since})
+            written += _copy(rows, target)
+
+        # The copied ids may come from a higher block than the target's own;
+        # its new rows then need a block of their own again
+        block = settings.SHARD_ID_BLOCK
+        after = _sequences(target)
+        moved_up = [table for table, seq in after.items() if seq // block > before.get(table, 0) // block]
+        if moved_up:
+            reserve_id_range(target, moved_up)
+    return written
+
+
+def move_restaurant(restaurant, target, wait=None, log=None):
+    """
+    Moves the restaurant's rows from its shard to `target` while it keeps
+    taking orders:
+
+    1. Copies everything, then what changed during the copy.
+    2. Blocks the restaurant's writes on the old shard with a RestaurantMove
+       row, copies the last changes and points the shard map at `target`.
+       Processes that still have the old shard cached get RestaurantMoving
+       on writes.
+    3. Waits `wait` seconds (default RESTAURANT_CONTEXT_TTL), until every
+       process has looked the restaurant up again, and deletes its rows
+       from the old shard.
+
+    The RestaurantMove row stays behind on the old shard.
+    """
+    log = log or (lambda message: None)
+    source = restaurant.shard
+    wait = settings.RESTAURANT_CONTEXT_TTL if wait is None else wait
+
+    copy_reference_rows(target)
+    # It may be moving back
+    RestaurantMove.objects.using(target).filter(restaurant=restaurant).delete()
+
+    since = None
+    for name in ('Copied', 'Caught up'):
+        started = timezone.now()
+        written = _sync(restaurant, source, target, since)
+        log(f"{name} {written} rows from '{source}' to '{target}'")
+        since = started - CATCH_UP_OVERLAP
+
+    with transaction.atomic(using=source):
+        # Taking the write lock first: the restaurant's writes on the old
+        # shard wait for this transaction, then see the row and give up
+        RestaurantMove.objects.using(source).update_or_create(restaurant=restaurant, defaults={'moved_to': target})
+        written = _sync(restaurant, source, target, since)
+        restaurant.shard = target
+        restaurant.save(update_fields=['shard'])
+    log(f"Caught up {written} rows and switched to '{target}'")
+
+    if wait:
+        log(f"Waiting {wait:g}s for every process to notice")
+        time.sleep(wait)
+    for model, lookup, _ in reversed(MOVING_ROWS):
+        pks = list(_rows(model, lookup, restaurant, source).values_list('pk', flat=True))
+        for start in range(0, len(pks), BATCH_SIZE):
+            # Short transactions, so the old shard's other restaurants can keep writing
+            with transaction.atomic(using=source):
+                _delete(model, source, pks[start:start + BATCH_SIZE])
+    log(f"Deleted the restaurant's rows from '{source}'")
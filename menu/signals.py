@@ -0,0 +1,95 @@
+# menu/signals.py
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed, post_migrate
+from django.dispatch import receiver
+from restaurants.models import Restaurant
+from .models import Category, MenuItem, MenuItemVariant, FoodType, Cuisine, Bill, OrderItem
+from . import cache as menu_cache
+from . import billing
+from . import sharding
+
+
+# --- Public menu cache invalidation ---
+# The versions are bumped once the write commits: a public GET in between
+# would otherwise cache the old rows under the new version.
+
+@receiver([post_save, post_delete], sender=MenuItem)
+@receiver([post_save, post_delete], sender=Category)
+def bump_menu_for_restaurant_object(sender, instance, using, **kwargs):
+    restaurant_id = instance.restaurant_id
+    transaction.on_commit(lambda: menu_cache.bump_menu_version(restaurant_id), using=using)
+
+
+@receiver([post_save, post_delete], sender=MenuItemVariant)
+def bump_menu_for_variant(sender, instance, using, **kwargs):
+    # The variant only knows its menu item, so look up the restaurant.
+    # The menu item may already be gone when this fires from a cascade delete,
+    # in which case its own post_delete has bumped the version.
+    restaurant_id = MenuItem.objects.using(using).filter(
+        pk=instance.menu_item_id
+    ).values_list('restaurant_id', flat=True).first()
+    if restaurant_id is not None:
+        transaction.on_commit(lambda: menu_cache.bump_menu_version(restaurant_id), using=using)
+
+
+@receiver(m2m_changed, sender=MenuItem.food_types.through)
+@receiver(m2m_changed, sender=MenuItem.cuisines.through)
+def bump_menu_for_tags(sender, instance, action, reverse, using, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # A FoodType/Cuisine was (un)linked from its side; it may touch many restaurants
+        transaction.on_commit(menu_cache.bump_taxonomy_version, using=using)
+    else:
+        restaurant_id = instance.restaurant_id
+        transaction.on_commit(lambda: menu_cache.bump_menu_version(restaurant_id), using=using)
+
+
+@receiver([post_save, post_delete], sender=FoodType)
+@receiver([post_save, post_delete], sender=Cuisine)
+def bump_taxonomy(sender, instance, using, **kwargs):
+    transaction.on_commit(menu_cache.bump_taxonomy_version, using=using)
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def bump_menu_for_restaurant(sender, instance, using, **kwargs):
+    restaurant_id = instance.pk
+    transaction.on_commit(lambda: menu_cache.bump_menu_version(restaurant_id), using=using)
+
+
+# --- Bill totals ---
+
+@receiver(post_delete, sender=OrderItem)
+def remove_item_from_bill_totals(sender, instance, origin=None, **kwargs):
+    # Nothing to keep in sync when the whole bill is being deleted
+    if isinstance(origin, Bill) or getattr(origin, 'model', None) is Bill:
+        return
+    billing.item_removed(instance)
+
+
+# --- Shards (see sharding.py) ---
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_save, sender=FoodType)
+@receiver(post_save, sender=Cuisine)
+def copy_reference_row_to_shards(sender, instance, using, **kwargs):
+    # Saves on a shard are these copies themselves
+    if settings.ORDER_SHARDS and using == DEFAULT_DB_ALIAS:
+        transaction.on_commit(lambda: sharding.mirror(instance), using=using)
+
+
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_delete, sender=FoodType)
+@receiver(post_delete, sender=Cuisine)
+def delete_reference_row_from_shards(sender, instance, using, **kwargs):
+    if settings.ORDER_SHARDS and using == DEFAULT_DB_ALIAS:
+        pk = instance.pk
+        transaction.on_commit(lambda: sharding.unmirror(sender, pk), using=using)
+
+
+@receiver(post_migrate)
+def prepare_new_shard(sender, using, **kwargs):
+    if sender.name == 'menu' and using in settings.ORDER_SHARDS:
+        sharding.prepare_shard(using)
@@ -5,6 +5,58 @@ from restaurants.models import Restaurant
 from .models import Category, MenuItem, MenuItemVariant
 from .models import Category, MenuItem, MenuItemVariant, Bill, OrderItem # Add Bill and OrderItem
 from django.test import override_settings # <-- ADD THIS IMPORT
+from django.test import AsyncRequestFactory
+from rest_framework.test import force_authenticate
+from .views import AdminOrderReportView
+import csv
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .models import FoodType, OutboxEvent
+from . import outbox
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.utils import timezone
+from users.models import RoleCredential, StaffUser
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.core.management import call_command
+from io import StringIO
+import asyncio
+import json
+from django.test import SimpleTestCase
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from .broadcast import CoalescingBroadcaster, encode_message
+from .routing import websocket_urlpatterns
+from unittest import mock
+from . import kitchen_events
+from .models import KitchenEvent
+from .models import DailySales
+from . import sales
+from . import exports
+from . import archive
+import shutil
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+import os
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipUnless
+from django.db.models import F, Q, Sum
+from django.test import TestCase
+import sqlite3
+from django.db import connections
+from django.conf import settings
+from . import sharding
+from .models import KitchenStream, RestaurantMove
+from restaurants import context
+from django.db import transaction
+from . import cache as menu_cache
 
 
 class MenuAPITests(APITestCase):
@@ -84,7 +136,7 @@ class MenuAPITests(APITestCase):
 
 @override_settings(CHANNEL_LAYERS={
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
     }
 })
 class OrderAPITests(APITestCase):
@@ -147,4 +199,1714 @@ class OrderAPITests(APITestCase):
         # Assert that the request was forbidden
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         # Assert that NO Bill was created in the database
-        self.assertEqual(Bill.objects.count(), 0)
\ No newline at end of file
+        self.assertEqual(Bill.objects.count(), 0)
+
+class PublicMenuCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(
+            name="Cache Cafe", slug="cache-cafe", latitude=10.0, longitude=10.0
+        )
+        self.category = Category.objects.create(restaurant=self.restaurant, name="Starters")
+        self.menu_item = MenuItem.objects.create(
+            restaurant=self.restaurant, category=self.category, name="Paneer Tikka"
+        )
+        self.variant = MenuItemVariant.objects.create(
+            menu_item=self.menu_item, variant_name="Full Plate", price=250.00
+        )
+        self.url = reverse('public-menu-list', kwargs={'restaurant_slug': self.restaurant.slug})
+
+    def test_menu_is_served_with_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertContains(response, "Paneer Tikka")
+
+    def test_matching_etag_returns_304_without_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_repeat_request_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Paneer Tikka")
+
+    def test_menu_changes_invalidate_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.variant.price = 300
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, "300.00")
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            veg = FoodType.objects.create(name="Veg")
+            self.menu_item.food_types.add(veg)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Veg")
+
+        etag = response['ETag']
+        veg.name = "Vegetarian"
+        with self.captureOnCommitCallbacks(execute=True):
+            veg.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Vegetarian")
+
+    def test_unavailable_items_drop_out_of_the_cached_menu(self):
+        self.client.get(self.url)
+        self.menu_item.is_available = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item.save()
+        response = self.client.get(self.url)
+        self.assertNotContains(response, "Paneer Tikka")
+
+    def test_version_changes_only_when_the_edit_commits(self):
+        version = menu_cache.get_menu_version(self.restaurant.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.menu_item.name = "Malai Tikka"
+                self.menu_item.save()
+                self.variant.price = 300
+                self.variant.save()
+                # A request now still reads the old rows: it must not cache them as the new version
+                self.assertEqual(menu_cache.get_menu_version(self.restaurant.id), version)
+            self.assertEqual(menu_cache.get_menu_version(self.restaurant.id), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(menu_cache.get_menu_version(self.restaurant.id), version)
+        self.assertContains(self.client.get(self.url), "Malai Tikka")
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class FrontendOrderCreateTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Bulk Diner", slug="bulk-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        self.menu_items = []
+        for index in range(20):
+            menu_item = MenuItem.objects.create(
+                restaurant=self.restaurant, category=category, name=f"Dish {index}"
+            )
+            MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Half", price=100)
+            MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Full", price=180)
+            self.menu_items.append(menu_item)
+        self.url = reverse('frontend-order-create', kwargs={'restaurant_slug': self.restaurant.slug})
+
+    def order(self, lines):
+        return {
+            "customer_name": "Asha",
+            "table_number": "7",
+            "items": [
+                {"menu_item_id": self.menu_items[i].id, "variant_name": "Full", "quantity": 2}
+                for i in range(lines)
+            ],
+        }
+
+    def test_order_creates_bill_and_items(self):
+        response = self.client.post(self.url, self.order(3), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        bill = Bill.objects.get(id=response.data['order_id'])
+        self.assertEqual(bill.order_items.count(), 3)
+        self.assertTrue(all(item.variant.variant_name == "Full" for item in bill.order_items.all()))
+
+    def test_query_count_does_not_grow_with_order_size(self):
+        # The restaurant's first order also sets up its kitchen event stream
+        self.client.post(self.url, self.order(1), format='json')
+        with CaptureQueriesContext(connection) as single_line:
+            self.client.post(self.url, self.order(1), format='json')
+        with CaptureQueriesContext(connection) as twenty_lines:
+            self.client.post(self.url, self.order(20), format='json')
+        self.assertEqual(len(single_line), len(twenty_lines))
+        self.assertEqual(OrderItem.objects.count(), 22)
+
+    def test_invalid_item_creates_nothing(self):
+        data = self.order(2)
+        data['items'].append({"menu_item_id": self.menu_items[0].id, "variant_name": "Jumbo", "quantity": 1})
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Bill.objects.count(), 0)
+        self.assertEqual(OrderItem.objects.count(), 0)
+
+    def test_item_from_another_restaurant_is_rejected(self):
+        other = Restaurant.objects.create(name="Other", slug="other", latitude=1, longitude=1)
+        other_category = Category.objects.create(restaurant=other, name="Mains")
+        other_item = MenuItem.objects.create(restaurant=other, category=other_category, name="Elsewhere")
+        MenuItemVariant.objects.create(menu_item=other_item, variant_name="Full", price=10)
+        data = self.order(1)
+        data['items'].append({"menu_item_id": other_item.id, "variant_name": "Full", "quantity": 1})
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Bill.objects.count(), 0)
+
+
+class BrokenChannelLayer:
+    """ A channel layer whose broker is down. """
+    async def group_send(self, group, message):
+        raise ConnectionError("broker unavailable")
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class OutboxTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Outbox Diner", slug="outbox-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        self.menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Dosa")
+        MenuItemVariant.objects.create(menu_item=self.menu_item, variant_name="Plain", price=80)
+        self.url = reverse('frontend-order-create', kwargs={'restaurant_slug': self.restaurant.slug})
+        self.layer = get_channel_layer()
+
+    def place_order(self):
+        return self.client.post(self.url, {
+            "customer_name": "Ravi", "table_number": "3",
+            "items": [{"menu_item_id": self.menu_item.id, "variant_name": "Plain", "quantity": 1}],
+        }, format='json')
+
+    def listen(self, group):
+        channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(group, channel)
+        return channel
+
+    def test_order_is_queued_not_sent_inline(self):
+        response = self.place_order()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.group, 'chef_notifications_outbox-diner')
+        self.assertEqual(event.data['bill_id'], response.data['order_id'])
+        self.assertIsNone(event.dispatched_at)
+
+    def test_dispatch_delivers_to_the_channel_layer(self):
+        channel = self.listen('chef_notifications_outbox-diner')
+        self.place_order()
+        self.assertEqual(outbox.dispatch_pending(), 1)
+        message = async_to_sync(self.layer.receive)(channel)
+        self.assertEqual(message['type'], 'send.new.order')
+        self.assertEqual(json.loads(message['text'])['items'][0]['name'], "Dosa")
+        self.assertIsNotNone(OutboxEvent.objects.get().dispatched_at)
+        self.assertEqual(outbox.dispatch_pending(), 0)
+
+    def test_events_are_claimed_and_sent_outside_a_transaction(self):
+        self.place_order()
+        depth = len(connection.savepoint_ids)
+        during_send = []
+        send = outbox.async_to_sync
+
+        def spy(function):
+            during_send.append(len(connection.savepoint_ids))
+            # A second dispatcher leaves the claimed events alone
+            during_send.append(outbox.dispatch_pending())
+            return send(function)
+
+        with mock.patch.object(outbox, 'async_to_sync', spy):
+            self.assertEqual(outbox.dispatch_pending(), 1)
+        self.assertEqual(during_send, [depth, 0])
+        self.assertIsNotNone(OutboxEvent.objects.get().dispatched_at)
+
+    def test_failed_events_are_kept_and_retried_in_order(self):
+        outbox.enqueue('customer_1', 'send_status_update', {'step': 1})
+        outbox.enqueue('customer_1', 'send_status_update', {'step': 2})
+        outbox.enqueue('customer_2', 'send_status_update', {'step': 1})
+
+        self.assertEqual(outbox.dispatch_pending(channel_layer=BrokenChannelLayer()), 0)
+        first, second, other = OutboxEvent.objects.order_by('id')
+        self.assertEqual(first.attempts, 1)
+        self.assertIn("broker unavailable", first.last_error)
+        # Both events for customer_1 went out in one frame, so both are retried
+        self.assertEqual(second.attempts, 1)
+
+        # While group customer_1 waits for its retry, customer_2 can still be delivered
+        OutboxEvent.objects.filter(group='customer_2').update(available_at=timezone.now())
+        channel = self.listen('customer_2')
+        self.assertEqual(outbox.dispatch_pending(), 1)
+        self.assertEqual(json.loads(async_to_sync(self.layer.receive)(channel)['text']), {'step': 1})
+
+        # Once the retry is due, both customer_1 events go out in order
+        OutboxEvent.objects.filter(group='customer_1').update(available_at=timezone.now())
+        channel = self.listen('customer_1')
+        self.assertEqual(outbox.dispatch_pending(), 2)
+        frame = async_to_sync(self.layer.receive)(channel)
+        self.assertEqual(frame['type'], 'batch')
+        self.assertEqual([json.loads(message['text']) for message in frame['messages']], [{'step': 1}, {'step': 2}])
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class BillTotalsTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Totals Diner", slug="totals-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Thali")
+        self.small = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Mini", price=120)
+        self.large = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Royal", price=300)
+        self.admin = StaffUser.objects.create_user(
+            username="owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+
+    def create_bill(self):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Meera", "table_number": "2",
+            "order_items": [
+                {"variant_id": self.small.id, "quantity": 2},
+                {"variant_id": self.large.id, "quantity": 1},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Bill.objects.get(id=response.data['bill_id'])
+
+    def set_status(self, item, new_status):
+        url = reverse('update-order-item-status', kwargs={'item_id': item.id})
+        response = self.client.post(url, {"status": new_status}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_totals_follow_the_bill_through_its_life(self):
+        bill = self.create_bill()
+        self.assertEqual((bill.subtotal, bill.item_count), (540, 3))
+
+        # Re-order adds to the totals
+        response = self.client.post(reverse('captain-reorder', kwargs={'bill_id': bill.id}), {
+            "order_items": [{"variant_id": self.large.id, "quantity": 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        bill.refresh_from_db()
+        self.assertEqual((bill.subtotal, bill.item_count), (1140, 5))
+
+        # Declining takes an item out, un-declining puts it back
+        small_item = bill.order_items.get(variant=self.small)
+        self.set_status(small_item, "DECLINED")
+        bill.refresh_from_db()
+        self.assertEqual((bill.subtotal, bill.item_count), (900, 3))
+        self.set_status(small_item, "DECLINED")
+        bill.refresh_from_db()
+        self.assertEqual(bill.subtotal, 900)
+        self.set_status(small_item, "ACCEPTED")
+        bill.refresh_from_db()
+        self.assertEqual((bill.subtotal, bill.item_count), (1140, 5))
+
+        # Deleting an item removes it
+        bill.order_items.filter(variant=self.large, quantity=2).delete()
+        bill.refresh_from_db()
+        self.assertEqual((bill.subtotal, bill.item_count), (540, 3))
+
+    def test_unknown_variant_is_rejected(self):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Meera", "table_number": "2",
+            "order_items": [{"variant_id": 999999, "quantity": 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Bill.objects.count(), 0)
+
+    def test_cashier_list_reads_the_stored_total(self):
+        self.create_bill()
+        self.create_bill()
+        response = self.client.get(reverse('cashier-bill-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([bill['total_price'] for bill in response.data], [540, 540])
+
+    def test_cashier_message_uses_the_stored_total(self):
+        bill = self.create_bill()
+        for item in bill.order_items.all():
+            self.set_status(item, "COMPLETED")
+        event = OutboxEvent.objects.get(message_type='order_ready_for_payment')
+        self.assertEqual(event.data['totalAmount'], 540.0)
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class OrderItemSnapshotTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Snapshot Diner", slug="snapshot-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        self.menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Biryani")
+        self.variant = MenuItemVariant.objects.create(menu_item=self.menu_item, variant_name="Full", price=250)
+        self.admin = StaffUser.objects.create_user(
+            username="snap-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+
+    def create_bill(self):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Kiran", "table_number": "4",
+            "order_items": [{"variant_id": self.variant.id, "quantity": 2}],
+        }, format='json')
+        return Bill.objects.get(id=response.data['bill_id'])
+
+    def test_history_keeps_the_order_time_price_and_names(self):
+        bill = self.create_bill()
+        self.variant.price = 400
+        self.variant.variant_name = "Family"
+        self.variant.save()
+        self.menu_item.name = "Hyderabadi Biryani"
+        self.menu_item.save()
+
+        item = bill.order_items.get()
+        self.assertEqual((item.unit_price, item.item_name, item.variant_name), (250, "Biryani", "Full"))
+
+        response = self.client.get(reverse('cashier-bill-list'))
+        self.assertEqual(response.data[0]['order_items'][0]['price'], "250.00")
+        self.assertEqual(response.data[0]['order_items'][0]['name'], "Biryani")
+
+    def test_kitchen_list_does_not_join_per_item(self):
+        for _ in range(3):
+            self.create_bill()
+        url = reverse('kitchen-order-list')
+        with CaptureQueriesContext(connection) as few_bills:
+            self.client.get(url)
+        for _ in range(10):
+            self.create_bill()
+        with CaptureQueriesContext(connection) as many_bills:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 13)
+        self.assertEqual(len(few_bills), len(many_bills))
+        self.assertEqual(response.data[0]['order_items'][0]['variant_name'], "Full")
+
+    def test_analytics_use_the_snapshot_price(self):
+        bill = self.create_bill()
+        self.client.post(reverse('cashier-mark-as-paid', args=[bill.id]), {'payment_method': 'OFFLINE'})
+        self.variant.price = 999
+        self.variant.save()
+        response = self.client.get(reverse('restaurant-analytics'))
+        self.assertEqual(response.data['sales_today'], "500.00")
+        self.assertEqual(response.data['top_dish_today'], "Biryani (Full)")
+
+    def test_backfill_command(self):
+        bill = self.create_bill()
+        OrderItem.objects.update(unit_price=None, item_name='', variant_name='')
+        call_command('backfill_order_item_snapshots', stdout=StringIO())
+        item = bill.order_items.get()
+        self.assertEqual((item.unit_price, item.item_name, item.variant_name), (250, "Biryani", "Full"))
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class ReadyForPaymentTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Ready Diner", slug="ready-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Idli")
+        self.variant = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Two", price=60)
+        self.admin = StaffUser.objects.create_user(
+            username="ready-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+
+    def create_bill(self, lines):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Latha", "table_number": "9",
+            "order_items": [{"variant_id": self.variant.id, "quantity": 1}] * lines,
+        }, format='json')
+        return Bill.objects.get(id=response.data['bill_id'])
+
+    def set_status(self, item, new_status):
+        url = reverse('update-order-item-status', kwargs={'item_id': item.id})
+        return self.client.post(url, {"status": new_status}, format='json')
+
+    def cashier_events(self):
+        return OutboxEvent.objects.filter(message_type='order_ready_for_payment')
+
+    def test_cashier_is_notified_once_when_the_last_item_completes(self):
+        bill = self.create_bill(3)
+        self.assertEqual(bill.open_item_count, 3)
+        items = list(bill.order_items.all())
+        self.set_status(items[0], "ACCEPTED")
+        self.set_status(items[0], "COMPLETED")
+        self.set_status(items[1], "COMPLETED")
+        self.assertFalse(self.cashier_events().exists())
+
+        self.set_status(items[2], "COMPLETED")
+        bill.refresh_from_db()
+        self.assertEqual(bill.open_item_count, 0)
+        event = self.cashier_events().get()
+        self.assertEqual(event.group, 'cashier_notifications_ready-diner')
+        self.assertEqual(event.data['totalAmount'], 180.0)
+        self.assertEqual(len(event.data['items']), 3)
+
+        # Completing an already completed item doesn't notify again
+        self.set_status(items[2], "COMPLETED")
+        self.assertEqual(self.cashier_events().count(), 1)
+
+    def test_declined_items_do_not_block_payment(self):
+        bill = self.create_bill(2)
+        first, second = bill.order_items.all()
+        self.set_status(first, "COMPLETED")
+        self.set_status(second, "DECLINED")
+        event = self.cashier_events().get()
+        self.assertEqual(event.data['totalAmount'], 60.0)
+        self.assertEqual(len(event.data['items']), 1)
+
+    def test_items_from_before_the_price_snapshot_can_complete_the_bill(self):
+        bill = self.create_bill(2)
+        first, second = bill.order_items.all()
+        # As left by migration 0009 until backfill_order_item_snapshots runs;
+        # the first item was served before the deploy
+        OrderItem.objects.filter(bill=bill).update(unit_price=None, item_name='', variant_name='')
+        OrderItem.objects.filter(pk=first.pk).update(status="COMPLETED")
+        Bill.objects.filter(pk=bill.pk).update(open_item_count=1)
+        response = self.set_status(second, "COMPLETED")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        second.refresh_from_db()
+        self.assertEqual(second.status, "COMPLETED")
+        event = self.cashier_events().get()
+        self.assertEqual(event.data['items'][0], {'name': "Idli", 'variant_name': "Two", 'quantity': 1, 'price': 60.0})
+
+    def test_fully_declined_bill_is_not_sent_to_the_cashier(self):
+        bill = self.create_bill(2)
+        for item in bill.order_items.all():
+            self.set_status(item, "DECLINED")
+        self.assertFalse(self.cashier_events().exists())
+
+    def test_completing_the_last_item_costs_the_same_for_any_bill_size(self):
+        small = self.create_bill(1)
+        with CaptureQueriesContext(connection) as small_bill:
+            self.set_status(small.order_items.get(), "COMPLETED")
+        large = self.create_bill(25)
+        items = list(large.order_items.all())
+        for item in items[:-1]:
+            self.set_status(item, "COMPLETED")
+        with CaptureQueriesContext(connection) as large_bill:
+            self.set_status(items[-1], "COMPLETED")
+        self.assertEqual(len(small_bill), len(large_bill))
+        self.assertEqual(self.cashier_events().count(), 2)
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class BulkStatusUpdateTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Bulk Kitchen", slug="bulk-kitchen", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Vada")
+        self.variant = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Two", price=50)
+        self.admin = StaffUser.objects.create_user(
+            username="bulk-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('bulk-update-order-item-status')
+
+    def create_bill(self, lines):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Anu", "table_number": "1",
+            "order_items": [{"variant_id": self.variant.id, "quantity": 1}] * lines,
+        }, format='json')
+        return Bill.objects.get(id=response.data['bill_id'])
+
+    def bulk_update(self, items, new_status):
+        return self.client.post(self.url, {
+            "items": [{"id": item.id, "status": new_status} for item in items]
+        }, format='json')
+
+    def test_whole_tickets_are_updated_with_one_message_per_group(self):
+        first = self.create_bill(3)
+        second = self.create_bill(2)
+        items = list(first.order_items.all()) + list(second.order_items.all())
+        OutboxEvent.objects.all().delete()
+
+        response = self.bulk_update(items, "ACCEPTED")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(OrderItem.objects.filter(status="ACCEPTED").count(), 5)
+        customer_events = OutboxEvent.objects.filter(message_type='send_status_update')
+        self.assertEqual(customer_events.count(), 2)
+        first_event = customer_events.get(group=f'customer_{first.id}')
+        self.assertEqual(len(first_event.data['updates']), 3)
+        self.assertEqual(first_event.data['updates'][0]['preparation_time'], 15)
+
+        response = self.bulk_update(items, "COMPLETED")
+        self.assertEqual(response.data['ready_for_payment'], sorted([first.id, second.id]))
+        cashier_event = OutboxEvent.objects.get(message_type='order_ready_for_payment')
+        self.assertEqual(cashier_event.group, 'cashier_notifications_bulk-kitchen')
+        self.assertEqual(sorted(bill['id'] for bill in cashier_event.data['bills']), sorted([first.id, second.id]))
+        first.refresh_from_db()
+        self.assertEqual(first.open_item_count, 0)
+
+    def test_partial_ticket_does_not_notify_the_cashier(self):
+        bill = self.create_bill(3)
+        items = list(bill.order_items.all())
+        response = self.bulk_update(items[:2], "COMPLETED")
+        self.assertEqual(response.data['ready_for_payment'], [])
+        self.assertFalse(OutboxEvent.objects.filter(message_type='order_ready_for_payment').exists())
+        bill.refresh_from_db()
+        self.assertEqual(bill.open_item_count, 1)
+
+    def test_unknown_item_changes_nothing(self):
+        bill = self.create_bill(2)
+        response = self.client.post(self.url, {"items": [
+            {"id": bill.order_items.first().id, "status": "COMPLETED"},
+            {"id": 999999, "status": "COMPLETED"},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(OrderItem.objects.filter(status="COMPLETED").exists())
+
+    def test_other_restaurants_items_are_not_found(self):
+        own = self.create_bill(1).order_items.get()
+        other = Restaurant.objects.create(name="Rival Kitchen", slug="rival-kitchen", latitude=0, longitude=0)
+        rival_bill = Bill.objects.create(restaurant=other, customer_name="Meera", table_number="2")
+        rival_item = rival_bill.order_items.create(variant=self.variant, quantity=1)
+        OutboxEvent.objects.all().delete()
+
+        response = self.bulk_update([own, rival_item], "DECLINED")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['error'], f"Order items not found: {[rival_item.id]}")
+        self.assertFalse(OrderItem.objects.filter(status="DECLINED").exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_invalid_payloads_are_rejected(self):
+        bill = self.create_bill(1)
+        item = bill.order_items.get()
+        for payload in [
+            {"items": []},
+            {"items": [{"id": item.id, "status": "COOKING"}]},
+            {"items": [{"id": item.id, "status": "ACCEPTED"}, {"id": item.id, "status": "COMPLETED"}]},
+        ]:
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_does_not_grow_with_ticket_size(self):
+        small = self.create_bill(2)
+        large = self.create_bill(20)
+        with CaptureQueriesContext(connection) as small_ticket:
+            self.bulk_update(small.order_items.all(), "COMPLETED")
+        with CaptureQueriesContext(connection) as large_ticket:
+            self.bulk_update(large.order_items.all(), "COMPLETED")
+        self.assertEqual(len(small_ticket), len(large_ticket))
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class CoalescingBroadcasterTests(SimpleTestCase):
+    async def listen(self, layer, group):
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        return channel
+
+    async def test_messages_within_the_window_share_one_frame(self):
+        layer = get_channel_layer()
+        chef = await self.listen(layer, 'chef_notifications_a')
+        cashier = await self.listen(layer, 'cashier_notifications_a')
+        broadcaster = CoalescingBroadcaster(layer, window=0.01)
+
+        futures = [
+            broadcaster.publish('chef_notifications_a', {'type': 'send.new.order', 'data': {'bill_id': i}})
+            for i in range(3)
+        ]
+        futures.append(broadcaster.publish('cashier_notifications_a', {'type': 'order_ready_for_payment', 'data': {'id': 9}}))
+        await asyncio.gather(*futures)
+
+        frame = await layer.receive(chef)
+        self.assertEqual(frame['type'], 'batch')
+        self.assertEqual([message['data']['bill_id'] for message in frame['messages']], [0, 1, 2])
+        # A lone message is delivered unchanged
+        self.assertEqual(await layer.receive(cashier), {'type': 'order_ready_for_payment', 'data': {'id': 9}})
+
+        stats = broadcaster.stats.snapshot()
+        self.assertEqual((stats['frames'], stats['events'], stats['max_batch_size']), (2, 4, 3))
+        self.assertEqual(stats['batch_size_histogram']['<=4'], 1)
+        self.assertGreaterEqual(stats['max_added_latency_ms'], 0)
+
+    async def test_full_frames_are_split_in_order(self):
+        layer = get_channel_layer()
+        chef = await self.listen(layer, 'chef_notifications_b')
+        broadcaster = CoalescingBroadcaster(layer, window=10, max_batch=2)
+        await asyncio.gather(*[
+            broadcaster.publish('chef_notifications_b', {'type': 'send.new.order', 'data': i}) for i in range(5)
+        ])
+        received = []
+        for _ in range(3):
+            frame = await layer.receive(chef)
+            received += [m['data'] for m in frame['messages']] if frame['type'] == 'batch' else [frame['data']]
+        self.assertEqual(received, [0, 1, 2, 3, 4])
+
+    async def test_consumers_forward_a_batch_as_one_frame(self):
+        application = URLRouter(websocket_urlpatterns)
+        communicator = WebsocketCommunicator(application, '/ws/chef/frame-test/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await get_channel_layer().group_send('chef_notifications_frame-test', {
+            'type': 'batch',
+            'messages': [
+                {'type': 'send.new.order', 'data': {'bill_id': 1}},
+                {'type': 'unknown.event', 'data': {'ignored': True}},
+                {'type': 'send.new.order', 'data': {'bill_id': 2}},
+            ],
+        })
+        self.assertEqual(await communicator.receive_json_from(), {'batch': [{'bill_id': 1}, {'bill_id': 2}]})
+        await communicator.disconnect()
+
+    async def test_pre_encoded_messages_are_forwarded_verbatim(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/customer/41/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        layer = get_channel_layer()
+
+        message = encode_message('send_status_update', {'order_item_id': 7, 'status': 'ACCEPTED'})
+        await layer.group_send('customer_41', message)
+        self.assertEqual(await communicator.receive_from(), message['text'])
+
+        await layer.group_send('customer_41', {'type': 'batch', 'messages': [
+            encode_message('send_status_update', {'order_item_id': 7}),
+            encode_message('send_status_update', {'order_item_id': 8}),
+        ]})
+        self.assertEqual(json.loads(await communicator.receive_from()), {'batch': [{'order_item_id': 7}, {'order_item_id': 8}]})
+        await communicator.disconnect()
+
+    def test_fanout_benchmark_runs(self):
+        out = StringIO()
+        call_command('benchmark_fanout', sockets=5, rounds=2, stdout=out)
+        self.assertIn('identical frames', out.getvalue())
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class KitchenEventStreamTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Stream Kitchen", slug="stream-kitchen", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Idli")
+        self.variant = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Plate", price=40)
+        self.admin = StaffUser.objects.create_user(
+            username="stream-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+
+    def place_order(self, table="1"):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Ravi", "table_number": table,
+            "order_items": [{"variant_id": self.variant.id, "quantity": 1}],
+        }, format='json')
+        return response.data['bill_id']
+
+    def test_kitchen_messages_are_numbered_per_restaurant(self):
+        self.place_order()
+        self.place_order()
+        other = Restaurant.objects.create(name="Other", slug="other-kitchen", latitude=0, longitude=0)
+        kitchen_events.publish(other, 'send.new.order', {'bill_id': 0})
+
+        events = OutboxEvent.objects.filter(group='chef_notifications_stream-kitchen').order_by('id')
+        self.assertEqual([event.data['seq'] for event in events], [1, 2])
+        self.assertEqual(kitchen_events.current_sequence(self.restaurant.id), 2)
+        self.assertEqual(kitchen_events.current_sequence(other.id), 1)
+
+    def test_missed_events_are_replayed(self):
+        first = self.place_order()
+        second = self.place_order()
+        third = self.place_order()
+
+        missed = kitchen_events.events_since(self.restaurant.id, 1)
+        self.assertEqual([(event['seq'], event['bill_id']) for event in missed], [(2, second), (3, third)])
+        self.assertEqual(kitchen_events.events_since(self.restaurant.id, 3), [])
+        # A sequence number from the future means the client's state is not ours
+        self.assertIsNone(kitchen_events.events_since(self.restaurant.id, 9))
+        message = kitchen_events.catch_up(self.restaurant, 0)
+        self.assertEqual((message['type'], message['seq']), ('resume', 3))
+        self.assertEqual(message['events'][0]['bill_id'], first)
+
+    @override_settings(KITCHEN_EVENT_LOG_SIZE=2)
+    def test_snapshot_once_the_log_has_rolled_over(self):
+        with mock.patch.object(kitchen_events, 'TRIM_EVERY', 1):
+            for table in range(4):
+                self.place_order(str(table))
+        self.assertEqual(list(KitchenEvent.objects.values_list('sequence', flat=True)), [3, 4])
+
+        self.assertEqual(len(kitchen_events.catch_up(self.restaurant, 2)['events']), 2)
+        message = kitchen_events.catch_up(self.restaurant, 1)
+        self.assertEqual((message['type'], message['seq']), ('snapshot', 4))
+        self.assertEqual(len(message['orders']), 4)
+
+    def test_kitchen_order_list_reports_the_sequence(self):
+        self.place_order()
+        response = self.client.get(reverse('kitchen-order-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Kitchen-Seq'], '1')
+
+    def token_for(self, user):
+        return str(RefreshToken.for_user(user).access_token)
+
+    def test_reconnecting_panel_gets_missed_events_once(self):
+        self.place_order()
+        second = self.place_order()
+        outbox_data = OutboxEvent.objects.get(group='chef_notifications_stream-kitchen', data__seq=2).data
+        token = self.token_for(self.admin)
+
+        async def reconnect():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), f'/ws/chef/stream-kitchen/?last_seq=1&token={token}'
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            resumed = await communicator.receive_json_from()
+
+            # The same event arriving live from the dispatcher is not sent twice
+            layer = get_channel_layer()
+            await layer.group_send('chef_notifications_stream-kitchen', encode_message('send.new.order', outbox_data))
+            await layer.group_send('chef_notifications_stream-kitchen', {'type': 'send.new.order', 'data': {'bill_id': 99, 'seq': 3}})
+            live = await communicator.receive_json_from()
+            self.assertTrue(await communicator.receive_nothing())
+
+            await communicator.send_json_to({'action': 'resume', 'last_seq': 'x'})
+            error = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return resumed, live, error
+
+        resumed, live, error = async_to_sync(reconnect)()
+        self.assertEqual(resumed['type'], 'resume')
+        self.assertEqual([(event['seq'], event['bill_id']) for event in resumed['events']], [(2, second)])
+        self.assertEqual(live, {'bill_id': 99, 'seq': 3})
+        self.assertIn('error', error)
+
+    def test_catching_up_needs_kitchen_staff_of_the_restaurant(self):
+        self.place_order()
+        other = Restaurant.objects.create(name="Other", slug="other-kitchen", latitude=0, longitude=0)
+        outsider = StaffUser.objects.create_user(username="other-owner", password="pass", role="ADMIN", restaurant=other)
+        cashier = StaffUser.objects.create_user(
+            username="stream-cashier", password="pass", role="CASHIER", restaurant=self.restaurant
+        )
+        RoleCredential.objects.create(restaurant=self.restaurant, role="CHEF", username="stream-chef", password="chef-pass")
+        self.client.force_authenticate(None)
+        chef_token = self.client.post(
+            reverse('token_obtain_pair'), {'username': 'stream-chef', 'password': 'chef-pass'}
+        ).data['token']
+
+        async def connect(query):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chef/stream-kitchen/?{query}')
+            connected, code = await communicator.connect()
+            if connected:
+                await communicator.disconnect()
+            return connected, code
+
+        refused = [
+            'last_seq=0',
+            'last_seq=0&token=not-a-token',
+            f'last_seq=0&token={self.token_for(outsider)}',
+            f'last_seq=0&token={self.token_for(cashier)}',
+        ]
+        for query in refused:
+            self.assertEqual(async_to_sync(connect)(query), (False, 4403), query)
+        self.assertEqual(async_to_sync(connect)(f'last_seq=0&token={chef_token}'), (True, None))
+
+        async def resume_without_token():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chef/stream-kitchen/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({'action': 'resume', 'last_seq': 0})
+            return await communicator.receive_output()
+
+        self.assertEqual(async_to_sync(resume_without_token)(), {'type': 'websocket.close', 'code': 4403})
+
+
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class DailySalesTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Rollup Diner", slug="rollup-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Thali")
+        self.veg = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Veg", price=150)
+        self.special = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Special", price=300)
+        self.admin = StaffUser.objects.create_user(
+            username="rollup-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+
+    def create_bill(self, *lines):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Meera", "table_number": "2",
+            "order_items": [{"variant_id": variant.id, "quantity": quantity} for variant, quantity in lines],
+        }, format='json')
+        return Bill.objects.get(id=response.data['bill_id'])
+
+    def pay(self, bill):
+        return self.client.post(reverse('cashier-mark-as-paid', args=[bill.id]), {'payment_method': 'ONLINE'})
+
+    def test_paying_a_bill_updates_the_rollup(self):
+        first = self.create_bill((self.veg, 2), (self.special, 1))
+        second = self.create_bill((self.veg, 3))
+        # Declined items are not charged, so they are not sales either
+        second.order_items.create(variant=self.special, quantity=5, status='DECLINED')
+        self.assertEqual(DailySales.objects.count(), 0)
+
+        self.assertEqual(self.pay(first).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.pay(second).status_code, status.HTTP_200_OK)
+        # Paying twice neither works nor counts twice
+        self.assertEqual(self.pay(second).status_code, status.HTTP_404_NOT_FOUND)
+
+        rows = {row.variant_id: row for row in DailySales.objects.all()}
+        self.assertEqual((rows[self.veg.id].quantity, rows[self.veg.id].revenue), (5, 750))
+        self.assertEqual((rows[self.special.id].quantity, rows[self.special.id].revenue), (1, 300))
+        self.assertEqual(rows[self.veg.id].business_date, timezone.localdate())
+
+        response = self.client.get(reverse('restaurant-analytics'))
+        self.assertEqual(response.data, {
+            'sales_today': "1050.00", 'sales_this_month': "1050.00",
+            'top_dish_today': "Thali (Veg)", 'top_dish_this_month': "Thali (Veg)",
+        })
+        self.assertEqual(self.client.get(reverse('admin-analytics')).data['sales_today'], "1050.00")
+
+    def test_rebuild_matches_the_incremental_rollup(self):
+        for _ in range(3):
+            self.pay(self.create_bill((self.veg, 1), (self.special, 2)))
+        self.create_bill((self.veg, 4))  # still unpaid
+        incremental = list(DailySales.objects.order_by('variant_id').values('variant_id', 'quantity', 'revenue'))
+
+        DailySales.objects.update(quantity=0, revenue=0)
+        out = StringIO()
+        call_command('rebuild_daily_sales', restaurant='rollup-diner', stdout=out)
+        self.assertIn("2 daily sales rows", out.getvalue())
+        rebuilt = list(DailySales.objects.order_by('variant_id').values('variant_id', 'quantity', 'revenue'))
+        self.assertEqual(rebuilt, incremental)
+
+    def test_analytics_cost_does_not_grow_with_history(self):
+        self.pay(self.create_bill((self.veg, 1)))
+        url = reverse('restaurant-analytics')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for _ in range(10):
+            self.pay(self.create_bill((self.veg, 1), (self.special, 1)))
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(small), len(large))
+        self.assertNotIn('menu_orderitem', ' '.join(query['sql'] for query in large.captured_queries))
+        self.assertEqual(response.data['sales_today'], "4650.00")
+
+
+class OrderReportExportTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Export Diner", slug="export-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Dosa")
+        self.variant = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Masala", price=90)
+        self.admin = StaffUser.objects.create_user(
+            username="export-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('admin-order-report')
+
+    def create_bills(self, count, items=2):
+        for index in range(count):
+            bill = Bill.objects.create(restaurant=self.restaurant, customer_name=f"Guest {index}", table_number="4")
+            for _ in range(items):
+                bill.order_items.create(variant=self.variant, quantity=2)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_has_one_row_per_item(self):
+        self.create_bills(2)
+        Bill.objects.create(restaurant=self.restaurant, customer_name="Walk-in", table_number="9")
+        response = self.client.get(self.url, {'period': 'year', 'export': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('orders-year.csv', response['Content-Disposition'])
+
+        lines = self.read(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['bill_id', 'created_at', 'customer_name'])
+        self.assertEqual(len(lines), 1 + 2 * 2 + 1)
+        row = next(line.split(',') for line in lines[1:] if 'Guest 0' in line)
+        self.assertEqual(row[-6:], ['Dosa', 'Masala', 'PENDING', '2', '90.00', '180.00'])
+        # The bill without items still appears, with empty item columns
+        walk_in = next(line.split(',') for line in lines[1:] if 'Walk-in' in line)
+        self.assertEqual(walk_in[-6:], [''] * 6)
+
+    def test_ndjson_export_matches_the_json_report(self):
+        self.create_bills(3)
+        report = self.client.get(self.url, {'period': 'year'}, format='json').json()
+        response = self.client.get(self.url, {'period': 'year', 'export': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in self.read(response).splitlines()], report)
+
+    def test_export_queries_do_not_grow_with_the_bills_in_a_chunk(self):
+        self.create_bills(1)
+        # The first request also caches the restaurant (see restaurants/context.py)
+        self.read(self.client.get(self.url, {'export': 'csv'}))
+        with CaptureQueriesContext(connection) as small:
+            self.read(self.client.get(self.url, {'export': 'csv'}))
+        self.create_bills(20)
+        with CaptureQueriesContext(connection) as large:
+            self.read(self.client.get(self.url, {'export': 'csv'}))
+        self.assertEqual(len(small), len(large))
+
+        # The bills are read through one cursor; each further chunk adds one items query
+        with mock.patch.object(exports, 'CHUNK_SIZE', 5):
+            with CaptureQueriesContext(connection) as chunked:
+                self.read(self.client.get(self.url, {'export': 'ndjson'}))
+        self.assertEqual(len(chunked), len(large) + 4)
+
+    def test_asgi_export_streams_rows_before_reading_every_bill(self):
+        self.create_bills(20)
+        pulled = []
+
+        def counting(bills):
+            for bill in bills:
+                pulled.append(bill.id)
+                yield bill
+
+        request = AsyncRequestFactory().get(self.url, {'period': 'year', 'export': 'csv'})
+        force_authenticate(request, self.admin)
+        request.restaurant = self.restaurant
+        iterate = exports.iterate
+        with mock.patch.object(exports, 'iterate', lambda queryset: counting(iterate(queryset))), \
+                mock.patch.object(exports, 'CHUNK_SIZE', 5), mock.patch.object(exports, 'ASYNC_BATCH_SIZE', 5):
+            response = AdminOrderReportView.as_view()(request)
+            self.assertTrue(response.is_async)
+
+            async def read():
+                chunks, pulled_at_first_rows = [], None
+                iterator = response.__aiter__()
+                async for chunk in iterator:
+                    chunks.append(chunk)
+                    if len(chunks) == 5:
+                        pulled_at_first_rows = len(pulled)
+                return chunks, pulled_at_first_rows
+
+            chunks, pulled_at_first_rows = async_to_sync(read)()
+        self.assertLess(pulled_at_first_rows, 20)
+        self.assertEqual(len(pulled), 20)
+        self.assertEqual(len(b''.join(chunks).decode().splitlines()), 1 + 20 * 2)
+
+    def test_csv_export_keeps_formulas_as_text(self):
+        bill = Bill.objects.create(
+            restaurant=self.restaurant, customer_name='=HYPERLINK("http://evil","x")', table_number="-4"
+        )
+        bill.order_items.create(variant=self.variant, quantity=1)
+        Bill.objects.create(restaurant=self.restaurant, customer_name="Asha = Ravi", table_number="7")
+        rows = list(csv.reader(self.read(self.client.get(self.url, {'export': 'csv'})).splitlines()))
+        # Newest first
+        self.assertEqual(rows[1][2:4], ["Asha = Ravi", "7"])
+        self.assertEqual(rows[2][2:4], ['\'=HYPERLINK("http://evil","x")', "'-4"])
+
+    def test_unknown_export_format_is_rejected(self):
+        response = self.client.get(self.url, {'export': 'xlsx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Paging Diner", slug="paging-diner", latitude=12.9716, longitude=77.5946
+        )
+        self.admin = StaffUser.objects.create_user(
+            username="paging-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+        # Pairs of bills share a timestamp, so the id has to break the ties
+        noon = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        for index in range(7):
+            bill = Bill.objects.create(restaurant=self.restaurant, customer_name=f"Guest {index}", table_number="1")
+            Bill.objects.filter(pk=bill.pk).update(created_at=noon - timedelta(minutes=index // 2))
+        self.newest_first = list(Bill.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, url, **params):
+        ids, pages = [], 0
+        response = self.client.get(url, {**params, 'page_size': 3})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [bill['id'] for bill in response.data['results']]
+            pages += 1
+            if response.data['next'] is None:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_bill_once_in_order(self):
+        ids, pages = self.walk(reverse('admin-order-report'), period='year')
+        self.assertEqual((ids, pages), (self.newest_first, 3))
+        ids, _ = self.walk(reverse('restaurant-order-list'))
+        self.assertEqual(ids, self.newest_first)
+
+    def test_cashier_list_pages_oldest_first(self):
+        ids, _ = self.walk(reverse('cashier-bill-list'))
+        self.assertEqual(ids, self.newest_first[::-1])
+
+    def test_new_bills_do_not_shift_later_pages(self):
+        url = reverse('admin-order-report')
+        first = self.client.get(url, {'period': 'year', 'page_size': 3})
+        Bill.objects.create(restaurant=self.restaurant, customer_name="Late", table_number="2")
+        second = self.client.get(first.data['next'])
+        self.assertEqual([bill['id'] for bill in second.data['results']], self.newest_first[3:6])
+
+    def test_later_pages_seek_instead_of_offset(self):
+        first = self.client.get(reverse('admin-order-report'), {'period': 'year', 'page_size': 3})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data['next'])
+        bill_query = next(query['sql'] for query in queries.captured_queries if 'FROM "menu_bill"' in query['sql'])
+        self.assertNotIn('OFFSET', bill_query)
+        self.assertIn('LIMIT 4', bill_query)
+
+    def test_unpaginated_requests_keep_the_plain_list(self):
+        response = self.client.get(reverse('admin-order-report'), {'period': 'year'})
+        self.assertEqual([bill['id'] for bill in response.data], self.newest_first)
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('admin-order-report'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Reads SQLite's EXPLAIN QUERY PLAN output")
+@override_settings(CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class QueryPlanTests(APITestCase):
+    """
+    Runs the main views, asks SQLite for the plan of every query they made
+    and fails if one of them reads a whole table. Tables that only ever
+    hold a handful of rows per restaurant are allowed.
+    """
+    SMALL_TABLES = {'menu_foodtype', 'menu_cuisine', 'django_content_type', 'django_migrations'}
+
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name="Plan Diner", slug="plan-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Idli")
+        self.variant = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Plate", price=60)
+        self.admin = StaffUser.objects.create_user(
+            username="plan-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+        for _ in range(3):
+            self.client.post(reverse('captain-order-create'), {
+                "customer_name": "Asha", "table_number": "3",
+                "order_items": [{"variant_id": self.variant.id, "quantity": 2}],
+            }, format='json')
+
+    def full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if detail.startswith('SCAN ') and ' USING ' not in detail:
+                        scans.append((detail, query['sql']))
+        return scans
+
+    def assertNoFullScans(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+        scans = [
+            (detail, sql) for detail, sql in self.full_scans(queries)
+            if detail.split()[1] not in self.SMALL_TABLES
+        ]
+        self.assertEqual(scans, [])
+
+    def test_list_views_use_indexes(self):
+        cache.clear()
+        self.assertNoFullScans('get', reverse('public-menu-list', args=[self.restaurant.slug]))
+        self.assertNoFullScans('get', reverse('kitchen-order-list'))
+        self.assertNoFullScans('get', reverse('cashier-bill-list'))
+        self.assertNoFullScans('get', reverse('cashier-bill-list'), {'page_size': 2})
+        self.assertNoFullScans('get', reverse('restaurant-order-list'), {'page_size': 2})
+        for period in ('today', 'week', 'month', 'year'):
+            self.assertNoFullScans('get', reverse('admin-order-report'), {'period': period})
+        self.assertNoFullScans('get', reverse('restaurant-analytics'))
+
+    def test_order_flow_uses_indexes(self):
+        self.assertNoFullScans('post', reverse('captain-order-create'), {
+            "customer_name": "Ravi", "table_number": "5",
+            "order_items": [{"variant_id": self.variant.id, "quantity": 1}],
+        })
+        items = list(OrderItem.objects.values_list('id', flat=True))
+        self.assertNoFullScans('post', reverse('bulk-update-order-item-status'), {
+            'items': [{'id': item_id, 'status': 'COMPLETED'} for item_id in items]
+        })
+        bill = Bill.objects.first()
+        self.assertNoFullScans('post', reverse('cashier-mark-as-paid', args=[bill.id]), {'payment_method': 'ONLINE'})
+
+
+class BusinessDateTests(APITestCase):
+    def setUp(self):
+        # Service runs past midnight; the business day starts at 04:00 in Kolkata
+        self.restaurant = Restaurant.objects.create(
+            name="Late Diner", slug="late-diner", latitude=12.9716, longitude=77.5946,
+            time_zone="Asia/Kolkata", day_cutoff_hour=4
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Kebab")
+        self.variant = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Plate", price=200)
+        self.admin = StaffUser.objects.create_user(
+            username="late-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+
+    def at(self, *moment):
+        return mock.patch('django.utils.timezone.now', return_value=datetime(*moment, tzinfo=dt_timezone.utc))
+
+    def create_bill(self):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Nikhil", "table_number": "8",
+            "order_items": [{"variant_id": self.variant.id, "quantity": 1}],
+        }, format='json')
+        return Bill.objects.get(id=response.data['bill_id'])
+
+    def report_ids(self, period):
+        return [bill['id'] for bill in self.client.get(reverse('admin-order-report'), {'period': period}).data]
+
+    def test_after_midnight_orders_belong_to_the_night_before(self):
+        with self.at(2025, 3, 14, 17, 0):  # 22:30 on the 14th
+            evening = self.create_bill()
+        with self.at(2025, 3, 14, 20, 0):  # 01:30 on the 15th
+            late = self.create_bill()
+            self.assertEqual(self.pay(late).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.report_ids('today'), [late.id, evening.id])
+        self.assertEqual((evening.business_date, late.business_date), (date(2025, 3, 14), date(2025, 3, 14)))
+        self.assertEqual(set(OrderItem.objects.values_list('business_date', flat=True)), {date(2025, 3, 14)})
+        self.assertEqual(DailySales.objects.get().business_date, date(2025, 3, 14))
+
+        with self.at(2025, 3, 15, 6, 0):  # 11:30 on the 15th
+            morning = self.create_bill()
+            self.assertEqual(self.report_ids('today'), [morning.id])
+            self.assertEqual(self.report_ids('week'), [morning.id, late.id, evening.id])
+            self.assertEqual(sales.dashboard(restaurant=self.restaurant)['sales_today'], "0.00")
+            self.assertEqual(sales.dashboard(restaurant=self.restaurant)['sales_this_month'], "200.00")
+
+    def test_period_filters_compare_dates_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin-order-report'), {'period': 'month'})
+        bill_query = next(query['sql'] for query in queries.captured_queries if 'FROM "menu_bill"' in query['sql'])
+        self.assertIn('"business_date" >=', bill_query)
+        self.assertNotIn('django_datetime', bill_query)
+
+    def pay(self, bill):
+        return self.client.post(reverse('cashier-mark-as-paid', args=[bill.id]), {'payment_method': 'OFFLINE'})
+
+
+@skipUnless(numpy, "The order archive needs NumPy")
+class OrderArchiveTests(APITestCase):
+    def setUp(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, ignore_errors=True)
+        settings_override = override_settings(ORDER_ARCHIVE_DIR=archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.restaurant = Restaurant.objects.create(
+            name="Archive Diner", slug="archive-diner", latitude=12.9716, longitude=77.5946
+        )
+        category = Category.objects.create(restaurant=self.restaurant, name="Mains")
+        menu_item = MenuItem.objects.create(restaurant=self.restaurant, category=category, name="Pongal")
+        self.plain = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Plain", price=80)
+        self.ghee = MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Ghee", price=110)
+        self.admin = StaffUser.objects.create_user(
+            username="archive-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(self.admin)
+
+        self.old = [self.create_bill(days_ago=200 + index, paid=True) for index in range(3)]
+        # Declined items stay in the report but are not sales
+        self.old[0].order_items.create(variant=self.ghee, quantity=4, status='DECLINED')
+        self.old_unpaid = self.create_bill(days_ago=150, paid=False)
+        self.recent = self.create_bill(days_ago=0, paid=True)
+
+    def create_bill(self, days_ago, paid):
+        response = self.client.post(reverse('captain-order-create'), {
+            "customer_name": "Lakshmi", "table_number": "6",
+            "order_items": [{"variant_id": self.plain.id, "quantity": 2}, {"variant_id": self.ghee.id, "quantity": 1}],
+        }, format='json')
+        bill = Bill.objects.get(id=response.data['bill_id'])
+        if paid:
+            self.client.post(reverse('cashier-mark-as-paid', args=[bill.id]), {'payment_method': 'ONLINE'})
+        moment = timezone.now() - timedelta(days=days_ago)
+        day = self.restaurant.business_date(moment)
+        Bill.objects.filter(pk=bill.pk).update(created_at=moment, business_date=day)
+        OrderItem.objects.filter(bill=bill).update(created_at=moment, business_date=day)
+        return bill
+
+    def archive(self):
+        out = StringIO()
+        call_command('archive_paid_bills', stdout=out)
+        return out.getvalue()
+
+    def report(self, **params):
+        return self.client.get(reverse('admin-order-report'), {'period': 'all', **params})
+
+    def walk(self, page_size):
+        ids, response = [], self.report(page_size=page_size)
+        while True:
+            ids += [bill['id'] for bill in response.data['results']]
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_only_old_paid_bills_leave_the_live_tables(self):
+        self.assertIn("3 bills archived", self.archive())
+        self.assertEqual(set(Bill.objects.values_list('id', flat=True)), {self.old_unpaid.id, self.recent.id})
+        self.assertFalse(OrderItem.objects.filter(bill_id__in=[bill.id for bill in self.old]).exists())
+        self.assertTrue(archive.restaurant_dir(self.restaurant.id).is_dir())
+        # Nothing left to move the second time
+        self.assertIn("0 bills archived", self.archive())
+
+    def test_report_reads_through_the_archive(self):
+        before = self.report().json()
+        pages_before = self.walk(page_size=2)
+        csv_before = b''.join(self.report(export='csv').streaming_content)
+        ndjson_before = b''.join(self.report(export='ndjson').streaming_content)
+        self.archive()
+
+        self.assertEqual(self.report().json(), before)
+        self.assertEqual(self.walk(page_size=2), pages_before)
+        self.assertEqual(pages_before, [bill['id'] for bill in before])
+        self.assertEqual(b''.join(self.report(export='csv').streaming_content), csv_before)
+        self.assertEqual(b''.join(self.report(export='ndjson').streaming_content), ndjson_before)
+        # Periods still apply to archived bills
+        self.assertEqual([bill['id'] for bill in self.report(period='week').data], [self.recent.id])
+
+    def test_order_history_reads_through_the_archive(self):
+        url = reverse('restaurant-order-list')
+        before = self.client.get(url).json()
+        first_page = self.client.get(url, {'page_size': 2}).data
+        self.archive()
+
+        self.assertEqual(self.client.get(url).json(), before)
+        self.assertEqual(len(before), 5)
+        page = self.client.get(url, {'page_size': 2}).data
+        self.assertEqual(page['results'], first_page['results'])
+        ids = [bill['id'] for bill in page['results']]
+        while page['next'] is not None:
+            page = self.client.get(page['next']).data
+            ids += [bill['id'] for bill in page['results']]
+        self.assertEqual(ids, [bill['id'] for bill in before])
+
+    def test_rebuild_counts_archived_sales(self):
+        sales.rebuild(restaurant=self.restaurant)
+        rollup = list(DailySales.objects.order_by('business_date', 'variant_id').values(
+            'business_date', 'variant_id', 'item_name', 'variant_name', 'quantity', 'revenue'
+        ))
+        self.archive()
+        sales.rebuild(restaurant=self.restaurant)
+        self.assertEqual(list(DailySales.objects.order_by('business_date', 'variant_id').values(
+            'business_date', 'variant_id', 'item_name', 'variant_name', 'quantity', 'revenue'
+        )), rollup)
+
+        since = self.old[1].business_date
+        sales.rebuild(since=since)
+        self.assertEqual(DailySales.objects.count(), len(rollup))
+
+    def test_archiving_again_adds_to_the_month(self):
+        self.archive()
+        self.client.post(reverse('cashier-mark-as-paid', args=[self.old_unpaid.id]), {'payment_method': 'OFFLINE'})
+        late = self.create_bill(days_ago=201, paid=True)
+        self.assertIn("2 bills archived", self.archive())
+        ids = [bill['id'] for bill in self.report().data]
+        self.assertEqual(sorted(ids), sorted([bill.id for bill in self.old] + [self.old_unpaid.id, late.id, self.recent.id]))
+        self.assertEqual(Bill.objects.count(), 1)
+
+    def test_interrupted_month_swap_is_recovered(self):
+        self.archive()
+        before = [bill['id'] for bill in self.report().data]
+        late = self.create_bill(days_ago=201, paid=True)
+        real_replace = os.replace
+        calls = []
+
+        def crash_on_second_rename(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise OSError("power cut")
+            real_replace(*args)
+
+        with mock.patch.object(archive.os, 'replace', crash_on_second_rename):
+            with self.assertRaises(OSError):
+                self.archive()
+        month = calls[0][0].name
+        names = {path.name for path in archive.restaurant_dir(self.restaurant.id).iterdir()}
+        self.assertEqual(names - {path.name for path in archive._months(self.restaurant.id)}, {month + '.tmp'})
+        self.assertIn(month + '.old', names)
+        # Nothing is lost in between: the month is read from .old, the late bill is still live
+        self.assertEqual(sorted(bill['id'] for bill in self.report().data), sorted(before + [late.id]))
+
+        self.assertIn("1 bills archived", self.archive())
+        names = {path.name for path in archive.restaurant_dir(self.restaurant.id).iterdir()}
+        self.assertFalse([name for name in names if '.' in name])
+        self.assertEqual(sorted(bill['id'] for bill in self.report().data), sorted(before + [late.id]))
+        self.assertFalse(Bill.objects.filter(pk=late.pk).exists())
+
+
+class DashboardQueryTests(TestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name="Query Diner", slug="query-diner", latitude=0, longitude=0)
+        self.other = Restaurant.objects.create(name="Elsewhere", slug="elsewhere", latitude=0, longitude=0)
+
+    def add(self, restaurant, day, item_name, quantity, revenue):
+        DailySales.objects.create(
+            restaurant=restaurant, business_date=day, item_name=item_name, variant_name="Full",
+            quantity=quantity, revenue=revenue
+        )
+
+    def test_both_windows_come_from_one_query(self):
+        today = timezone.localdate()
+        month_start = today.replace(day=1)
+        self.add(self.restaurant, today, "Dosa", 3, 300)
+        self.add(self.restaurant, today, "Idli", 1, 60)
+        self.add(self.restaurant, month_start - timedelta(days=1), "Vada", 50, 2500)  # last month
+        self.add(self.other, today, "Vada", 9, 900)
+        if today != month_start:
+            self.add(self.restaurant, month_start, "Idli", 10, 600)
+
+        with self.assertNumQueries(1):
+            data = sales.dashboard(restaurant=self.restaurant)
+        self.assertEqual(data['sales_today'], "360.00")
+        self.assertEqual(data['top_dish_today'], "Dosa (Full)")
+        if today != month_start:
+            self.assertEqual(data['sales_this_month'], "960.00")
+            self.assertEqual(data['top_dish_this_month'], "Idli (Full)")
+
+        # Plus one for the restaurants' business days
+        with self.assertNumQueries(2):
+            everywhere = sales.dashboard()
+        self.assertEqual(everywhere['top_dish_today'], "Vada (Full)")
+
+    def test_empty_dashboard(self):
+        self.assertEqual(sales.dashboard(restaurant=self.restaurant), {
+            'sales_today': "0.00", 'sales_this_month': "0.00",
+            'top_dish_today': "N/A", 'top_dish_this_month': "N/A",
+        })
+
+
+@skipUnless(os.environ.get('RM_LARGE_DATASET_TESTS'), "set RM_LARGE_DATASET_TESTS=1 to seed a million order items")
+class LargeDatasetAnalyticsTests(TestCase):
+    """
+    Seeds a million paid order items spread over 400 days and checks that the
+    analytics stay single-query and fast. Slow, so only run on request.
+    """
+    ORDER_ITEMS = 1_000_000
+    ITEMS_PER_BILL = 10
+    DAYS = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name="Big Diner", slug="big-diner", latitude=0, longitude=0)
+        category = Category.objects.create(restaurant=cls.restaurant, name="Mains")
+        variants = []
+        for index in range(20):
+            menu_item = MenuItem.objects.create(restaurant=cls.restaurant, category=category, name=f"Dish {index}")
+            variants.append(MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Full", price=100 + index))
+
+        ops = connection.ops
+        now = timezone.now()
+        bills, items = [], []
+        first_bill_id = 10_000_000
+        for bill_index in range(cls.ORDER_ITEMS // cls.ITEMS_PER_BILL):
+            bill_id = first_bill_id + bill_index
+            moment = now - timedelta(days=bill_index % cls.DAYS, minutes=bill_index % 50)
+            created = ops.adapt_datetimefield_value(moment)
+            business_date = ops.adapt_datefield_value(cls.restaurant.business_date(moment))
+            bills.append((bill_id, cls.restaurant.id, "Guest", "1", "PAID", "OFFLINE", "0", 0, 0,
+                          business_date, created, created))
+            for line in range(cls.ITEMS_PER_BILL):
+                variant = variants[(bill_index + line * 3) % len(variants)]
+                item_status = "DECLINED" if (bill_index + line) % 20 == 0 else "COMPLETED"
+                items.append((bill_id, variant.id, 1 + line % 3, item_status, str(variant.price),
+                              f"Dish {variants.index(variant)}", "Full", business_date, created, created))
+
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {Bill._meta.db_table} (id, restaurant_id, customer_name, table_number, payment_status, "
+                "payment_method, subtotal, item_count, open_item_count, business_date, created_at, updated_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", bills
+            )
+            cursor.executemany(
+                f"INSERT INTO {OrderItem._meta.db_table} (bill_id, variant_id, quantity, status, unit_price, "
+                "item_name, variant_name, business_date, created_at, updated_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", items
+            )
+
+    def test_analytics_on_a_million_order_items(self):
+        self.assertEqual(OrderItem.objects.count(), self.ORDER_ITEMS)
+
+        start = time.perf_counter()
+        rows = sales.rebuild(restaurant=self.restaurant)
+        rebuild_seconds = time.perf_counter() - start
+        self.assertLessEqual(rows, 20 * (self.DAYS + 1))
+        self.assertLess(rebuild_seconds, 120)
+
+        start = time.perf_counter()
+        with self.assertNumQueries(1):
+            data = sales.dashboard(restaurant=self.restaurant)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+        # The same numbers straight from the order items, with one conditional-aggregate scan
+        today = timezone.localdate()
+        tz = timezone.get_current_timezone()
+        month_start = timezone.make_aware(datetime.combine(today.replace(day=1), datetime.min.time()), tz)
+        day_start = timezone.make_aware(datetime.combine(today, datetime.min.time()), tz)
+        line_total = F('quantity') * F('unit_price')
+        with self.assertNumQueries(1):
+            expected = OrderItem.objects.filter(
+                bill__restaurant=self.restaurant, bill__payment_status='PAID', created_at__gte=month_start
+            ).exclude(status='DECLINED').aggregate(
+                today=Sum(line_total, filter=Q(created_at__gte=day_start), default=Decimal('0')),
+                month=Sum(line_total, default=Decimal('0')),
+            )
+        self.assertEqual(data['sales_today'], f"{expected['today']:.2f}")
+        self.assertEqual(data['sales_this_month'], f"{expected['month']:.2f}")
+
+
+@skipUnless(connection.vendor == 'sqlite', "The replica stand-in is a SQLite file")
+class ReplicaRoutingTests(APITestCase):
+    # 'replica' is only configured in setUpClass, so it can't be named here
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite file stands in for the replica: a copy of the
+        # migrated test database, as `sqlite3 db.sqlite3 ".backup ..."` makes
+        cls.replica_dir = tempfile.mkdtemp()
+        name = os.path.join(cls.replica_dir, 'replica.sqlite3')
+        connections['default'].ensure_connection()
+        target = sqlite3.connect(name)
+        connections['default'].connection.backup(target)
+        target.close()
+        connections.settings['replica'] = {**connections.settings['default'], 'NAME': name}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.replica_dir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(
+            name="Replica Diner", slug="replica-diner", latitude=12.9716, longitude=77.5946
+        )
+        self.admin = StaffUser.objects.create_user(
+            username="replica-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        Bill.objects.create(restaurant=self.restaurant, customer_name="On primary", table_number="1")
+
+        # The replica has the restaurant but lags behind on its bills
+        Restaurant(
+            pk=self.restaurant.pk, name="Replica Diner", slug="replica-diner", latitude=12.9716, longitude=77.5946
+        ).save(using='replica')
+        Bill(restaurant_id=self.restaurant.pk, customer_name="On replica", table_number="2").save(using='replica')
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('admin-order-report')
+
+    def customers(self, response):
+        return [bill['customer_name'] for bill in response.data]
+
+    def test_reports_read_from_the_replica(self):
+        self.assertEqual(self.customers(self.client.get(self.url)), ["On replica"])
+        export = self.client.get(self.url, {'export': 'csv'})
+        self.assertIn("On replica", b''.join(export.streaming_content).decode())
+
+    def test_writers_read_their_own_writes_for_a_while(self):
+        response = self.client.post(reverse('category-manage-list'), {'name': 'Starters'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.customers(self.client.get(self.url)), ["On primary"])
+
+        # Other clients keep reading from the replica
+        other = StaffUser.objects.create_user(
+            username="replica-manager", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(self.customers(self.client.get(self.url)), ["On replica"])
+
+        # Once REPLICA_STICKY_SECONDS have passed, so does the writer
+        cache.clear()
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.customers(self.client.get(self.url)), ["On replica"])
+
+    def test_other_views_read_from_the_primary(self):
+        response = self.client.get(reverse('restaurant-order-list'))
+        self.assertEqual(self.customers(response), ["On primary"])
+
+
+@override_settings(ORDER_SHARDS=['shard1', 'shard2'], CHANNEL_LAYERS={
+    "default": {
+        "BACKEND": "restromanager.channel_layers.LocalChannelLayer"
+    }
+})
+class ShardingTests(APITestCase):
+    # The shards are only configured in setUpClass, so they can't be named here
+    databases = '__all__'
+    shards = ('shard1', 'shard2')
+
+    @classmethod
+    def setUpClass(cls):
+        # Copies of the migrated test database stand in for the shards
+        cls.shard_dir = tempfile.mkdtemp()
+        connections['default'].ensure_connection()
+        for alias in cls.shards:
+            name = os.path.join(cls.shard_dir, f'{alias}.sqlite3')
+            target = sqlite3.connect(name)
+            connections['default'].connection.backup(target)
+            target.close()
+            connections.settings[alias] = {**connections.settings['default'], 'NAME': name}
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        # What `migrate --database <alias>` does after the migrations
+        for alias in cls.shards:
+            sharding.prepare_shard(alias)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.shards:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls.shard_dir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        context.clear()
+
+    def create_restaurant(self, slug, shard='default'):
+        # Copied to the shards once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = Restaurant.objects.create(
+                name=slug.title(), slug=slug, latitude=12.9716, longitude=77.5946, shard=shard
+            )
+        # Outside a request, queries go to the shard in scope
+        with sharding.for_restaurant(restaurant):
+            category = Category.objects.create(restaurant=restaurant, name="Mains")
+            menu_item = MenuItem.objects.create(restaurant=restaurant, category=category, name="Dosa")
+            MenuItemVariant.objects.create(menu_item=menu_item, variant_name="Full", price=120)
+        return restaurant, menu_item
+
+    def order(self, restaurant, menu_item):
+        response = self.client.post(
+            reverse('frontend-order-create', kwargs={'restaurant_slug': restaurant.slug}),
+            {"customer_name": "Asha", "table_number": "7",
+             "items": [{"menu_item_id": menu_item.id, "variant_name": "Full", "quantity": 2}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['order_id']
+
+    def move(self, restaurant, target):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('move_restaurant', restaurant.slug, '--to', target, '--wait', '0', stdout=StringIO())
+
+    def test_orders_are_written_to_the_restaurants_shard(self):
+        restaurant, menu_item = self.create_restaurant("sharded-diner", shard='shard1')
+        self.assertTrue(MenuItem.objects.using('shard1').filter(pk=menu_item.pk).exists())
+        self.assertGreaterEqual(menu_item.pk, settings.SHARD_ID_BLOCK)
+
+        bill_id = self.order(restaurant, menu_item)
+        self.assertGreaterEqual(bill_id, settings.SHARD_ID_BLOCK)
+        self.assertEqual(Bill.objects.using('shard1').get(pk=bill_id).order_items.count(), 1)
+        self.assertFalse(Bill.objects.using('default').exists())
+        self.assertTrue(OutboxEvent.objects.using('shard1').exists())
+
+        chef = StaffUser.objects.create_user(username="shard-chef", password="pass", role="CHEF", restaurant=restaurant)
+        self.client.force_authenticate(chef)
+        response = self.client.get(reverse('kitchen-order-list'))
+        self.assertEqual([bill['id'] for bill in response.data], [bill_id])
+        self.assertEqual(response['X-Kitchen-Seq'], "1")
+
+    def test_move_restaurant_keeps_its_rows(self):
+        restaurant, menu_item = self.create_restaurant("moving-diner")
+        bill_id = self.order(restaurant, menu_item)
+        created_at = Bill.objects.get(pk=bill_id).created_at
+        stale = context.get_restaurant(pk=restaurant.pk)
+
+        self.move(restaurant, 'shard2')
+
+        restaurant.refresh_from_db()
+        self.assertEqual(restaurant.shard, 'shard2')
+        moved = Bill.objects.using('shard2').get(pk=bill_id)
+        self.assertEqual(moved.created_at, created_at)
+        self.assertEqual(moved.order_items.count(), 1)
+        self.assertEqual(KitchenStream.objects.using('shard2').get(restaurant=restaurant).last_sequence, 1)
+        self.assertFalse(Bill.objects.using('default').exists())
+        self.assertFalse(MenuItem.objects.using('default').exists())
+        self.assertEqual(RestaurantMove.objects.using('default').get(restaurant=restaurant).moved_to, 'shard2')
+
+        # A process that still has the old shard cached can't write there
+        with sharding.for_restaurant(stale), self.assertRaises(sharding.RestaurantMoving):
+            with sharding.atomic():
+                pass
+
+        # New orders carry on where they left off
+        self.assertGreaterEqual(self.order(restaurant, menu_item), 2 * settings.SHARD_ID_BLOCK)
+        self.assertEqual(KitchenStream.objects.using('shard2').get(restaurant=restaurant).last_sequence, 2)
+
+    def test_moved_ids_do_not_collide(self):
+        restaurant, menu_item = self.create_restaurant("upper-diner", shard='shard2')
+        moved_bill = self.order(restaurant, menu_item)
+        other, other_item = self.create_restaurant("lower-diner", shard='shard1')
+
+        # shard1 now holds ids from shard2's block, so it starts a block of its own
+        self.move(restaurant, 'shard1')
+        self.assertGreaterEqual(self.order(other, other_item), 3 * settings.SHARD_ID_BLOCK)
+        self.assertTrue(Bill.objects.using('shard1').filter(pk=moved_bill).exists())
+
+    def test_dashboard_adds_up_every_shard(self):
+        here, _ = self.create_restaurant("default-diner")
+        there, _ = self.create_restaurant("shard-diner", shard='shard1')
+        for restaurant, quantity in ((here, 2), (there, 3)):
+            with sharding.for_restaurant(restaurant):
+                DailySales.objects.create(
+                    restaurant=restaurant, business_date=restaurant.business_date(), item_name="Dosa",
+                    variant_name="Full", quantity=quantity, revenue=quantity * 120
+                )
+        self.assertTrue(DailySales.objects.using('shard1').filter(restaurant=there).exists())
+
+        data = sales.dashboard()
+        self.assertEqual(data['sales_today'], "600.00")
+        self.assertEqual(data['top_dish_today'], "Dosa (Full)")
+        self.assertEqual(sales.dashboard(restaurant=there)['sales_today'], "360.00")
@@ -2,7 +2,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    PublicMenuListView, OrderCreateView, ChefOrderItemUpdateView, 
+    PublicMenuListView, OrderCreateView, ChefOrderItemUpdateView, ChefOrderItemBulkUpdateView,
     CaptainOrderCreateView, CaptainReorderView, CashierBillListView, 
     CashierMarkAsPaidView, AdminAnalyticsView,
     MenuItemManageViewSet, CategoryManageViewSet, FoodTypeViewSet, 
@@ -24,6 +24,7 @@ urlpatterns = [
     path('restaurants/<slug:restaurant_slug>/orders/', FrontendOrderCreateView.as_view(), name='frontend-order-create'),
     # --- Internal Staff URLs ---
     path('order-items/<int:item_id>/update-status/', ChefOrderItemUpdateView.as_view(), name='update-order-item-status'),
+    path('order-items/bulk-update-status/', ChefOrderItemBulkUpdateView.as_view(), name='bulk-update-order-item-status'),
     path('captain/orders/create/', CaptainOrderCreateView.as_view(), name='captain-order-create'),
     path('captain/bills/<int:bill_id>/reorder/', CaptainReorderView.as_view(), name='captain-reorder'),
     path('cashier/pending-bills/', CashierBillListView.as_view(), name='cashier-bill-list'),
@@ -6,10 +6,8 @@ from .serializers import CategorySerializer, BillSerializer, OrderItemWriteSeria
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
-from geopy.distance import geodesic
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from users.permissions import IsChefOrAdmin, IsCaptainOrAdmin, IsCashierOrAdmin
+from restaurants.geofence import geofence_for
+from users.permissions import IsChefOrAdmin, IsCaptainOrAdmin, IsCashierOrAdmin, IsStaffUser
 from restaurants.models import Restaurant 
 from .models import FoodType, Cuisine, Category 
 from .serializers import FoodTypeSerializer, CuisineSerializer, CategoryManageSerializer 
@@ -18,9 +16,21 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authentication import SessionAuthentication
 from .serializers import CashierBillSerializer ,MenuItemManageSerializer , PublicMenuItemSerializer, PublicMenuItemVariantSerializer
 from django.utils import timezone
-from django.db.models import Sum, F, Count
-from .serializers import FrontendOrderSerializer
+from django.db.models import Q
+from .serializers import FrontendOrderSerializer, BulkOrderItemStatusSerializer
 from datetime import timedelta
+from . import cache as menu_cache
+from . import outbox
+from . import billing
+from . import kitchen_events
+from . import sales
+from . import exports
+from . import archive
+from . import sharding
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from .pagination import KeysetPagination, OldestFirstKeysetPagination
+from restromanager.routers import ReplicaReadMixin
 
 
 # class MenuListView(generics.ListAPIView):
@@ -40,7 +50,7 @@ class OrderCreateView(APIView):
 
     def post(self, request, restaurant_slug, *args, **kwargs):
         # First, get the specific restaurant from the URL
-        restaurant = get_object_or_404(Restaurant, slug=restaurant_slug)
+        restaurant = request.restaurant
         
         # --- DYNAMIC Geofencing Logic ---
         customer_location_str = request.data.get('location')
@@ -52,12 +62,8 @@ class OrderCreateView(APIView):
         except (ValueError, TypeError):
             return Response({'error': 'Invalid location format.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Use the restaurant's location from the database
-        restaurant_location = (restaurant.latitude, restaurant.longitude)
-        max_distance = restaurant.radius_meters
-
-        distance = geodesic(restaurant_location, customer_location).meters
-        if distance > max_distance:
+        # Check against the restaurant's (cached) geofence
+        if not geofence_for(restaurant).contains(*customer_location):
             return Response({'error': 'You are too far away to place an order.'}, status=status.HTTP_403_FORBIDDEN)
             
         # Process the order
@@ -65,25 +71,15 @@ class OrderCreateView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Assign the bill to the correct restaurant before saving
-        bill_instance = serializer.save(restaurant=restaurant)
-
-        # ... (The rest of the WebSocket logic remains the same) ...
-        detailed_items = [{
-            'order_item_id': item.id, 'name': item.variant.menu_item.name,
-            'variant': item.variant.variant_name, 'quantity': item.quantity
-        } for item in bill_instance.order_items.all()]
-        
-        websocket_message = {
-            'bill_id': bill_instance.id, 'customer_name': bill_instance.customer_name,
-            'table_number': bill_instance.table_number, 'items': detailed_items
-        }
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'chef_notifications_{restaurant.slug}', # Channel is now restaurant-specific
-            {'type': 'send.new.order', 'data': websocket_message}
-        )
+        with sharding.atomic():
+            # Assign the bill to the correct restaurant before saving
+            bill_instance = serializer.save(restaurant=restaurant)
+
+            websocket_message = kitchen_events.new_order_message(bill_instance, bill_instance.order_items.all())
+            detailed_items = websocket_message['items']
+            
+            # Queued in the same transaction; the outbox dispatcher delivers it
+            kitchen_events.publish(restaurant, 'send.new.order', websocket_message)
         
         response_data = {
             'bill_id': bill_instance.id, 'customer_name': bill_instance.customer_name,
@@ -102,79 +98,99 @@ class ChefOrderItemUpdateView(APIView):
         if new_status not in valid_statuses:
             return Response({"error": "Invalid status provided."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            order_item = OrderItem.objects.get(id=order_item_id)
-        except OrderItem.DoesNotExist:
-            return Response({"error": "Order item not found."}, status=status.HTTP_404_NOT_FOUND)
+        with sharding.atomic():
+            try:
+                # Lock the row so concurrent updates can't double-count the bill totals
+                order_item = OrderItem.objects.select_for_update().select_related('variant').get(id=order_item_id)
+            except OrderItem.DoesNotExist:
+                return Response({"error": "Order item not found."}, status=status.HTTP_404_NOT_FOUND)
+
+            old_status = order_item.status
+            order_item.status = new_status
+            order_item.save()
+            ready_for_payment = billing.status_changed(order_item, old_status)
+
+            customer_message = {
+                'order_item_id': order_item.id,
+                'new_status': order_item.get_status_display()
+            }
+
+            if new_status == OrderItem.OrderStatus.ACCEPTED:
+                customer_message['preparation_time'] = order_item.variant.preparation_time
+
+            outbox.enqueue(f'customer_{order_item.bill_id}', 'send_status_update', customer_message)
+
+            # The bill's open-item counter just reached zero: let the cashier know
+            if ready_for_payment:
+                [(restaurant_slug, cashier_message)] = billing.cashier_messages([order_item.bill_id])
+                outbox.enqueue(
+                    f'cashier_notifications_{restaurant_slug}',
+                    'order_ready_for_payment', cashier_message
+                )
 
-        order_item.status = new_status
-        order_item.save()
+        return Response({"message": f"Order item {order_item_id} updated to {new_status}"}, status=status.HTTP_200_OK)
 
-        customer_message = {
-            'order_item_id': order_item.id,
-            'new_status': order_item.get_status_display()
-        }
+class ChefOrderItemBulkUpdateView(APIView):
+    """
+    Lets the kitchen accept or complete a whole ticket at once. All changes
+    are applied in one transaction, and each customer bill and cashier group
+    gets a single combined WebSocket message.
+    """
+    permission_classes = [IsAuthenticated, IsChefOrAdmin]
 
-        if new_status == OrderItem.OrderStatus.ACCEPTED:
-            customer_message['preparation_time'] = order_item.variant.preparation_time
+    def post(self, request, *args, **kwargs):
+        serializer = BulkOrderItemStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        new_statuses = {item['id']: item['status'] for item in serializer.validated_data['items']}
+
+        with sharding.atomic():
+            # Another restaurant's items are reported as missing
+            order_items = OrderItem.objects.select_for_update().select_related('variant').filter(
+                bill__restaurant_id=request.user.restaurant_id
+            ).in_bulk(new_statuses.keys())
+            missing = new_statuses.keys() - order_items.keys()
+            if missing:
+                return Response(
+                    {"error": f"Order items not found: {sorted(missing)}"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
 
-        try:
-            channel_layer = get_channel_layer()
-            customer_bill_id = order_item.bill.id
-
-            async_to_sync(channel_layer.group_send)(
-                f'customer_{customer_bill_id}',
-                {
-                    'type': 'send_status_update',
-                    'data': customer_message
+            now = timezone.now()
+            changes = []
+            for item_id, new_status in new_statuses.items():
+                order_item = order_items[item_id]
+                changes.append((order_item, order_item.status))
+                order_item.status = new_status
+                order_item.updated_at = now
+            OrderItem.objects.bulk_update(order_items.values(), ['status', 'updated_at'])
+            ready_bill_ids = billing.statuses_changed(changes)
+
+            # One message per customer bill...
+            customer_updates = {}
+            for order_item, _ in changes:
+                update = {
+                    'order_item_id': order_item.id,
+                    'new_status': order_item.get_status_display()
                 }
-            )
-            
-            # Check if this is the last item in the order to be marked as COMPLETED
-            if new_status == OrderItem.OrderStatus.COMPLETED:
-                # Get all items in this bill
-                bill_items = OrderItem.objects.filter(bill=order_item.bill)
-                # Check if all items are now completed
-                all_completed = all(item.status == OrderItem.OrderStatus.COMPLETED for item in bill_items)
-                
-                if all_completed:
-                    # Prepare data for cashier notification
-                    bill = order_item.bill
-                    restaurant = bill.restaurant
-                    
-                    # Calculate total amount
-                    total_amount = sum(item.variant.price * item.quantity for item in bill_items)
-                    
-                    # Format items for the cashier
-                    items_data = [{
-                        'name': item.variant.menu_item.name,
-                        'variant_name': item.variant.variant_name,
-                        'quantity': item.quantity,
-                        'price': float(item.variant.price)
-                    } for item in bill_items]
-                    
-                    # Prepare the message
-                    cashier_message = {
-                        'id': bill.id,
-                        'table_number': bill.table_number,
-                        'totalAmount': float(total_amount),
-                        'items': items_data
-                    }
-                    
-                    # Send notification to cashier
-                    async_to_sync(channel_layer.group_send)(
-                        f'cashier_notifications_{restaurant.slug}',
-                        {
-                            'type': 'order_ready_for_payment',
-                            'data': cashier_message
-                        }
-                    )
-        except Exception as e:
-            # Log the error but continue with the response
-            print(f"WebSocket notification error: {e}")
-            # The status update was still saved to the database
-
-        return Response({"message": f"Order item {order_item_id} updated to {new_status}"}, status=status.HTTP_200_OK)
+                if order_item.status == OrderItem.OrderStatus.ACCEPTED:
+                    update['preparation_time'] = order_item.variant.preparation_time
+                customer_updates.setdefault(order_item.bill_id, []).append(update)
+            for bill_id, updates in customer_updates.items():
+                outbox.enqueue(f'customer_{bill_id}', 'send_status_update', {'updates': updates})
+
+            # ...and one per restaurant cashier group
+            ready_bills = {}
+            if ready_bill_ids:
+                for restaurant_slug, cashier_message in billing.cashier_messages(ready_bill_ids):
+                    ready_bills.setdefault(restaurant_slug, []).append(cashier_message)
+            for restaurant_slug, bills in ready_bills.items():
+                outbox.enqueue(f'cashier_notifications_{restaurant_slug}', 'order_ready_for_payment', {'bills': bills})
+
+        return Response({
+            "message": f"{len(changes)} order items updated.",
+            "ready_for_payment": sorted(ready_bill_ids)
+        }, status=status.HTTP_200_OK)
 
 class CaptainOrderCreateView(APIView):
     permission_classes = [IsAuthenticated, IsCaptainOrAdmin]
@@ -185,31 +201,21 @@ class CaptainOrderCreateView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         # Get the restaurant from the user
-        restaurant = request.user.restaurant
-        if not restaurant:
+        if request.user.restaurant_id is None:
             return Response(
                 {"error": "User is not associated with any restaurant"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        restaurant = request.restaurant
         
-        bill_instance = serializer.save(restaurant=restaurant)
+        with sharding.atomic():
+            bill_instance = serializer.save(restaurant=restaurant)
 
-        # Build and send the WebSocket message
-        detailed_items = [{
-            'order_item_id': item.id, 'name': item.variant.menu_item.name,
-            'variant': item.variant.variant_name, 'quantity': item.quantity
-        } for item in bill_instance.order_items.all()]
-        
-        websocket_message = {
-            'bill_id': bill_instance.id, 'customer_name': bill_instance.customer_name,
-            'table_number': bill_instance.table_number, 'items': detailed_items
-        }
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'chef_notifications_{restaurant.slug}',
-            {'type': 'send.new.order', 'data': websocket_message}
-        )
+            # Build and queue the WebSocket message
+            websocket_message = kitchen_events.new_order_message(bill_instance, bill_instance.order_items.all())
+            detailed_items = websocket_message['items']
+            
+            kitchen_events.publish(restaurant, 'send.new.order', websocket_message)
         
         response_data = {
             'bill_id': bill_instance.id, 'customer_name': bill_instance.customer_name,
@@ -233,40 +239,30 @@ class CaptainReorderView(APIView):
             return Response(item_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         new_items_data = item_serializer.validated_data
-        new_order_items = []
-        for item_data in new_items_data:
-            order_item = OrderItem.objects.create(
-                bill=bill,
-                variant_id=item_data['variant_id'],
-                quantity=item_data['quantity']
-            )
-            new_order_items.append(order_item)
-
-        # --- Broadcast ONLY the new items to the Chef Panel ---
-        detailed_items = []
-        for item in new_order_items:
-            detailed_items.append({
-                'order_item_id': item.id, 'name': item.variant.menu_item.name,
-                'variant': item.variant.variant_name, 'quantity': item.quantity
-            })
-        
-        websocket_message = {
-            'bill_id': bill.id, 'customer_name': bill.customer_name,
-            'table_number': bill.table_number, 'items': detailed_items
-        }
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'chef_notifications',
-            {'type': 'send.new.order', 'data': websocket_message}
-        )
+        with sharding.atomic():
+            new_order_items = OrderItem.objects.bulk_create([
+                OrderItem.from_variant(item_data['variant'], bill=bill, quantity=item_data['quantity'])
+                for item_data in new_items_data
+            ])
+            billing.items_added(bill, new_order_items)
+
+            # --- Broadcast ONLY the new items to the Chef Panel ---
+            websocket_message = kitchen_events.new_order_message(bill, new_order_items)
+            kitchen_events.publish(bill.restaurant, 'send.new.order', websocket_message)
 
         return Response({"message": "Items added successfully."}, status=status.HTTP_200_OK)
 
 class CashierBillListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated, IsCashierOrAdmin]
     serializer_class = CashierBillSerializer
-    queryset = Bill.objects.filter(payment_status=Bill.PaymentStatus.PENDING).prefetch_related('order_items__variant__menu_item')
+    pagination_class = OldestFirstKeysetPagination
+
+    def get_queryset(self):
+        # Only the cashier's own restaurant
+        return Bill.objects.filter(
+            restaurant=self.request.restaurant,
+            payment_status=Bill.PaymentStatus.PENDING
+        ).order_by('created_at', 'id').prefetch_related('order_items')
 
 class CashierMarkAsPaidView(APIView):
     permission_classes = [IsAuthenticated, IsCashierOrAdmin]
@@ -288,153 +284,135 @@ class CashierMarkAsPaidView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Update the bill with both the new status and the payment method
-        bill.payment_status = Bill.PaymentStatus.PAID
-        bill.payment_method = payment_method
-        bill.save()
+        # Update the bill with both the new status and the payment method.
+        # The conditional update makes sure a bill is only ever paid (and
+        # counted in the sales rollup) once, even if the cashier double-clicks.
+        with sharding.atomic():
+            paid = Bill.objects.filter(id=bill_id, payment_status=Bill.PaymentStatus.PENDING).update(
+                payment_status=Bill.PaymentStatus.PAID,
+                payment_method=payment_method,
+                updated_at=timezone.now()
+            )
+            if not paid:
+                return Response({"error": "Active bill not found."}, status=status.HTTP_404_NOT_FOUND)
+            sales.record_paid_bill(bill)
         
         return Response({"message": f"Bill {bill_id} has been marked as PAID with method {payment_method}."}, status=status.HTTP_200_OK)
 
-class AdminAnalyticsView(APIView):
+class AdminAnalyticsView(ReplicaReadMixin, APIView):
     """
     Provides analytics data for the admin dashboard.
     """
 
 
     def get(self, request, *args, **kwargs):
-        today = timezone.now().date()
-        current_month = today.month
-        current_year = today.year
-
-        # --- 1. Calculate Sales Today ---
-        sales_today_query = OrderItem.objects.filter(
-            bill__payment_status=Bill.PaymentStatus.PAID,
-            created_at__date=today
-        ).aggregate(
-            total_sales=Sum(F('quantity') * F('variant__price'))
-        )
-        sales_today = sales_today_query['total_sales'] or 0
-
-        # --- 2. Calculate Sales This Month ---
-        sales_month_query = OrderItem.objects.filter(
-            bill__payment_status=Bill.PaymentStatus.PAID,
-            created_at__year=current_year,
-            created_at__month=current_month
-        ).aggregate(
-            total_sales=Sum(F('quantity') * F('variant__price'))
-        )
-        sales_this_month = sales_month_query['total_sales'] or 0
-
-        # --- 3. Find Top Dish Today ---
-        top_dish_today_query = OrderItem.objects.filter(
-            bill__payment_status=Bill.PaymentStatus.PAID,
-            created_at__date=today
-        ).values(
-            'variant__menu_item__name', 'variant__variant_name'
-        ).annotate(
-            total_quantity=Sum('quantity')
-        ).order_by('-total_quantity').first()
-        
-        top_dish_today = "N/A"
-        if top_dish_today_query:
-            top_dish_today = f"{top_dish_today_query['variant__menu_item__name']} ({top_dish_today_query['variant__variant_name']})"
-
-        # --- 4. Find Top Dish This Month ---
-        top_dish_month_query = OrderItem.objects.filter(
-            bill__payment_status=Bill.PaymentStatus.PAID,
-            created_at__year=current_year,
-            created_at__month=current_month
-        ).values(
-            'variant__menu_item__name', 'variant__variant_name'
-        ).annotate(
-            total_quantity=Sum('quantity')
-        ).order_by('-total_quantity').first()
-
-        top_dish_this_month = "N/A"
-        if top_dish_month_query:
-            top_dish_this_month = f"{top_dish_month_query['variant__menu_item__name']} ({top_dish_month_query['variant__variant_name']})"
-
-        # --- Assemble the final data ---
-        data = {
-            'sales_today': f"{sales_today:.2f}",
-            'sales_this_month': f"{sales_this_month:.2f}",
-            'top_dish_today': top_dish_today,
-            'top_dish_this_month': top_dish_this_month
-        }
-
+        # Answered from the daily sales rollup (see menu/sales.py)
+        data = sales.dashboard()
         return Response(data, status=status.HTTP_200_OK)
 
-class MenuItemManageViewSet(viewsets.ModelViewSet):
+class MenuItemManageViewSet(sharding.ShardAtomicMixin, viewsets.ModelViewSet):
     """
     A ViewSet for Restaurant Admins to manage their own MenuItems.
     """
     serializer_class = MenuItemManageSerializer
-    permission_classes = [IsAuthenticated] # Ensures only logged-in users can access this
+    permission_classes = [IsAuthenticated, IsStaffUser] # Ensures only logged-in admins can access this
 
     def get_queryset(self):
         """
         This is the key to multi-tenancy. It filters the menu items to show
         only the ones that belong to the logged-in user's restaurant.
         """
-        user = self.request.user
-        return MenuItem.objects.filter(restaurant=user.restaurant)
+        return MenuItem.objects.filter(restaurant=self.request.restaurant)
 
     def perform_create(self, serializer):
         """
         This is another key to multi-tenancy. When a new menu item is created,
         it's automatically assigned to the logged-in user's restaurant.
         """
-        serializer.save(restaurant=self.request.user.restaurant)
+        serializer.save(restaurant=self.request.restaurant)
 
 class PublicMenuListView(generics.ListAPIView):
     """
     Provides a public, flat list of all available menu items for a
     specific restaurant.
+
+    Unlike the other heavy reads it stays on the primary database: the
+    payload is cached under the menu version, so one built from a replica
+    that lags behind an edit would be served until the next edit.
     """
     serializer_class = PublicMenuItemSerializer
     permission_classes = [AllowAny] # This is a public endpoint
+    authentication_classes = [] # No need to decode tokens on a public endpoint
+
+    def get_restaurant_id(self):
+        # The restaurant named in the URL, usually from the in-process cache
+        return self.request.restaurant.id
 
     def get_queryset(self):
         """
         Filters the menu to show only available items for the restaurant
         specified in the URL.
         """
-        restaurant_slug = self.kwargs.get('restaurant_slug')
-        restaurant = get_object_or_404(Restaurant, slug=restaurant_slug)
-        
         # Return only items that are marked as available for that restaurant
         return MenuItem.objects.filter(
-            restaurant=restaurant,
+            restaurant_id=self.get_restaurant_id(),
             is_available=True
         ).prefetch_related('variants', 'food_types', 'cuisines')
 
-class CategoryManageViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        """
+        Serves the menu from the cache, keyed by the restaurant's menu version.
+        Clients that send back the ETag they already have get a 304 without
+        any database or serializer work.
+        """
+        restaurant_id = self.get_restaurant_id()
+        version = menu_cache.get_menu_version(restaurant_id)
+        etag = menu_cache.menu_etag(restaurant_id, version)
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = menu_cache.get_cached_menu(restaurant_id, version)
+            if data is None:
+                data = self.get_serializer(self.get_queryset(), many=True).data
+                menu_cache.set_cached_menu(restaurant_id, version, data)
+            response = Response(data)
+
+        response['ETag'] = etag
+        # Phones must revalidate every time, but can reuse their copy on a 304
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+class CategoryManageViewSet(sharding.ShardAtomicMixin, viewsets.ModelViewSet):
     serializer_class = CategoryManageSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
 
     def get_queryset(self):
-        return Category.objects.filter(restaurant=self.request.user.restaurant)
+        return Category.objects.filter(restaurant=self.request.restaurant)
 
     def perform_create(self, serializer):
-        serializer.save(restaurant=self.request.user.restaurant)
+        serializer.save(restaurant=self.request.restaurant)
 
 class FoodTypeViewSet(viewsets.ModelViewSet):
     serializer_class = FoodTypeSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
     queryset = FoodType.objects.all() # These are global, not per-restaurant
 
 class CuisineViewSet(viewsets.ModelViewSet):
     serializer_class = CuisineSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
     queryset = Cuisine.objects.all() # These are also global
 
 class RestaurantOrderViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Provides a read-only API endpoint for a Restaurant Admin to view
-    their own restaurant's orders.
+    their own restaurant's orders. The list includes archived bills; a
+    single archived bill is not looked up by id.
     """
     serializer_class = RestaurantOrderListSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """
@@ -443,69 +421,31 @@ class RestaurantOrderViewSet(viewsets.ReadOnlyModelViewSet):
         and shows the most recent ones first.
         """
         return Bill.objects.filter(
-            restaurant=self.request.user.restaurant
-        ).order_by('-created_at').prefetch_related('order_items__variant__menu_item')
-
-class RestaurantAnalyticsView(APIView):
+            restaurant=self.request.restaurant
+        ).order_by('-created_at', '-id').prefetch_related('order_items')
+
+    def archived_bills(self, after=None, descending=True):
+        # Old paid bills have moved to the order archive (see menu/archive.py);
+        # the paginator merges these in as well
+        return archive.bills(self.request.restaurant.id, after=after, descending=descending)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        bills = archive.merge([queryset, self.archived_bills()])
+        return Response(self.get_serializer(bills, many=True).data)
+
+class RestaurantAnalyticsView(ReplicaReadMixin, APIView):
     """
     Provides analytics data specifically for the logged-in Restaurant Admin.
     """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        today = timezone.now().date()
-        current_month = today.month
-        current_year = today.year
-
-        # Base queryset filtered for the admin's restaurant and paid bills
-        base_queryset = OrderItem.objects.filter(
-            bill__restaurant=user.restaurant,
-            bill__payment_status=Bill.PaymentStatus.PAID
-        )
-
-        # 1. Calculate Sales Today
-        sales_today_query = base_queryset.filter(created_at__date=today).aggregate(
-            total_sales=Sum(F('quantity') * F('variant__price'))
-        )
-        sales_today = sales_today_query['total_sales'] or 0
-
-        # 2. Calculate Sales This Month
-        sales_month_query = base_queryset.filter(
-            created_at__year=current_year, created_at__month=current_month
-        ).aggregate(
-            total_sales=Sum(F('quantity') * F('variant__price'))
-        )
-        sales_this_month = sales_month_query['total_sales'] or 0
-
-        # 3. Find Top Dish Today
-        top_dish_today_query = base_queryset.filter(created_at__date=today).values(
-            'variant__menu_item__name', 'variant__variant_name'
-        ).annotate(total_quantity=Sum('quantity')).order_by('-total_quantity').first()
-        
-        top_dish_today = "N/A"
-        if top_dish_today_query:
-            top_dish_today = f"{top_dish_today_query['variant__menu_item__name']} ({top_dish_today_query['variant__variant_name']})"
-
-        # 4. Find Top Dish This Month
-        top_dish_month_query = base_queryset.filter(
-            created_at__year=current_year, created_at__month=current_month
-        ).values(
-            'variant__menu_item__name', 'variant__variant_name'
-        ).annotate(total_quantity=Sum('quantity')).order_by('-total_quantity').first()
-
-        top_dish_this_month = "N/A"
-        if top_dish_month_query:
-            top_dish_this_month = f"{top_dish_month_query['variant__menu_item__name']} ({top_dish_month_query['variant__variant_name']})"
-
-        # Assemble the final data
-        data = {
-            'sales_today': f"{sales_today:.2f}",
-            'sales_this_month': f"{sales_this_month:.2f}",
-            'top_dish_today': top_dish_today,
-            'top_dish_this_month': top_dish_this_month
-        }
-
+        # Sales of the admin's restaurant, from the daily sales rollup
+        data = sales.dashboard(restaurant=request.restaurant)
         return Response(data, status=status.HTTP_200_OK)
 
 class FrontendOrderCreateView(APIView):
@@ -515,7 +455,7 @@ class FrontendOrderCreateView(APIView):
     permission_classes = [AllowAny] # This is a public endpoint
 
     def post(self, request, restaurant_slug, *args, **kwargs):
-        restaurant = get_object_or_404(Restaurant, slug=restaurant_slug)
+        restaurant = request.restaurant
 
         # 1. Validate the incoming data format
         serializer = FrontendOrderSerializer(data=request.data)
@@ -523,48 +463,43 @@ class FrontendOrderCreateView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         validated_data = serializer.validated_data
+        items_data = validated_data['items']
+
+        # 2. Resolve every (menu_item_id, variant_name) pair in a single query
+        wanted = {(item_data['menu_item_id'], item_data['variant_name']) for item_data in items_data}
+        lookup = Q(pk__in=[])
+        for menu_item_id, variant_name in wanted:
+            lookup |= Q(menu_item_id=menu_item_id, variant_name=variant_name)
+        variants = {
+            (variant.menu_item_id, variant.variant_name): variant
+            for variant in MenuItemVariant.objects.filter(
+                lookup,
+                menu_item__restaurant=restaurant # Ensure it belongs to this restaurant
+            ).select_related('menu_item')
+        }
+        if len(variants) != len(wanted):
+            return Response({'error': 'An invalid menu item was submitted.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 2. Create the Bill
-        bill = Bill.objects.create(
-            restaurant=restaurant,
-            customer_name=validated_data['customer_name'],
-            table_number=validated_data['table_number']
-        )
-        
-        # 3. Find variants and create OrderItems
-        order_items_for_broadcast = []
-        try:
-            for item_data in validated_data['items']:
-                variant = MenuItemVariant.objects.get(
-                    menu_item_id=item_data['menu_item_id'],
-                    variant_name=item_data['variant_name'],
-                    menu_item__restaurant=restaurant # Ensure it belongs to this restaurant
-                )
-                order_item = OrderItem.objects.create(
+        # 3. Create the Bill, all of its OrderItems and the chef notification in one transaction
+        with sharding.atomic():
+            bill = Bill.objects.create(
+                restaurant=restaurant,
+                customer_name=validated_data['customer_name'],
+                table_number=validated_data['table_number']
+            )
+            order_items = OrderItem.objects.bulk_create([
+                OrderItem.from_variant(
+                    variants[(item_data['menu_item_id'], item_data['variant_name'])],
                     bill=bill,
-                    variant=variant,
                     quantity=item_data['quantity']
                 )
-                # Prepare item details for the real-time message
-                order_items_for_broadcast.append({
-                    'order_item_id': order_item.id, 'name': variant.menu_item.name,
-                    'variant': variant.variant_name, 'quantity': order_item.quantity
-                })
-        except MenuItemVariant.DoesNotExist:
-            # If any item is invalid, delete the created bill and return an error
-            bill.delete()
-            return Response({'error': 'An invalid menu item was submitted.'}, status=status.HTTP_400_BAD_REQUEST)
+                for item_data in items_data
+            ])
+            billing.items_added(bill, order_items)
 
-        # 4. Broadcast to the Chef's Panel
-        websocket_message = {
-            'bill_id': bill.id, 'customer_name': bill.customer_name,
-            'table_number': bill.table_number, 'items': order_items_for_broadcast
-        }
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'chef_notifications_{restaurant.slug}',
-            {'type': 'send.new.order', 'data': websocket_message}
-        )
+            # 4. Queue the broadcast to the Chef's Panel, built from the rows we already have
+            websocket_message = kitchen_events.new_order_message(bill, order_items)
+            kitchen_events.publish(restaurant, 'send.new.order', websocket_message)
         
         # 5. Return the response in the format the frontend expects
         response_data = {
@@ -581,52 +516,92 @@ class KitchenOrderListView(generics.ListAPIView):
     serializer_class = KitchenOrderSerializer
     permission_classes = [IsAuthenticated, IsChefOrAdmin]
 
-    def get_queryset(self):
-        user = self.request.user
-        
-        # Determine the restaurant from the logged-in user (Admin) or token (Chef)
-        if hasattr(user, 'restaurant') and user.restaurant:
-            restaurant = user.restaurant
-        else:
-            restaurant_id = self.request.auth.get('restaurant_id')
-            restaurant = get_object_or_404(Restaurant, id=restaurant_id)
+    def get_restaurant_id(self):
+        # Resolved from the token's restaurant_id through the in-process
+        # cache, so polling costs no query; 404 for a user without one
+        return self.request.restaurant.id
 
+    def get_queryset(self):
         # Fetch unpaid bills that have at least one item that is not yet completed
-        return Bill.objects.filter(
-            restaurant=restaurant,
-            payment_status=Bill.PaymentStatus.PENDING,
-            order_items__status__in=[
-                OrderItem.OrderStatus.PENDING,
-                OrderItem.OrderStatus.ACCEPTED
-            ]
-        ).distinct().order_by('created_at').prefetch_related('order_items__variant__menu_item')
-
-class AdminOrderReportView(generics.ListAPIView):
+        return kitchen_events.active_orders(self.get_restaurant_id())
+
+    def list(self, request, *args, **kwargs):
+        # The kitchen sequence number this list is current as of; the chef
+        # panel passes it as last_seq when it (re)connects to its WebSocket.
+        # Read before the orders, so nothing placed in between is missed.
+        sequence = kitchen_events.current_sequence(self.get_restaurant_id())
+        response = super().list(request, *args, **kwargs)
+        response['X-Kitchen-Seq'] = str(sequence)
+        return response
+
+class AdminOrderReportView(ReplicaReadMixin, generics.ListAPIView):
     """
     Provides a historical order report for the Restaurant Admin,
     filterable by a time period ('today', 'week', 'month', 'year').
     """
     serializer_class = RestaurantOrderListSerializer # We can reuse our detailed order serializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
+    pagination_class = KeysetPagination
 
-    def get_queryset(self):
-        user = self.request.user
-        restaurant = user.restaurant
-        
+    def get_period_start(self):
+        """
+        First business day of the requested period (see Restaurant.business_date),
+        or None for an unknown period, which covers all history.
+        """
         # Get the 'period' from the URL, e.g., /.../?period=week
         period = self.request.query_params.get('period', 'today').lower()
-        
-        today = timezone.now().date()
-        queryset = Bill.objects.filter(restaurant=restaurant)
+        today = self.request.restaurant.business_date()
 
         if period == 'today':
-            queryset = queryset.filter(created_at__date=today)
+            return today
         elif period == 'week':
-            start_of_week = today - timedelta(days=7)
-            queryset = queryset.filter(created_at__date__gte=start_of_week)
+            return today - timedelta(days=7)
         elif period == 'month':
-            queryset = queryset.filter(created_at__year=today.year, created_at__month=today.month)
+            return today.replace(day=1)
         elif period == 'year':
-            queryset = queryset.filter(created_at__year=today.year)
-        
-        return queryset.order_by('-created_at')
+            return today.replace(month=1, day=1)
+        return None
+
+    def get_queryset(self):
+        queryset = Bill.objects.filter(restaurant=self.request.restaurant)
+        start = self.get_period_start()
+        if start is not None:
+            queryset = queryset.filter(business_date__gte=start)
+
+        # The serializer lists each bill's items; fetch them all in one query
+        return queryset.order_by('-created_at', '-id').prefetch_related('order_items')
+
+    def archived_bills(self, after=None, descending=True):
+        # Old paid bills have moved to the order archive (see menu/archive.py);
+        # the paginator merges these in as well
+        return archive.bills(self.request.restaurant.id, since=self.get_period_start(), after=after, descending=descending)
+
+    def list(self, request, *args, **kwargs):
+        # ?export=csv or ?export=ndjson streams the report instead of
+        # building one JSON document, so any period can be downloaded
+        export = request.query_params.get('export')
+        if export is None:
+            queryset = self.get_queryset()
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            bills = archive.merge([queryset, self.archived_bills()])
+            return Response(self.get_serializer(bills, many=True).data)
+
+        if export not in exports.FORMATS:
+            return Response(
+                {'error': f"Invalid export. Must be one of {sorted(exports.FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows, content_type = exports.FORMATS[export]
+        period = request.query_params.get('period', 'today').lower()
+        # The body is streamed after the view returns; pin the database chosen for it now
+        queryset = self.get_queryset()
+        queryset = queryset.using(queryset.db)
+        bills = archive.merge([exports.iterate(queryset), self.archived_bills()])
+        lines = rows(bills)
+        if isinstance(request._request, ASGIRequest):
+            lines = exports.aiterate(lines)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders-{period}.{export}"'
+        return response
@@ -5,6 +5,7 @@ from .models import Restaurant
 
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug')
+    list_display = ('name', 'slug', 'time_zone', 'day_cutoff_hour', 'shard')
+    readonly_fields = ('shard',)
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)}
\ No newline at end of file
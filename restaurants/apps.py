@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RestaurantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'restaurants'
+
+    def ready(self):
+        # Drop saved or deleted restaurants from the request context cache
+        from . import signals  # noqa: F401
@@ -0,0 +1,76 @@
+# restaurants/context.py
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Restaurant
+
+# Process-local LRU of restaurant records (with their geofence fields), so
+# resolving the request's restaurant usually costs no query. Saving or
+# deleting a restaurant drops it here (see restaurants/signals.py); other
+# processes notice the change when their entry expires.
+_lock = threading.Lock()
+_records = OrderedDict()  # pk -> (expires_at, Restaurant)
+_slugs = {}               # slug -> pk
+
+
+def _cached(pk):
+    with _lock:
+        entry = _records.get(pk)
+        if entry is None:
+            return None
+        expires_at, restaurant = entry
+        if expires_at <= time.monotonic():
+            _drop(pk)
+            return None
+        _records.move_to_end(pk)
+        return restaurant
+
+
+def _drop(pk):
+    entry = _records.pop(pk, None)
+    if entry is not None and _slugs.get(entry[1].slug) == pk:
+        del _slugs[entry[1].slug]
+
+
+def _remember(restaurant):
+    with _lock:
+        _drop(restaurant.pk)
+        _records[restaurant.pk] = (time.monotonic() + settings.RESTAURANT_CONTEXT_TTL, restaurant)
+        _slugs[restaurant.slug] = restaurant.pk
+        while len(_records) > settings.RESTAURANT_CONTEXT_CACHE_SIZE:
+            _drop(next(iter(_records)))
+
+
+def get_restaurant(pk=None, slug=None):
+    """
+    The restaurant with this pk or slug, or None if there is none. Every
+    caller gets its own copy, so changing it doesn't touch the cached one.
+    """
+    lookup = {'pk': pk} if pk is not None else {'slug': slug}
+    if pk is None:
+        pk = _slugs.get(slug)
+    restaurant = _cached(pk) if pk is not None else None
+    if restaurant is None:
+        # Always from the primary: a lagging replica would be cached for the TTL
+        restaurant = Restaurant.objects.using(DEFAULT_DB_ALIAS).filter(**lookup).first()
+        if restaurant is None:
+            return None
+        _remember(restaurant)
+    return copy.copy(restaurant)
+
+
+def forget(pk):
+    with _lock:
+        _drop(pk)
+
+
+def clear():
+    with _lock:
+        _records.clear()
+        _slugs.clear()
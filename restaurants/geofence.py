@@ -0,0 +1,126 @@
+# restaurants/geofence.py
+
+import math
+from functools import lru_cache
+
+from geopy.distance import geodesic
+
+# Mean Earth radius used for the fast spherical approximation
+EARTH_RADIUS_METERS = 6371008.8
+
+# The spherical approximation is within ~0.6% of the WGS-84 geodesic distance.
+# Points closer to the fence than this fraction of the radius are re-checked
+# with geopy's exact (but much slower) geodesic solver.
+BOUNDARY_TOLERANCE = 0.01
+
+# Shortest length of one degree of latitude (at the equator) and longest length
+# of one degree of longitude (also at the equator) on the WGS-84 ellipsoid.
+# Using these keeps the bounding box a little larger than the fence, never smaller.
+MIN_METERS_PER_DEGREE_LAT = 110574.0
+MAX_METERS_PER_DEGREE_LON = 111320.0
+
+
+class Geofence:
+    """
+    A circular geofence around a restaurant.
+
+    The bounding box is computed once, so most far-away points are rejected
+    with four comparisons. Points inside the box are measured with a cheap
+    equirectangular distance, and only those within BOUNDARY_TOLERANCE of the
+    edge fall back to geopy's geodesic.
+    """
+
+    def __init__(self, latitude, longitude, radius_meters):
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.radius_meters = float(radius_meters)
+
+        self._inner_radius = self.radius_meters * (1 - BOUNDARY_TOLERANCE)
+        self._outer_radius = self.radius_meters * (1 + BOUNDARY_TOLERANCE)
+
+        self.lat_delta = self._outer_radius / MIN_METERS_PER_DEGREE_LAT
+        self.min_lat = self.latitude - self.lat_delta
+        self.max_lat = self.latitude + self.lat_delta
+
+        # The box is widest (in degrees of longitude) at its poleward edge
+        poleward_lat = min(90.0, max(abs(self.min_lat), abs(self.max_lat)))
+        meters_per_degree_lon = MAX_METERS_PER_DEGREE_LON * math.cos(math.radians(poleward_lat))
+        if meters_per_degree_lon * 180 <= self._outer_radius:
+            self.lon_delta = 180.0
+        else:
+            self.lon_delta = self._outer_radius / meters_per_degree_lon
+
+        self._lat_rad = math.radians(self.latitude)
+
+    def _exact_distance(self, lat, lon):
+        return geodesic((self.latitude, self.longitude), (lat, lon)).meters
+
+    def distance_meters(self, lat, lon):
+        """
+        Approximate distance from the restaurant, good to within ~0.6%.
+        """
+        dlat = math.radians(lat - self.latitude)
+        dlon = math.radians((lon - self.longitude + 180.0) % 360.0 - 180.0)
+        x = dlon * math.cos((self._lat_rad + math.radians(lat)) / 2)
+        return EARTH_RADIUS_METERS * math.hypot(x, dlat)
+
+    def contains(self, lat, lon):
+        """
+        Returns True if the point (lat, lon) is inside the geofence.
+        """
+        if not (self.min_lat <= lat <= self.max_lat):
+            return False
+        if abs((lon - self.longitude + 180.0) % 360.0 - 180.0) > self.lon_delta:
+            return False
+
+        distance = self.distance_meters(lat, lon)
+        if distance <= self._inner_radius:
+            return True
+        if distance > self._outer_radius:
+            return False
+        # Too close to the edge to trust the approximation
+        return self._exact_distance(lat, lon) <= self.radius_meters
+
+    def contains_many(self, latitudes, longitudes):
+        """
+        Vectorized version of contains() for many points at once, e.g. when
+        replaying audit logs. Takes two equal-length sequences (or NumPy arrays)
+        and returns a NumPy boolean array.
+        """
+        import numpy as np
+
+        lats = np.asarray(latitudes, dtype=np.float64)
+        lons = np.asarray(longitudes, dtype=np.float64)
+
+        dlon_deg = (lons - self.longitude + 180.0) % 360.0 - 180.0
+        in_box = (lats >= self.min_lat) & (lats <= self.max_lat) & (np.abs(dlon_deg) <= self.lon_delta)
+
+        result = np.zeros(lats.shape, dtype=bool)
+        idx = np.flatnonzero(in_box)
+        if idx.size == 0:
+            return result
+
+        box_lats = lats[idx]
+        dlat = np.radians(box_lats - self.latitude)
+        x = np.radians(dlon_deg[idx]) * np.cos((self._lat_rad + np.radians(box_lats)) / 2)
+        distance = EARTH_RADIUS_METERS * np.hypot(x, dlat)
+
+        result[idx[distance <= self._inner_radius]] = True
+
+        # Only the few points right at the edge need the exact solver
+        for i in idx[(distance > self._inner_radius) & (distance <= self._outer_radius)]:
+            result[i] = self._exact_distance(lats[i], lons[i]) <= self.radius_meters
+        return result
+
+
+@lru_cache(maxsize=1024)
+def _build_geofence(latitude, longitude, radius_meters):
+    return Geofence(latitude, longitude, radius_meters)
+
+
+def geofence_for(restaurant):
+    """
+    Returns the (cached) Geofence for a restaurant. The cache is keyed by the
+    location and radius, so editing a restaurant simply builds a new fence.
+    """
+    return _build_geofence(restaurant.latitude, restaurant.longitude, restaurant.radius_meters)
@@ -0,0 +1,69 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from geopy.distance import geodesic
+
+from restaurants.geofence import Geofence
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the fast geofence check against the plain geopy geodesic check'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=20000, help='Number of random customer locations')
+        parser.add_argument('--radius', type=int, default=200, help='Geofence radius in meters')
+        parser.add_argument('--spread', type=float, default=0.01,
+                            help='Max offset of the random points from the restaurant, in degrees')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        center = (12.9716, 77.5946)
+        radius = options['radius']
+        spread = options['spread']
+        points = [
+            (center[0] + rng.uniform(-spread, spread), center[1] + rng.uniform(-spread, spread))
+            for _ in range(options['points'])
+        ]
+        fence = Geofence(center[0], center[1], radius)
+
+        self.stdout.write(f"{len(points)} points, radius {radius} m, spread +/-{spread} deg\n")
+
+        start = time.perf_counter()
+        expected = [geodesic(center, point).meters <= radius for point in points]
+        geopy_time = time.perf_counter() - start
+        self.report('geopy geodesic', geopy_time, len(points))
+
+        start = time.perf_counter()
+        fast = [fence.contains(lat, lon) for lat, lon in points]
+        fast_time = time.perf_counter() - start
+        self.report('Geofence.contains', fast_time, len(points), geopy_time)
+
+        mismatches = sum(a != b for a, b in zip(expected, fast))
+
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.stdout.write(self.style.WARNING('NumPy is not installed, skipping Geofence.contains_many'))
+        else:
+            lats = [lat for lat, _ in points]
+            lons = [lon for _, lon in points]
+            start = time.perf_counter()
+            batched = fence.contains_many(lats, lons)
+            batch_time = time.perf_counter() - start
+            self.report('Geofence.contains_many', batch_time, len(points), geopy_time)
+            mismatches += sum(a != bool(b) for a, b in zip(expected, batched))
+
+        inside = sum(expected)
+        self.stdout.write(f"\n{inside} of {len(points)} points are inside the fence")
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"{mismatches} results differ from geopy"))
+        else:
+            self.stdout.write(self.style.SUCCESS('All results match geopy'))
+
+    def report(self, label, seconds, count, baseline=None):
+        line = f"{label:<24} {seconds * 1000:10.1f} ms  {seconds / count * 1e6:8.2f} us/point"
+        if baseline:
+            line += f"  ({baseline / seconds:6.1f}x faster)"
+        self.stdout.write(line)
@@ -0,0 +1,37 @@
+# restaurants/middleware.py
+
+from django.http import Http404
+from django.utils.functional import SimpleLazyObject
+
+from . import context
+
+
+def resolve_restaurant(request, slug=None):
+    # The restaurant in the URL, else the one in the caller's token claims
+    # (shared role logins) or on their StaffUser
+    if slug is not None:
+        restaurant = context.get_restaurant(slug=slug)
+    else:
+        restaurant_id = getattr(request.user, 'restaurant_id', None)
+        restaurant = context.get_restaurant(pk=restaurant_id) if restaurant_id is not None else None
+    if restaurant is None:
+        raise Http404('No restaurant for this request')
+    return restaurant
+
+
+class RestaurantContextMiddleware:
+    """
+    Sets request.restaurant for every view. It is resolved on first use,
+    after DRF has authenticated the request, and raises Http404 when the
+    request has no restaurant.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        slug = view_kwargs.get('restaurant_slug')
+        request.restaurant = SimpleLazyObject(lambda: resolve_restaurant(request, slug))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:00
+
+import django.core.validators
+import restaurants.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='day_cutoff_hour',
+            field=models.PositiveSmallIntegerField(default=0, help_text="Local hour the business day starts at. Orders before it count towards the previous day, so late-night service isn't split at midnight.", validators=[django.core.validators.MaxValueValidator(23)]),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='time_zone',
+            field=models.CharField(default='Asia/Kolkata', help_text="IANA time zone of the outlet, e.g. 'Asia/Kolkata'", max_length=64, validators=[restaurants.models.validate_time_zone]),
+        ),
+    ]
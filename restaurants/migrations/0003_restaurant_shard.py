@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0002_business_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='shard',
+            field=models.CharField(default='default', editable=False, max_length=50),
+        ),
+    ]
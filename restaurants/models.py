@@ -1,6 +1,18 @@
 # restaurants/models.py
 
+from datetime import timedelta
+from zoneinfo import ZoneInfo, available_timezones
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
 from django.db import models
+from django.utils import timezone
+
+
+def validate_time_zone(value):
+    if value not in available_timezones():
+        raise ValidationError(f"'{value}' is not a known time zone.")
 
 class Restaurant(models.Model):
     name = models.CharField(max_length=200, unique=True)
@@ -19,8 +31,35 @@ class Restaurant(models.Model):
         help_text="Geofence radius in meters"
     )
 
+    # Define the business day that order reports and sales are grouped by
+    time_zone = models.CharField(
+        max_length=64,
+        default=settings.TIME_ZONE,
+        validators=[validate_time_zone],
+        help_text="IANA time zone of the outlet, e.g. 'Asia/Kolkata'"
+    )
+    day_cutoff_hour = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(23)],
+        help_text="Local hour the business day starts at. Orders before it count towards "
+                  "the previous day, so late-night service isn't split at midnight."
+    )
+
+    # The shard map: the database alias holding this restaurant's menu, orders,
+    # kitchen log and sales (see menu/sharding.py). Change it only with the
+    # move_restaurant command, which moves the rows along.
+    shard = models.CharField(max_length=50, default='default', editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
+
+    def business_date(self, moment=None):
+        """
+        The business day that `moment` (an aware datetime, by default now)
+        falls in at this restaurant.
+        """
+        local = timezone.localtime(moment, ZoneInfo(self.time_zone))
+        return (local - timedelta(hours=self.day_cutoff_hour)).date()
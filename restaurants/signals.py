@@ -0,0 +1,12 @@
+# restaurants/signals.py
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Restaurant
+from . import context
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def forget_restaurant(sender, instance, **kwargs):
+    context.forget(instance.pk)
@@ -1,3 +1,143 @@
-from django.test import TestCase
+import random
+import unittest
+from datetime import date, datetime, timezone
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from geopy.distance import geodesic
+
+from . import context
+from .geofence import Geofence, geofence_for
+from .models import Restaurant
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class GeofenceTests(TestCase):
+    def setUp(self):
+        self.center = (12.9716, 77.5946)
+        self.fence = Geofence(*self.center, 200)
+
+    def random_points(self, count, spread=0.005):
+        rng = random.Random(7)
+        return [
+            (self.center[0] + rng.uniform(-spread, spread), self.center[1] + rng.uniform(-spread, spread))
+            for _ in range(count)
+        ]
+
+    def test_matches_geodesic(self):
+        for lat, lon in self.random_points(5000):
+            expected = geodesic(self.center, (lat, lon)).meters <= 200
+            self.assertEqual(self.fence.contains(lat, lon), expected, (lat, lon))
+
+    def test_far_points_are_rejected(self):
+        self.assertFalse(self.fence.contains(13.0827, 80.2707))  # Chennai
+        self.assertFalse(self.fence.contains(-12.9716, 77.5946))
+        self.assertFalse(self.fence.contains(float('nan'), 77.5946))
+
+    def test_antimeridian(self):
+        fence = Geofence(0.0, 179.9995, 200)
+        self.assertTrue(fence.contains(0.0, -179.9995))
+        self.assertFalse(fence.contains(0.0, -179.99))
+
+    def test_geofence_for_follows_restaurant_changes(self):
+        restaurant = Restaurant(name="Fence", slug="fence", latitude=12.9716, longitude=77.5946, radius_meters=100)
+        self.assertFalse(geofence_for(restaurant).contains(12.9731, 77.5946))
+        restaurant.radius_meters = 500
+        self.assertTrue(geofence_for(restaurant).contains(12.9731, 77.5946))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_contains_many_matches_contains(self):
+        points = self.random_points(5000)
+        result = self.fence.contains_many([p[0] for p in points], [p[1] for p in points])
+        self.assertEqual(list(result), [self.fence.contains(lat, lon) for lat, lon in points])
+
+
+class BusinessDateTests(TestCase):
+    def setUp(self):
+        self.restaurant = Restaurant(
+            name="Night Owl", slug="night-owl", latitude=0, longitude=0,
+            time_zone="Asia/Kolkata", day_cutoff_hour=4
+        )
+
+    def test_late_night_counts_towards_the_previous_day(self):
+        # 01:30 and 03:59 in Kolkata are still the night of the 14th
+        self.assertEqual(self.restaurant.business_date(datetime(2025, 3, 14, 20, 0, tzinfo=timezone.utc)), date(2025, 3, 14))
+        self.assertEqual(self.restaurant.business_date(datetime(2025, 3, 14, 22, 29, tzinfo=timezone.utc)), date(2025, 3, 14))
+        # 04:00 starts the 15th
+        self.assertEqual(self.restaurant.business_date(datetime(2025, 3, 14, 22, 30, tzinfo=timezone.utc)), date(2025, 3, 15))
+
+    def test_uses_the_restaurant_time_zone(self):
+        self.restaurant.time_zone = "Europe/London"
+        self.restaurant.day_cutoff_hour = 0
+        self.assertEqual(self.restaurant.business_date(datetime(2025, 3, 14, 20, 0, tzinfo=timezone.utc)), date(2025, 3, 14))
+
+    def test_rejects_unknown_time_zones(self):
+        self.restaurant.time_zone = "Mars/Olympus_Mons"
+        with self.assertRaises(ValidationError):
+            self.restaurant.full_clean()
+
+
+class RestaurantContextTests(TestCase):
+    def setUp(self):
+        context.clear()
+        self.restaurant = Restaurant.objects.create(
+            name="Context Cafe", slug="context-cafe", latitude=12.9716, longitude=77.5946
+        )
+
+    def test_public_menu_resolves_the_slug_from_the_cache(self):
+        url = reverse('public-menu-list', kwargs={'restaurant_slug': 'context-cafe'})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+        missing = reverse('public-menu-list', kwargs={'restaurant_slug': 'nowhere'})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_saving_a_restaurant_replaces_the_cached_record(self):
+        context.get_restaurant(slug='context-cafe')
+        self.restaurant.slug = 'renamed-cafe'
+        self.restaurant.radius_meters = 750
+        self.restaurant.save()
+
+        self.assertIsNone(context.get_restaurant(slug='context-cafe'))
+        self.assertEqual(context.get_restaurant(slug='renamed-cafe').radius_meters, 750)
+        self.assertEqual(context.get_restaurant(pk=self.restaurant.pk).slug, 'renamed-cafe')
+
+        self.restaurant.delete()
+        self.assertIsNone(context.get_restaurant(slug='renamed-cafe'))
+
+    def test_callers_get_their_own_copy(self):
+        first = context.get_restaurant(pk=self.restaurant.pk)
+        first.radius_meters = 5
+        self.assertEqual(context.get_restaurant(pk=self.restaurant.pk).radius_meters, self.restaurant.radius_meters)
+
+    @override_settings(RESTAURANT_CONTEXT_CACHE_SIZE=2)
+    def test_least_recently_used_records_are_evicted(self):
+        others = [
+            Restaurant.objects.create(name=f"Other {n}", slug=f"other-{n}", latitude=0, longitude=0)
+            for n in range(2)
+        ]
+        context.get_restaurant(pk=self.restaurant.pk)
+        context.get_restaurant(pk=others[0].pk)
+        context.get_restaurant(pk=self.restaurant.pk)
+        context.get_restaurant(pk=others[1].pk)
+
+        with self.assertNumQueries(0):
+            context.get_restaurant(pk=self.restaurant.pk)
+        with self.assertNumQueries(1):
+            context.get_restaurant(slug='other-0')
+
+    @override_settings(RESTAURANT_CONTEXT_TTL=0)
+    def test_expired_records_are_read_again(self):
+        context.get_restaurant(pk=self.restaurant.pk)
+        # Another process changed it; no signal reaches this one
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(radius_meters=900)
+        self.assertEqual(context.get_restaurant(pk=self.restaurant.pk).radius_meters, 900)
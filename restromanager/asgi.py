@@ -11,6 +11,13 @@ django_asgi_app = get_asgi_application()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import menu.routing
+from django.conf import settings
+
+if settings.CHANNEL_LAYER_BACKEND == 'local':
+    # The in-process channel layer can only be reached from this process,
+    # so this process has to push the outbox to it as well
+    from menu.outbox import start_dispatcher_thread
+    outbox_dispatcher, stop_outbox_dispatcher = start_dispatcher_thread()
 
 application = ProtocolTypeRouter({
     # Django's ASGI application to handle traditional HTTP requests
@@ -0,0 +1,196 @@
+# restromanager/channel_layers.py
+
+import asyncio
+import random
+import string
+import threading
+import time
+from collections import deque
+from copy import deepcopy
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    """
+    A channel layer that keeps everything in the memory of the current
+    process. It is meant for single-node outlets and for tests: unlike
+    channels_redis it needs no Redis server, but it only reaches consumers
+    running in the same process (see CHANNEL_LAYER_BACKEND in settings).
+
+    Compared to channels' own InMemoryChannelLayer it:
+      - copies a group message once per group_send instead of once per
+        member, so all members share the copy (consumers must not modify
+        the messages they receive, which none of ours do)
+      - checks expiry per channel and sweeps the other channels at most
+        once a second, instead of scanning every channel on each call
+      - honours channel_capacity
+      - can be sent to from other threads (e.g. the outbox dispatcher
+        thread started by restromanager/asgi.py)
+    """
+
+    extensions = ["groups", "flush"]
+
+    # Seconds between full sweeps for expired messages and group memberships
+    SWEEP_INTERVAL = 1.0
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.group_expiry = group_expiry
+        self._lock = threading.Lock()
+        # channel -> deque of (expires_at, message)
+        self._queues = {}
+        # channel -> deque of (event loop, future) for receive() calls waiting on it
+        self._waiters = {}
+        # group -> {channel: joined_at}
+        self._groups = {}
+        self._next_sweep = 0.0
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        message = deepcopy(message)
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            if not self._put(channel, message, now):
+                raise ChannelFull(channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+        message = deepcopy(message)
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            for channel in list(self._groups.get(group, ())):
+                # A full channel just misses the message, as with the other layers
+                self._put(channel, message, now)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                queue = self._queues.get(channel)
+                if queue:
+                    self._drop_expired(channel, queue, time.time())
+                if queue:
+                    _, message = queue.popleft()
+                    if not queue:
+                        del self._queues[channel]
+                    return message
+                future = loop.create_future()
+                self._waiters.setdefault(channel, deque()).append((loop, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    waiters = self._waiters.get(channel)
+                    if waiters and (loop, future) in waiters:
+                        waiters.remove((loop, future))
+                    elif future.done():
+                        # We were woken for a message we will not take; pass it on
+                        self._wake_one(channel)
+                raise
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.local!%s" % (
+            prefix,
+            "".join(random.choice(string.ascii_letters) for _ in range(12)),
+        )
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        with self._lock:
+            self._groups.setdefault(group, {})[channel] = time.time()
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+        with self._lock:
+            members = self._groups.get(group)
+            if members is not None:
+                members.pop(channel, None)
+                if not members:
+                    del self._groups[group]
+
+    # Flush extension
+
+    async def flush(self):
+        with self._lock:
+            self._queues = {}
+            self._groups = {}
+
+    async def close(self):
+        pass
+
+    # Internals; all of these expect self._lock to be held
+
+    def _put(self, channel, message, now):
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = deque()
+        else:
+            self._drop_expired(channel, queue, now)
+        if len(queue) >= self.get_capacity(channel):
+            return False
+        queue.append((now + self.expiry, message))
+        self._wake_one(channel)
+        return True
+
+    def _wake_one(self, channel):
+        waiters = self._waiters.get(channel)
+        while waiters:
+            loop, future = waiters.popleft()
+            if not waiters:
+                del self._waiters[channel]
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # That receive() belonged to an event loop that has since closed
+                continue
+            return
+
+    def _drop_expired(self, channel, queue, now):
+        expired = False
+        while queue and queue[0][0] < now:
+            queue.popleft()
+            expired = True
+        if expired:
+            # Nobody is reading this channel any more
+            self._remove_from_groups(channel)
+
+    def _remove_from_groups(self, channel):
+        for group, members in list(self._groups.items()):
+            if members.pop(channel, None) is not None and not members:
+                del self._groups[group]
+
+    def _sweep(self, now):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.SWEEP_INTERVAL
+        for channel, queue in list(self._queues.items()):
+            self._drop_expired(channel, queue, now)
+            if not queue:
+                del self._queues[channel]
+        cutoff = now - self.group_expiry
+        for group, members in list(self._groups.items()):
+            for channel, joined_at in list(members.items()):
+                if joined_at < cutoff:
+                    del members[channel]
+            if not members:
+                del self._groups[group]
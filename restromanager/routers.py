@@ -0,0 +1,129 @@
+# restromanager/routers.py
+
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from menu import sharding
+
+REPLICA_DATABASE = 'replica'
+PINNED_KEY = 'db:pinned-to-primary:{client}'
+
+_read_from_replica = contextvars.ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Sends the reads made inside the block to the replica, when one is
+    configured. Writes always go to the primary.
+    """
+    token = _read_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class ShardRouter:
+    """
+    Routes the menu app's tables to the shard of the restaurant their rows
+    belong to (see menu/sharding.py). Without ORDER_SHARDS it changes
+    nothing. Rows on 'default' are left to the next router, so their reads
+    can still go to the replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.ORDER_SHARDS or not sharding.is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        alias = (sharding.database_of(instance) if instance is not None else None) or sharding.current_database()
+        return alias if alias != DEFAULT_DB_ALIAS else None
+
+    db_for_write = db_for_read
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the 'replica' database inside replica_reads() and
+    everything else to the primary. Without a replica alias in DATABASES it
+    changes nothing.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and REPLICA_DATABASE in connections:
+            return REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, schema included
+        if db == REPLICA_DATABASE:
+            return False
+        return None
+
+
+def client_key(request):
+    # Shared role logins, staff users and anonymous clients (by address)
+    user = getattr(request, 'user', None)
+    if getattr(user, 'credential_id', None) is not None:
+        return f'credential:{user.credential_id}'
+    if getattr(user, 'is_authenticated', False) and user.pk is not None:
+        return f'user:{user.pk}'
+    return f"address:{request.META.get('REMOTE_ADDR')}"
+
+
+def pin_to_primary(request):
+    # The replica may not have this client's write yet
+    cache.set(PINNED_KEY.format(client=client_key(request)), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(request):
+    return cache.get(PINNED_KEY.format(client=client_key(request)), False)
+
+
+class ReplicaReadMixin:
+    """
+    For read-only API views that can be answered from the replica. Clients
+    that wrote recently (see ReplicaStickinessMiddleware) keep reading from
+    the primary, so they see their own changes. Authentication and
+    permission checks always read the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD', 'OPTIONS') and not is_pinned_to_primary(request):
+            self._replica_reads = replica_reads()
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica = getattr(self, '_replica_reads', None)
+        if replica is not None:
+            self._replica_reads = None
+            replica.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    After a successful write request, reads of the same client go to the
+    primary for REPLICA_STICKY_SECONDS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            pin_to_primary(request)
+        return response
@@ -0,0 +1,67 @@
+# restromanager/serialized_sqlite/base.py
+
+import threading
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+# One lock per database file, shared by every connection in this process
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def write_lock(name):
+    with _write_locks_guard:
+        return _write_locks.setdefault(str(name), threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The SQLite backend of SQLITE_MODE = 'production' (see settings.py).
+
+    SQLite has a single writer. With BEGIN IMMEDIATE (transaction_mode in
+    OPTIONS) a transaction takes the write lock when it starts, so it can't
+    deadlock upgrading a read lock halfway. Its busy handler then makes the
+    others retry with growing sleeps. Within this process, transactions also
+    queue on a plain lock first, so the next one starts as soon as the
+    previous one commits. Only transactions from other processes wait in
+    SQLite's busy handler.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.held_write_lock = None
+
+    def _start_transaction_under_autocommit(self):
+        lock = write_lock(self.settings_dict['NAME'])
+        if not lock.acquire(timeout=self.settings_dict['OPTIONS'].get('timeout', 5)):
+            raise OperationalError('Timed out waiting for the other writers to finish')
+        self.held_write_lock = lock
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self._release_write_lock()
+            raise
+
+    def _release_write_lock(self):
+        lock, self.held_write_lock = self.held_write_lock, None
+        if lock is not None:
+            lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_lock()
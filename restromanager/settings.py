@@ -1,6 +1,8 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -27,6 +29,10 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5174", # Vite development server (alternate port)
     "http://127.0.0.1:5174", # Vite development server alternative URL (alternate port)
 ]
+# Response headers the frontend needs to be able to read
+CORS_EXPOSE_HEADERS = [
+    "X-Kitchen-Seq",
+]
 
 
 # Application definition
@@ -60,6 +66,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'restaurants.middleware.RestaurantContextMiddleware',
+    'restromanager.routers.ReplicaStickinessMiddleware',
+    'menu.sharding.ShardMiddleware',
 
 ]
 
@@ -84,16 +93,50 @@ ASGI_APPLICATION = 'restromanager.asgi.application'
 
 WSGI_APPLICATION = 'restromanager.wsgi.application'
 
-# Configure the Redis channel layer for real-time messaging
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            "hosts": [('127.0.0.1', 6380)],
+# Channel layer for real-time messaging:
+#   'redis' - Redis on port 6380; needed when more than one process serves WebSockets
+#   'local' - kept in the memory of the server process (restromanager/channel_layers.py);
+#             no Redis needed, for single-node outlets and tests. The server then
+#             also dispatches the outbox itself (see asgi.py), so don't run dispatch_outbox.
+CHANNEL_LAYER_BACKEND = os.environ.get('CHANNEL_LAYER_BACKEND', 'redis')
+
+if CHANNEL_LAYER_BACKEND == 'local':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'restromanager.channel_layers.LocalChannelLayer',
+            'CONFIG': {
+                "capacity": 100,  # messages waiting per socket before new ones are dropped
+                "expiry": 60,  # seconds an undelivered message is kept
+            },
         },
-    },
+    }
+else:
+    # Configure the Redis channel layer for real-time messaging
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                "hosts": [('127.0.0.1', 6380)],
+            },
+        },
+    }
+
+
+# Cache used for the public menu (see menu/cache.py).
+# When running more than one server process, point this at a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache) so that a menu change
+# made through one process invalidates the menu served by all the others.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'restromanager',
+    }
 }
 
+# How long (in seconds) a serialized public menu stays in the cache.
+# Menu edits invalidate it immediately; this only bounds memory use.
+PUBLIC_MENU_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -105,6 +148,88 @@ DATABASES = {
     }
 }
 
+# SQLite mode:
+#   'default'    - Django's stock SQLite settings, fine for development
+#   'production' - for single-box outlets serving real traffic. WAL lets reads
+#                  run during a write, and every transaction queues for the
+#                  single writer instead of failing with "database is locked"
+#                  (see restromanager/serialized_sqlite). Run benchmark_order_writes
+#                  to compare the two on this machine.
+SQLITE_MODE = os.environ.get('SQLITE_MODE', 'default')
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    # Busy timeout: seconds a write waits for the others before giving up
+    'timeout': 20,
+    'init_command': ';'.join([
+        'PRAGMA journal_mode=WAL',
+        # A power cut can lose the last commits, but never corrupts the file
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA mmap_size=268435456',  # 256 MiB
+        'PRAGMA cache_size=-20000',  # 20 MB
+        'PRAGMA temp_store=MEMORY',
+    ]),
+}
+
+if SQLITE_MODE == 'production':
+    DATABASES['default']['ENGINE'] = 'restromanager.serialized_sqlite'
+    DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+
+# Read replica for the heavy read-only views: analytics and the order report
+# (see restromanager/routers.py). The public menu stays on the primary, as
+# it is cached under the menu version and must not be built from stale rows. Point
+# DATABASE_REPLICA_NAME at a copy of the database that is kept up to date,
+# e.g. by Litestream, or for local testing by
+# `sqlite3 db.sqlite3 ".backup replica.sqlite3"`. Without it, everything
+# reads from the primary.
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DATABASE_REPLICA_NAME,
+        # Test runs read the primary's test database instead of an empty one
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shards for the restaurants' order data (see menu/sharding.py), e.g.
+# DATABASE_SHARDS="shard1=/srv/rm/shard1.sqlite3,shard2=/srv/rm/shard2.sqlite3".
+# Each restaurant's menu, bills, kitchen log and sales live on the database
+# named by Restaurant.shard: 'default' or one of these. Everything else
+# (restaurants, users) stays on 'default'. Prepare a new shard with
+# `migrate --database <alias>` and move restaurants with move_restaurant.
+def _database_shards(value):
+    # "alias=path,alias=path" -> {alias: path}
+    shards = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(','))):
+        alias, _, name = (part.strip() for part in entry.partition('='))
+        if not alias or not name:
+            raise ImproperlyConfigured(
+                f"DATABASE_SHARDS entry '{entry}' must look like alias=/path/to/shard.sqlite3"
+            )
+        if alias in DATABASES:
+            raise ImproperlyConfigured(f"DATABASE_SHARDS can't use '{alias}', which names another database")
+        if alias in shards:
+            raise ImproperlyConfigured(f"DATABASE_SHARDS names the database '{alias}' more than once")
+        shards[alias] = name
+    return shards
+
+
+DATABASE_SHARDS = _database_shards(os.environ.get('DATABASE_SHARDS', ''))
+DATABASES.update({alias: {**DATABASES['default'], 'NAME': name} for alias, name in DATABASE_SHARDS.items()})
+ORDER_SHARDS = list(DATABASE_SHARDS)
+
+# Size of the id blocks handed to databases. A shard being prepared starts
+# numbering its rows at the next block above the highest id any database has
+# used (see sharding.reserve_id_range), so rows keep their ids when their
+# restaurant moves to another shard
+SHARD_ID_BLOCK = 10 ** 12
+
+DATABASE_ROUTERS = ['restromanager.routers.ShardRouter', 'restromanager.routers.ReplicaRouter']
+
+# Seconds a client's reads stay on the primary after it wrote something,
+# so it sees its own changes while the replica catches up
+REPLICA_STICKY_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -152,7 +277,8 @@ AUTH_USER_MODEL = 'users.StaffUser'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication that also handles the shared chef/captain/cashier logins
+        'users.authentication.RoleCredentialJWTAuthentication',
     ],
 }
 
@@ -173,3 +299,33 @@ JAZZMIN_SETTINGS = {
     # Hide the detailed apps that only owners should worry about
     # "hide_apps": ["menu"],
 }
+
+# WebSocket broadcasting (see menu/broadcast.py).
+# Messages for the same group that are queued within this many seconds of
+# each other are delivered as one frame. The outbox dispatcher also uses it
+# as its polling interval.
+BROADCAST_COALESCE_WINDOW = 0.025
+# Upper limit on the number of messages in one frame
+BROADCAST_MAX_BATCH = 100
+
+# Number of recent kitchen notifications kept per restaurant for chef panels
+# that reconnect (see menu/kitchen_events.py). A panel that missed more than
+# this gets a full snapshot of the active orders instead.
+KITCHEN_EVENT_LOG_SIZE = 1000
+
+# Columnar archive of paid bills (see menu/archive.py). archive_paid_bills
+# moves paid bills older than the retention window, in business days, out
+# of the live tables into this directory.
+ORDER_ARCHIVE_DIR = os.environ.get('ORDER_ARCHIVE_DIR', os.path.join(BASE_DIR, 'order_archive'))
+ORDER_ARCHIVE_RETENTION_DAYS = 90
+
+# Seconds a shared login's credential stamp is cached between checks (see
+# users/authentication.py). Edits on this process revoke its tokens at once;
+# other processes notice within this time.
+ROLE_CREDENTIAL_STAMP_TTL = 60
+
+# Process-local cache of restaurant records behind request.restaurant (see
+# restaurants/context.py): how many are kept, and for how many seconds other
+# processes may keep serving a restaurant after it was edited.
+RESTAURANT_CONTEXT_CACHE_SIZE = 1000
+RESTAURANT_CONTEXT_TTL = 60
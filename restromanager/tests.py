@@ -0,0 +1,190 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from django.conf import settings
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+
+from .channel_layers import LocalChannelLayer
+
+
+class LocalChannelLayerTests(SimpleTestCase):
+    async def test_send_and_receive(self):
+        layer = LocalChannelLayer()
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'test', 'n': 1})
+        await layer.send(channel, {'type': 'test', 'n': 2})
+        self.assertEqual((await layer.receive(channel))['n'], 1)
+        self.assertEqual((await layer.receive(channel))['n'], 2)
+
+    async def test_receive_waits_for_a_message(self):
+        layer = LocalChannelLayer()
+        waiting = asyncio.create_task(layer.receive('waiting'))
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        await layer.send('waiting', {'type': 'test'})
+        self.assertEqual(await asyncio.wait_for(waiting, 1), {'type': 'test'})
+
+    async def test_group_send_reaches_current_members_only(self):
+        layer = LocalChannelLayer()
+        await layer.group_add('kitchen', 'chef-1')
+        await layer.group_add('kitchen', 'chef-2')
+        await layer.group_add('kitchen', 'gone')
+        await layer.group_discard('kitchen', 'gone')
+        message = {'type': 'send.new.order', 'data': {'bill_id': 1}}
+        await layer.group_send('kitchen', message)
+        message['data']['bill_id'] = 2
+
+        self.assertEqual(await layer.receive('chef-1'), {'type': 'send.new.order', 'data': {'bill_id': 1}})
+        self.assertEqual(await layer.receive('chef-2'), {'type': 'send.new.order', 'data': {'bill_id': 1}})
+        self.assertNotIn('gone', layer._queues)
+
+    async def test_capacity(self):
+        layer = LocalChannelLayer(capacity=2, channel_capacity={'cashier-*': 1})
+        await layer.send('chef', {'type': 'test'})
+        await layer.send('chef', {'type': 'test'})
+        with self.assertRaises(ChannelFull):
+            await layer.send('chef', {'type': 'test'})
+        await layer.send('cashier-1', {'type': 'test'})
+        with self.assertRaises(ChannelFull):
+            await layer.send('cashier-1', {'type': 'test'})
+
+        # A full member of a group just misses the message
+        await layer.group_add('all', 'chef')
+        await layer.group_add('all', 'other')
+        await layer.group_send('all', {'type': 'test', 'n': 3})
+        self.assertEqual(await layer.receive('other'), {'type': 'test', 'n': 3})
+
+    async def test_expired_messages_are_dropped_with_their_channel_membership(self):
+        layer = LocalChannelLayer(expiry=10)
+        await layer.group_add('kitchen', 'stale')
+        with mock.patch('restromanager.channel_layers.time.time', return_value=1000.0):
+            await layer.group_send('kitchen', {'type': 'old'})
+        with mock.patch('restromanager.channel_layers.time.time', return_value=1020.0):
+            await layer.send('stale', {'type': 'new'})
+            self.assertEqual(await layer.receive('stale'), {'type': 'new'})
+        self.assertEqual(layer._groups, {})
+
+    def test_send_from_another_thread_wakes_the_receiver(self):
+        layer = LocalChannelLayer()
+
+        def send_later():
+            async_to_sync(layer.send)('cross-thread', {'type': 'test', 'from': 'thread'})
+
+        async def receive():
+            threading.Timer(0.05, send_later).start()
+            return await asyncio.wait_for(layer.receive('cross-thread'), 2)
+
+        self.assertEqual(async_to_sync(receive)(), {'type': 'test', 'from': 'thread'})
+
+    async def test_cancelled_receive_does_not_swallow_a_message(self):
+        layer = LocalChannelLayer()
+        cancelled = asyncio.create_task(layer.receive('shared'))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        await layer.send('shared', {'type': 'test'})
+        self.assertEqual(await asyncio.wait_for(layer.receive('shared'), 1), {'type': 'test'})
+
+    async def test_flush(self):
+        layer = LocalChannelLayer()
+        await layer.group_add('kitchen', 'chef')
+        await layer.send('chef', {'type': 'test'})
+        await layer.flush()
+        self.assertEqual((layer._queues, layer._groups), ({}, {}))
+
+
+class SerializedSQLiteTests(SimpleTestCase):
+    # The tests open their own connections, to files of their own, but
+    # they are named 'default' like the test database's
+    databases = {'default'}
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        self.name = os.path.join(workdir, 'db.sqlite3')
+
+    def connections(self, engine, options):
+        handler = ConnectionHandler({'default': {'ENGINE': engine, 'NAME': self.name, 'OPTIONS': dict(options)}})
+        with handler['default'].cursor() as cursor:
+            cursor.execute('CREATE TABLE IF NOT EXISTS counter (n integer)')
+            cursor.execute('INSERT INTO counter VALUES (0)')
+        handler['default'].close()
+        return handler
+
+    def bump(self, connection, before_write=None):
+        # A read-then-write transaction, like most of the app's atomic blocks
+        connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT n FROM counter')
+                n = cursor.fetchone()[0]
+                if before_write:
+                    before_write()
+                cursor.execute('UPDATE counter SET n = %s', [n + 1])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.set_autocommit(True)
+
+    def run_threads(self, handler, work, count):
+        errors = []
+
+        def target():
+            try:
+                work(handler['default'])
+            except OperationalError as exc:
+                errors.append(exc)
+            finally:
+                handler['default'].close()
+
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with handler['default'].cursor() as cursor:
+            cursor.execute('SELECT n FROM counter')
+            n = cursor.fetchone()[0]
+        handler['default'].close()
+        return n, errors
+
+    def test_production_pragmas(self):
+        handler = self.connections('restromanager.serialized_sqlite', settings.SQLITE_PRODUCTION_OPTIONS)
+        with handler['default'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+        handler['default'].close()
+
+    def test_concurrent_writers_queue_instead_of_failing(self):
+        handler = self.connections('restromanager.serialized_sqlite', settings.SQLITE_PRODUCTION_OPTIONS)
+
+        def work(connection):
+            for _ in range(25):
+                self.bump(connection)
+
+        n, errors = self.run_threads(handler, work, 8)
+        self.assertEqual(errors, [])
+        self.assertEqual(n, 200)
+
+    def test_default_settings_fail_the_same_transactions(self):
+        # Both transactions have read before either writes: one of them can't upgrade its lock
+        handler = self.connections('django.db.backends.sqlite3', {'timeout': 1})
+        both_read = threading.Barrier(2)
+        n, errors = self.run_threads(handler, lambda connection: self.bump(connection, both_read.wait), 2)
+        self.assertEqual(len(errors), 1)
+        self.assertIn('locked', str(errors[0]))
+        self.assertEqual(n, 1)
@@ -0,0 +1,99 @@
+# users/authentication.py
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from restaurants.context import get_restaurant
+from .models import RoleCredential
+
+CREDENTIAL_STAMP_KEY = 'users:credential-stamp:{credential_id}'
+
+
+def credential_stamp(credential):
+    """
+    A short fingerprint of a shared login. It is put in the login's tokens and
+    changes when the password, username, role or restaurant changes, which
+    revokes every token issued before.
+    """
+    raw = f'{credential.password}|{credential.username}|{credential.role}|{credential.restaurant_id}'
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def current_stamp(credential_id):
+    # Cached for ROLE_CREDENTIAL_STAMP_TTL seconds; saving or deleting the
+    # credential clears it (see users/signals.py). '' means it is gone.
+    key = CREDENTIAL_STAMP_KEY.format(credential_id=credential_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        credential = RoleCredential.objects.filter(pk=credential_id).first()
+        stamp = credential_stamp(credential) if credential else ''
+        cache.set(key, stamp, settings.ROLE_CREDENTIAL_STAMP_TTL)
+    return stamp
+
+
+def forget_stamp(credential_id):
+    cache.delete(CREDENTIAL_STAMP_KEY.format(credential_id=credential_id))
+
+
+class RolePrincipal:
+    """
+    request.user for a shared chef, captain or cashier login (RoleCredential).
+    Everything the views need comes from the verified token, so building
+    it costs no query. It is not a StaffUser; views meant for restaurant
+    admins keep it out with the IsStaffUser permission.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+    pk = id = None
+
+    def __init__(self, credential_id, username, role, restaurant_id):
+        self.credential_id = credential_id
+        self.username = username
+        self.role = role
+        self.restaurant_id = restaurant_id
+
+    @cached_property
+    def restaurant(self):
+        return get_restaurant(pk=self.restaurant_id)
+
+    def __str__(self):
+        return self.username
+
+
+class RoleCredentialJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that also understands the tokens of shared role logins.
+    Those carry a credential_id claim instead of a user_id; they become a
+    RolePrincipal instead of being looked up as a StaffUser.
+    """
+
+    def get_user(self, validated_token):
+        if 'credential_id' not in validated_token:
+            if 'username' in validated_token:
+                # A shared-login token from before credential_id: its user_id is
+                # a RoleCredential id and would match an unrelated StaffUser
+                raise InvalidToken('This token is no longer accepted; log in again')
+            return super().get_user(validated_token)
+
+        try:
+            principal = RolePrincipal(
+                credential_id=validated_token['credential_id'],
+                username=validated_token['username'],
+                role=validated_token['role'],
+                restaurant_id=validated_token['restaurant_id'],
+            )
+            stamp = validated_token['credential_stamp']
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable credential')
+
+        if stamp != current_stamp(principal.credential_id):
+            raise AuthenticationFailed('These credentials have changed; log in again', code='credential_changed')
+        return principal
@@ -2,19 +2,28 @@
 
 from rest_framework.permissions import BasePermission
 
+from .models import StaffUser
+
+
+def _role(request):
+    # StaffUser and the RolePrincipal of a shared login (users/authentication.py) both carry the role
+    return getattr(request.user, 'role', None)
+
+class IsStaffUser(BasePermission):
+    """
+    Allows access only to StaffUser accounts (Restaurant Admins), not to
+    the shared chef, captain and cashier logins.
+    """
+    def has_permission(self, request, view):
+        return isinstance(request.user, StaffUser)
+
 class IsChefOrAdmin(BasePermission):
     """
     Allows access only to users with the 'CHEF' role,
     or to authenticated Restaurant Admins.
     """
     def has_permission(self, request, view):
-        user_role = getattr(request.user, 'role', None)
-        token_role = request.auth.get('role') if request.auth else None
-        
-        is_admin = user_role == 'ADMIN'
-        is_chef = user_role == 'CHEF' or token_role == 'CHEF'
-        
-        return is_admin or is_chef
+        return _role(request) in ('ADMIN', 'CHEF')
 
 class IsCaptainOrAdmin(BasePermission):
     """
@@ -22,13 +31,7 @@ class IsCaptainOrAdmin(BasePermission):
     or to authenticated Restaurant Admins.
     """
     def has_permission(self, request, view):
-        user_role = getattr(request.user, 'role', None)
-        token_role = request.auth.get('role') if request.auth else None
-
-        is_admin = user_role == 'ADMIN'
-        is_captain = user_role == 'CAPTAIN' or token_role == 'CAPTAIN'
-
-        return is_admin or is_captain
+        return _role(request) in ('ADMIN', 'CAPTAIN')
 
 class IsCashierOrAdmin(BasePermission):
     """
@@ -36,10 +39,4 @@ class IsCashierOrAdmin(BasePermission):
     or to authenticated Restaurant Admins.
     """
     def has_permission(self, request, view):
-        user_role = getattr(request.user, 'role', None)
-        token_role = request.auth.get('role') if request.auth else None
-
-        is_admin = user_role == 'ADMIN'
-        is_cashier = user_role == 'CASHIER' or token_role == 'CASHIER'
-        
-        return is_admin or is_cashier
+        return _role(request) in ('ADMIN', 'CASHIER')
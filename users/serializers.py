@@ -5,6 +5,7 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import check_password
 from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import credential_stamp
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -50,11 +51,14 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             credential = RoleCredential.objects.get(username=username)
             if check_password(password, credential.password):
                 # Manually create a token with custom data
+                # Shared logins are not StaffUsers: the request user is built
+                # from these claims (see users/authentication.py)
                 refresh = RefreshToken()
-                refresh['user_id'] = credential.id  # Add user_id for authentication
+                refresh['credential_id'] = credential.id
+                refresh['credential_stamp'] = credential_stamp(credential)
                 refresh['username'] = credential.username
                 refresh['role'] = credential.role
-                refresh['restaurant_id'] = credential.restaurant.id
+                refresh['restaurant_id'] = credential.restaurant_id
                 
                 return {
                     'token': str(refresh.access_token),
@@ -0,0 +1,15 @@
+# users/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_stamp
+from .models import RoleCredential
+
+
+# --- Shared login revocation ---
+
+@receiver([post_save, post_delete], sender=RoleCredential)
+def revoke_credential_tokens(sender, instance, **kwargs):
+    # The next request with one of its tokens re-reads the stamp
+    forget_stamp(instance.pk)
@@ -1,3 +1,95 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from menu.models import Bill
+from restaurants.models import Restaurant
+from .authentication import RolePrincipal
+from .models import RoleCredential, StaffUser
+
+
+class RoleCredentialAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(
+            name="Shared Login Diner", slug="shared-login-diner", latitude=12.9716, longitude=77.5946
+        )
+        self.other = Restaurant.objects.create(name="Other Diner", slug="other-diner", latitude=0, longitude=0)
+        self.admin = StaffUser.objects.create_user(
+            username="shared-owner", password="pass", role="ADMIN", restaurant=self.restaurant
+        )
+        self.chef = RoleCredential.objects.create(
+            restaurant=self.restaurant, role="CHEF", username="kitchen", password="chef-pass"
+        )
+        self.cashier = RoleCredential.objects.create(
+            restaurant=self.restaurant, role="CASHIER", username="till", password="till-pass"
+        )
+
+    def login(self, username, password):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': username, 'password': password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['token']
+
+    def use(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_kitchen_polling_needs_no_auth_queries(self):
+        self.use(self.login('kitchen', 'chef-pass'))
+        url = reverse('kitchen-order-list')
+        # The first request reads the credential's stamp into the cache
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.wsgi_request.user, RolePrincipal)
+        tables = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('users_', tables)
+        self.assertNotIn('restaurants_restaurant', tables)
+
+    def test_cashier_sees_only_its_restaurant(self):
+        mine = Bill.objects.create(restaurant=self.restaurant, customer_name="Anu", table_number="1")
+        Bill.objects.create(restaurant=self.other, customer_name="Ben", table_number="2")
+        self.use(self.login('till', 'till-pass'))
+        response = self.client.get(reverse('cashier-bill-list'))
+        self.assertEqual([bill['id'] for bill in response.data], [mine.id])
+
+    def test_shared_login_is_not_mistaken_for_a_staff_user(self):
+        # A StaffUser whose id equals the credential's id must not be picked up
+        StaffUser.objects.filter(pk=self.admin.pk).update(id=self.chef.id)
+        self.use(self.login('kitchen', 'chef-pass'))
+        self.assertEqual(self.client.get(reverse('admin-order-report')).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(reverse('restaurant-analytics')).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(reverse('cashier-bill-list')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_changing_the_password_revokes_its_tokens(self):
+        self.use(self.login('kitchen', 'chef-pass'))
+        url = reverse('kitchen-order-list')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.chef.password = 'new-pass'
+        self.chef.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.use(self.login('kitchen', 'new-pass'))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.chef.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_old_style_shared_login_tokens_are_rejected(self):
+        token = RefreshToken()
+        token['user_id'] = self.admin.id
+        token['username'] = 'kitchen'
+        token['role'] = 'CHEF'
+        token['restaurant_id'] = self.restaurant.id
+        self.use(str(token.access_token))
+        self.assertEqual(self.client.get(reverse('kitchen-order-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_staff_users_still_authenticate_as_themselves(self):
+        self.use(self.login('shared-owner', 'pass'))
+        response = self.client.get(reverse('kitchen-order-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.wsgi_request.user, self.admin)
+        self.assertEqual(self.client.get(reverse('admin-order-report')).status_code, status.HTTP_200_OK)
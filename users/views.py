@@ -2,6 +2,7 @@
 from django.shortcuts import render
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from .permissions import IsStaffUser
 from .serializers import UserSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
@@ -12,7 +13,7 @@ from .serializers import RoleCredentialSerializer
 
 class UserInfoView(generics.RetrieveAPIView):
     serializer_class = UserSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
 
     def get_object(self):
         return self.request.user
@@ -22,15 +23,15 @@ class RoleCredentialViewSet(viewsets.ModelViewSet):
     Allows Restaurant Admins to manage shared credentials for their staff.
     """
     serializer_class = RoleCredentialSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStaffUser]
 
     def get_queryset(self):
         # Only show credentials for the admin's own restaurant
-        return RoleCredential.objects.filter(restaurant=self.request.user.restaurant)
+        return RoleCredential.objects.filter(restaurant=self.request.restaurant)
 
     def perform_create(self, serializer):
         # Automatically assign the credential to the admin's restaurant
-        serializer.save(restaurant=self.request.user.restaurant)
+        serializer.save(restaurant=self.request.restaurant)
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer